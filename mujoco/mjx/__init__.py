@@ -25,9 +25,12 @@ from ._src.forward import fwd_position as fwd_position
 from ._src.forward import fwd_velocity as fwd_velocity
 from ._src.forward import implicit as implicit
 from ._src.forward import step as step
+from ._src.io import buffer_sizes as buffer_sizes
 from ._src.io import make_data as make_data
 from ._src.io import put_data as put_data
 from ._src.io import put_model as put_model
+from ._src.io import resize_data as resize_data
+from ._src.island import island as island
 from ._src.passive import passive as passive
 from ._src.smooth import com_pos as com_pos
 from ._src.smooth import com_vel as com_vel
@@ -40,13 +43,18 @@ from ._src.smooth import transmission as transmission
 from ._src.solver import solve as solve
 from ._src.support import is_sparse as is_sparse
 from ._src.support import mul_m as mul_m
+from ._src.support import overflow as overflow
+from ._src.support import solver_histogram as solver_histogram
 from ._src.support import xfrc_accumulate as xfrc_accumulate
 from ._src.test_util import benchmark as benchmark
 from ._src.types import DisableBit as DisableBit
+from ._src.types import EnableBit as EnableBit
 from ._src.types import TrnType as TrnType
 from ._src.types import DynType as DynType
 from ._src.types import JointType as JointType
 from ._src.types import ConeType as ConeType
+from ._src.types import OverflowPolicy as OverflowPolicy
+from ._src.types import WarningType as WarningType
 from ._src.types import Option as Option
 from ._src.types import Statistic as Statistic
 from ._src.types import Model as Model
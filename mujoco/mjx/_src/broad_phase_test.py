@@ -20,7 +20,7 @@ from absl.testing import absltest, parameterized
 
 from mujoco import mjx
 
-from . import test_util
+from . import collision_driver, test_util
 
 BoxType = wp.types.matrix(shape=(2, 3), dtype=wp.float32)
 
@@ -160,6 +160,21 @@ class MultiIndexList:
 
 
 class BroadPhaseTest(parameterized.TestCase):
+  def test_broad_phase_overflow(self):
+    """Tests that pairs past max_num_overlaps_per_world are counted and clamped."""
+    result_count = wp.array([3, 7, 5], dtype=wp.int32)
+    warning = wp.zeros(len(mjx.WarningType), dtype=wp.int32)
+
+    wp.launch(
+      collision_driver.broad_phase_overflow_kernel,
+      dim=(3,),
+      inputs=[5, result_count, warning],
+    )
+
+    self.assertEqual(warning.numpy()[mjx.WarningType.BROADPHASEFULL], 2)
+    self.assertEqual(warning.numpy()[mjx.WarningType.CNSTRFULL], 0)
+    self.assertListEqual(result_count.numpy().tolist(), [3, 5, 5])
+
   def test_broad_phase(self):
     """Tests broad phase."""
     _, mjd, m, d = test_util.fixture("humanoid/humanoid.xml")
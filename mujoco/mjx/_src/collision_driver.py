@@ -17,6 +17,7 @@ import warp as wp
 
 from .types import Model
 from .types import Data
+from .types import WarningType
 
 BoxType = wp.types.matrix(shape=(2, 3), dtype=wp.float32)
 
@@ -260,6 +261,21 @@ def broad_phase_sweep_and_prune_kernel(
     threadId += num_threads
 
 
+@wp.kernel
+def broad_phase_overflow_kernel(
+  max_num_overlaps_per_world: int,
+  result_count: wp.array(dtype=wp.int32, ndim=1),
+  warning: wp.array(dtype=wp.int32, ndim=1),
+):
+  worldId = wp.tid()
+
+  # Pairs past max_num_overlaps_per_world were not stored
+  overflow = result_count[worldId] - max_num_overlaps_per_world
+  if overflow > 0:
+    wp.atomic_add(warning, wp.static(WarningType.BROADPHASEFULL.value), overflow)
+    result_count[worldId] = max_num_overlaps_per_world
+
+
 def broad_phase(m: Model, d: Data) -> Data:
   """Broad phase collision detection."""
 
@@ -385,4 +401,10 @@ def broad_phase(m: Model, d: Data) -> Data:
     ],
   )
 
+  wp.launch(
+    kernel=broad_phase_overflow_kernel,
+    dim=d.nworld,
+    inputs=[d.max_num_overlaps_per_world, d.result_count, d.warning],
+  )
+
   return d
@@ -71,32 +71,278 @@ def _update_efc_row(
   d.efc_margin[efcid] = margin
 
 
+@wp.func
+def _efc_J_compressed(m: types.Model, d: types.Data) -> bool:
+  """Rows narrower than nv store (value, column) pairs, see io._efc_J_rowmax."""
+  return d.efc_J.shape[1] < m.nv
+
+
+@wp.func
+def _chain_dof(m: types.Model, bodyid: wp.int32, chainid: wp.int32) -> wp.int32:
+  """Returns the dof at chainid on the body's chain, nv past the chain's end."""
+  if chainid < m.body_chainnum[bodyid]:
+    return m.body_chain[m.body_chainadr[bodyid] + chainid]
+  return m.nv
+
+
 @wp.func
 def _jac(
   m: types.Model,
   d: types.Data,
   point: wp.vec3,
-  xyz: wp.int32,
   bodyid: wp.int32,
   dofid: wp.int32,
   worldid: wp.int32,
-):
-  dof_bodyid = m.dof_bodyid[dofid]
-  in_tree = int(dof_bodyid == 0)
-  parentid = bodyid
-  while parentid != 0:
-    if parentid == dof_bodyid:
-      in_tree = 1
-      break
-    parentid = m.body_parentid[parentid]
-
+) -> wp.vec3:
+  """Returns the dof's column of the translational Jacobian of a body point."""
   offset = point - wp.vec3(d.subtree_com[worldid, m.body_rootid[bodyid]])
 
-  jac = wp.spatial_bottom(d.cdof[worldid, dofid]) + wp.cross(
+  return wp.spatial_bottom(d.cdof[worldid, dofid]) + wp.cross(
     wp.spatial_top(d.cdof[worldid, dofid]), offset
   )
 
-  return jac[xyz] * float(in_tree)
+
+@wp.func
+def _jac_frame(
+  m: types.Model,
+  d: types.Data,
+  conid: wp.int32,
+  dofid: wp.int32,
+  dof1: wp.int32,
+  dof2: wp.int32,
+  worldid: wp.int32,
+) -> wp.vec3:
+  """Returns the dof's column of the contact frame Jacobian.
+
+  The components are the normal and the two tangents of the relative velocity
+  of the contact point on body2 and body1. dof1 and dof2 are the current dofs
+  on the bodies' chains, a body only contributes if the dof is on its chain.
+  """
+  con_pos = d.contact.pos[conid]
+  jac_dif = wp.vec3(0.0)
+  if dof1 == dofid:
+    body1 = m.geom_bodyid[d.contact.geom[conid][0]]
+    jac_dif -= _jac(m, d, con_pos, body1, dofid, worldid)
+  if dof2 == dofid:
+    body2 = m.geom_bodyid[d.contact.geom[conid][1]]
+    jac_dif += _jac(m, d, con_pos, body2, dofid, worldid)
+  return d.contact.frame[conid] * jac_dif
+
+
+@wp.func
+def _limit_slide_hinge_pos(
+  m: types.Model, d: types.Data, worldid: wp.int32, jntid: wp.int32
+) -> wp.float32:
+  qpos = d.qpos[worldid, m.jnt_qposadr[jntid]]
+  dist_min, dist_max = qpos - m.jnt_range[jntid][0], m.jnt_range[jntid][1] - qpos
+  return wp.min(dist_min, dist_max) - m.jnt_margin[jntid]
+
+
+@wp.kernel
+def _count_limit_slide_hinge(m: types.Model, d: types.Data):
+  worldid, jntlimitedid = wp.tid()
+  jntid = m.jnt_limited_slide_hinge_adr[jntlimitedid]
+
+  if _limit_slide_hinge_pos(m, d, worldid, jntid) < 0:
+    wp.atomic_add(d.nefc, worldid, 1)
+    wp.atomic_add(d.nefc_total, 0, 1)
+
+
+@wp.func
+def _contact_active(d: types.Data, conid: wp.int32) -> bool:
+  if conid >= d.ncon_total[0]:
+    return False
+  if d.contact.dim[conid] != 3:
+    return False
+  # contacts dropped by the overflow policy are marked -2 and contacts past the
+  # world's budget -3 until they are counted
+  conadr = d.contact.efc_address[conid]
+  if conadr == -2 or conadr == -3:
+    return False
+  return d.contact.dist[conid] - d.contact.includemargin[conid] < 0
+
+
+@wp.func
+def _lower_bound(d: types.Data, key: float, end: int) -> int:
+  # first sorted position before end whose key is not less than key
+  lo = wp.int32(0)
+  hi = wp.int32(end)
+  while lo < hi:
+    mid = (lo + hi) // 2
+    if d.con_sort_key[mid] < key:
+      lo = mid + 1
+    else:
+      hi = mid
+  return lo
+
+
+@wp.kernel
+def _contact_world_key(d: types.Data):
+  sortid = wp.tid()
+  conid = d.con_sort_id[sortid]
+
+  # inactive contacts sort last
+  worldid = d.nworld
+  if _contact_active(d, conid):
+    worldid = d.contact.worldid[conid]
+  d.con_sort_key[sortid] = float(worldid)
+
+
+@wp.kernel
+def _contact_budget(d: types.Data, ncon: int):
+  sortid = wp.tid()
+  conid = d.con_sort_id[sortid]
+
+  if not _contact_active(d, conid):
+    return
+
+  # contacts are sorted by world then depth, the rank in the world is the
+  # distance to the first contact of the world
+  first = _lower_bound(d, d.con_sort_key[sortid], sortid)
+  d.contact.efc_address[conid] = wp.select(sortid - first < ncon, -3, 0)
+
+
+@wp.kernel
+def _contact_sort_key(d: types.Data, sign: float):
+  conid = wp.tid()
+
+  # inactive contacts sort last
+  key = types.MJ_MAXVAL
+  if _contact_active(d, conid):
+    key = sign * (d.contact.dist[conid] - d.contact.includemargin[conid])
+  d.con_sort_key[conid] = key
+  d.con_sort_id[conid] = conid
+
+
+@wp.kernel
+def _contact_order_key(d: types.Data):
+  conid = wp.tid()
+
+  # inactive contacts sort last
+  worldid = d.nworld
+  if _contact_active(d, conid):
+    worldid = d.contact.worldid[conid]
+  d.con_sort_key[conid] = float(worldid)
+  d.con_sort_id[conid] = conid
+
+
+@wp.kernel
+def _contact_sort_rows(d: types.Data, nrow: int):
+  sortid = wp.tid()
+  d.con_sort_rows[sortid] = nrow * int(_contact_active(d, d.con_sort_id[sortid]))
+
+
+@wp.kernel
+def _drop_contact(d: types.Data):
+  sortid = wp.tid()
+  conid = d.con_sort_id[sortid]
+
+  if not _contact_active(d, conid):
+    return
+
+  # contacts claim rows in sorted order after the limits, which are never dropped
+  drop = d.nefc_total[0] + d.con_sort_rows[sortid] > d.njmax
+  d.contact.efc_address[conid] = wp.select(drop, 0, -2)
+
+
+@wp.kernel
+def _contact_address(d: types.Data, nrow: int, truncate: bool):
+  sortid = wp.tid()
+
+  key = d.con_sort_key[sortid]
+  if key >= float(d.nworld):
+    return
+
+  # contacts are sorted by world then id, a contact's offset after the limits of
+  # its world follows from its rank in the world
+  first = _lower_bound(d, key, sortid)
+  worldid = int(key)
+  conadr = d.nefc[worldid] + nrow * (sortid - first)
+
+  # efc_adr holds the limit rows of the earlier worlds and the sorted contacts
+  # before the world's first are theirs, a contact that ends past njmax is
+  # dropped whole
+  if truncate and d.efc_adr[worldid] + nrow * (first + 1) + conadr > d.njmax:
+    conadr = -2
+
+  d.contact.efc_address[d.con_sort_id[sortid]] = conadr
+
+
+@wp.kernel
+def _truncate_limit(d: types.Data, nrow: int):
+  worldid = wp.tid()
+
+  # the limit rows of a world follow the rows of the earlier worlds, the ones
+  # past njmax are dropped
+  first = _lower_bound(d, float(worldid), d.nconmax)
+  nlimit = d.nefc[worldid]
+  nkeep = wp.clamp(d.njmax - d.efc_adr[worldid] - nrow * first, 0, nlimit)
+  d.efc_overflow[worldid] += nlimit - nkeep
+  d.nefc[worldid] = nkeep
+
+
+@wp.kernel
+def _count_contact(d: types.Data, nrow: int):
+  conid = wp.tid()
+
+  if conid >= d.ncon_total[0]:
+    return
+
+  if d.contact.dim[conid] != 3:
+    return
+
+  if d.contact.dist[conid] - d.contact.includemargin[conid] < 0:
+    conadr = d.contact.efc_address[conid]
+    if conadr == -3:
+      d.contact.efc_address[conid] = -1
+      return
+
+    worldid = d.contact.worldid[conid]
+    if conadr == -2:
+      wp.atomic_add(d.efc_overflow, worldid, nrow)
+      d.contact.efc_address[conid] = -1
+      return
+
+    # the offsets were assigned in order, only the counts are accumulated
+    wp.atomic_add(d.nefc, worldid, nrow)
+  else:
+    d.contact.efc_address[conid] = -1
+
+
+@wp.kernel
+def _contact_overflow(d: types.Data):
+  # contacts counted past nconmax by the collision pipeline were not stored
+  overflow = d.ncon_total[0] - d.nconmax
+  if overflow > 0:
+    wp.atomic_add(d.warning, wp.static(types.WarningType.CONTACTFULL.value), overflow)
+    d.ncon_total[0] = d.nconmax
+
+
+@wp.kernel
+def _flag_world(d: types.Data):
+  worldid = wp.tid()
+
+  # efc_adr is the scan of the worlds' rows, a world whose rows end past njmax
+  # keeps none, and neither do the worlds after it
+  nefc = d.nefc[worldid]
+  if d.efc_adr[worldid] + nefc > d.njmax:
+    d.efc_overflow[worldid] += nefc
+    d.nefc[worldid] = 0
+
+
+@wp.kernel
+def _efc_overflow(d: types.Data):
+  worldid = wp.tid()
+
+  wp.atomic_add(
+    d.warning,
+    wp.static(types.WarningType.CNSTRFULL.value),
+    d.efc_overflow[worldid],
+  )
+
+  # every kept row fits in njmax
+  if worldid == d.nworld - 1:
+    d.nefc_total[0] = d.efc_adr[worldid] + d.nefc[worldid]
 
 
 @wp.kernel
@@ -114,13 +360,32 @@ def _efc_limit_slide_hinge(
   active = pos < 0
 
   if active:
-    efcid = wp.atomic_add(d.nefc_total, 0, 1)
+    # limit rows come first in each world, ordered by joint
+    efcid = d.efc_adr[worldid]
+    for i in range(jntlimitedid):
+      jntid_i = m.jnt_limited_slide_hinge_adr[i]
+      efcid += int(_limit_slide_hinge_pos(m, d, worldid, jntid_i) < 0)
+
+    # truncated limits and flagged worlds keep no rows
+    if efcid - d.efc_adr[worldid] >= d.nefc[worldid]:
+      return
+
     d.efc_worldid[efcid] = worldid
+    d.efc_type[efcid] = wp.static(types.ConstraintType.LIMIT_JOINT.value)
+    d.efc_id[efcid] = jntid
 
     dofadr = m.jnt_dofadr[jntid]
 
     J = float(dist_min < dist_max) * 2.0 - 1.0
-    d.efc_J[efcid, dofadr] = J
+    if _efc_J_compressed(m, d):
+      d.efc_J[efcid, 0] = J
+      d.efc_J_colind[efcid, 0] = dofadr
+      d.efc_J_rownnz[efcid] = 1
+    else:
+      for i in range(m.nv):
+        d.efc_J[efcid, i] = J * float(i == dofadr)
+        d.efc_J_colind[efcid, i] = i
+      d.efc_J_rownnz[efcid] = m.nv
     Jqvel = J * d.qvel[worldid, dofadr]
 
     _update_efc_row(
@@ -145,7 +410,7 @@ def _efc_contact_pyramidal(
   d: types.Data,
   refsafe: bool,
 ):
-  conid, dimid = wp.tid()
+  conid = wp.tid()
 
   if conid >= d.ncon_total[0]:
     return
@@ -157,78 +422,315 @@ def _efc_contact_pyramidal(
   active = pos < 0
 
   if active:
-    efcid = wp.atomic_add(d.nefc_total, 0, 1)
     worldid = d.contact.worldid[conid]
-    d.efc_worldid[efcid] = worldid
+
+    # dropped contacts and flagged worlds keep no rows
+    conadr = d.contact.efc_address[conid]
+    if conadr < 0 or conadr >= d.nefc[worldid]:
+      return
+
+    # contacts that do not fit in njmax have no address
+    efcadr = d.efc_adr[worldid] + conadr
+    nrow = 4
 
     body1 = m.geom_bodyid[d.contact.geom[conid][0]]
     body2 = m.geom_bodyid[d.contact.geom[conid][1]]
-
-    fri0 = d.contact.friction[conid][0]
+    friction = d.contact.friction[conid]
+
+    for dimid in range(nrow):
+      efcid = efcadr + dimid
+      d.efc_worldid[efcid] = worldid
+      d.efc_type[efcid] = wp.static(types.ConstraintType.CONTACT_PYRAMIDAL.value)
+      d.efc_id[efcid] = conid
+
+      # only the dofs on the chains of the two bodies are nonzero, compressed rows
+      # only store those
+      if not _efc_J_compressed(m, d):
+        for i in range(m.nv):
+          d.efc_J[efcid, i] = 0.0
+          d.efc_J_colind[efcid, i] = i
+
+    # the frame Jacobian is computed once per dof, and each pyramid edge
+    # combines the normal with one tangent: rows 2k and 2k + 1 are
+    # normal +/- friction[k] * tangent_k
+    rownnz = wp.int32(0)
+    Jqvel = wp.vec4(0.0)
+    chainid1 = wp.int32(0)
+    chainid2 = wp.int32(0)
+    for _ in range(m.body_chainnum[body1] + m.body_chainnum[body2]):
+      # merge the two chains in increasing dof order
+      dof1 = _chain_dof(m, body1, chainid1)
+      dof2 = _chain_dof(m, body2, chainid2)
+      i = wp.min(dof1, dof2)
+      if i == m.nv:
+        break
+      chainid1 += int(dof1 == i)
+      chainid2 += int(dof2 == i)
+
+      jac = _jac_frame(m, d, conid, i, dof1, dof2, worldid)
+      qvel = d.qvel[worldid, i]
+      for dimid in range(nrow):
+        dimid2 = dimid / 2 + 1
+        sign = 1.0 - 2.0 * float(dimid % 2)
+        J = jac[0] + sign * jac[dimid2] * friction[dimid2 - 1]
+
+        efcid = efcadr + dimid
+        if _efc_J_compressed(m, d):
+          d.efc_J[efcid, rownnz] = J
+          d.efc_J_colind[efcid, rownnz] = i
+        else:
+          d.efc_J[efcid, i] = J
+        Jqvel[dimid] += J * qvel
+      rownnz += 1
+
+    if not _efc_J_compressed(m, d):
+      rownnz = m.nv
 
     # pyramidal has common invweight across all edges
+    fri0 = friction[0]
     invweight = m.body_invweight0[body1, 0] + m.body_invweight0[body2, 0]
     invweight = invweight + fri0 * fri0 * invweight
     invweight = invweight * 2.0 * fri0 * fri0 / m.opt.impratio
 
-    dimid2 = dimid / 2 + 1
-
-    Jqvel = float(0.0)
-    for i in range(m.nv):
-      diff_0 = float(0.0)
-      diff_i = float(0.0)
-      for xyz in range(3):
-        con_pos = d.contact.pos[conid]
-        jac1p = _jac(m, d, con_pos, xyz, body1, i, worldid)
-        jac2p = _jac(m, d, con_pos, xyz, body2, i, worldid)
-        jac_dif = jac2p - jac1p
-        diff_0 += d.contact.frame[conid][0, xyz] * jac_dif
-        diff_i += d.contact.frame[conid][dimid2, xyz] * jac_dif
-      if dimid % 2 == 0:
-        J = diff_0 + diff_i * d.contact.friction[conid][dimid2 - 1]
-      else:
-        J = diff_0 - diff_i * d.contact.friction[conid][dimid2 - 1]
-
-      d.efc_J[efcid, i] = J
-      Jqvel += J * d.qvel[worldid, i]
+    for dimid in range(nrow):
+      efcid = efcadr + dimid
+      d.efc_J_rownnz[efcid] = rownnz
+
+      _update_efc_row(
+        m,
+        d,
+        worldid,
+        efcid,
+        pos,
+        pos,
+        invweight,
+        d.contact.solref[conid],
+        d.contact.solimp[conid],
+        d.contact.includemargin[conid],
+        refsafe,
+        Jqvel[dimid],
+      )
 
-    _update_efc_row(
-      m,
-      d,
-      worldid,
-      efcid,
-      pos,
-      pos,
-      invweight,
-      d.contact.solref[conid],
-      d.contact.solimp[conid],
-      d.contact.includemargin[conid],
-      refsafe,
-      Jqvel,
-    )
+
+@wp.kernel
+def _efc_contact_elliptic(
+  m: types.Model,
+  d: types.Data,
+  refsafe: bool,
+):
+  conid = wp.tid()
+
+  if conid >= d.ncon_total[0]:
+    return
+
+  if d.contact.dim[conid] != 3:
+    return
+
+  pos = d.contact.dist[conid] - d.contact.includemargin[conid]
+  active = pos < 0
+
+  if active:
+    worldid = d.contact.worldid[conid]
+
+    # dropped contacts and flagged worlds keep no rows
+    conadr = d.contact.efc_address[conid]
+    if conadr < 0 or conadr >= d.nefc[worldid]:
+      return
+
+    # contacts that do not fit in njmax have no address
+    efcadr = d.efc_adr[worldid] + conadr
+    nrow = 3
+
+    body1 = m.geom_bodyid[d.contact.geom[conid][0]]
+    body2 = m.geom_bodyid[d.contact.geom[conid][1]]
+
+    for dimid in range(nrow):
+      efcid = efcadr + dimid
+      d.efc_worldid[efcid] = worldid
+      d.efc_type[efcid] = wp.static(types.ConstraintType.CONTACT_ELLIPTIC.value)
+      d.efc_id[efcid] = conid
+
+      if not _efc_J_compressed(m, d):
+        for i in range(m.nv):
+          d.efc_J[efcid, i] = 0.0
+          d.efc_J_colind[efcid, i] = i
+
+    # the rows are the normal and tangent components of the frame Jacobian
+    rownnz = wp.int32(0)
+    Jqvel = wp.vec3(0.0)
+    chainid1 = wp.int32(0)
+    chainid2 = wp.int32(0)
+    for _ in range(m.body_chainnum[body1] + m.body_chainnum[body2]):
+      dof1 = _chain_dof(m, body1, chainid1)
+      dof2 = _chain_dof(m, body2, chainid2)
+      i = wp.min(dof1, dof2)
+      if i == m.nv:
+        break
+      chainid1 += int(dof1 == i)
+      chainid2 += int(dof2 == i)
+
+      jac = _jac_frame(m, d, conid, i, dof1, dof2, worldid)
+      qvel = d.qvel[worldid, i]
+      for dimid in range(nrow):
+        efcid = efcadr + dimid
+        if _efc_J_compressed(m, d):
+          d.efc_J[efcid, rownnz] = jac[dimid]
+          d.efc_J_colind[efcid, rownnz] = i
+        else:
+          d.efc_J[efcid, i] = jac[dimid]
+        Jqvel[dimid] += jac[dimid] * qvel
+      rownnz += 1
+
+    if not _efc_J_compressed(m, d):
+      rownnz = m.nv
+
+    friction = d.contact.friction[conid]
+    solref = d.contact.solref[conid]
+    solreffriction = d.contact.solreffriction[conid]
+
+    for dimid in range(nrow):
+      efcid = efcadr + dimid
+      d.efc_J_rownnz[efcid] = rownnz
+
+      # friction rows are scaled by impratio and the friction coefficients so
+      # that the cone is circular in the solver
+      invweight = m.body_invweight0[body1, 0] + m.body_invweight0[body2, 0]
+      if dimid > 0:
+        invweight = invweight / m.opt.impratio
+      if dimid > 1:
+        invweight = invweight * friction[0] * friction[0]
+        invweight = invweight / (friction[dimid - 1] * friction[dimid - 1])
+
+      # normal row comes from solref, friction rows from solreffriction
+      solref_row = solref
+      if dimid > 0 and (solreffriction[0] != 0.0 or solreffriction[1] != 0.0):
+        solref_row = solreffriction
+
+      _update_efc_row(
+        m,
+        d,
+        worldid,
+        efcid,
+        pos * float(dimid == 0),
+        pos,
+        invweight,
+        solref_row,
+        d.contact.solimp[conid],
+        d.contact.includemargin[conid],
+        refsafe,
+        Jqvel[dimid],
+      )
+
+
+@wp.kernel
+def _contact_efc_address(d: types.Data):
+  conid = wp.tid()
+
+  if conid >= d.ncon_total[0]:
+    return
+
+  conadr = d.contact.efc_address[conid]
+  if conadr < 0:
+    return
+
+  worldid = d.contact.worldid[conid]
+  if conadr >= d.nefc[worldid]:
+    d.contact.efc_address[conid] = -1
+  else:
+    d.contact.efc_address[conid] = conadr + d.efc_adr[worldid]
 
 
 def make_constraint(m: types.Model, d: types.Data):
-  """Creates constraint jacobians and other supporting data."""
+  """Creates constraint jacobians and other supporting data.
+
+  Rows that do not fit in njmax are dropped according to m.opt.overflow, a
+  contact keeps all its rows or none. The number of dropped rows is stored per
+  world in d.efc_overflow and summed in d.warning[CNSTRFULL], and contacts the
+  collision pipeline counted past nconmax are summed in d.warning[CONTACTFULL].
+  If m.opt.max_contacts_per_world is set, only the deepest contacts of each
+  world get rows.
+  """
 
   if not (m.opt.disableflags & types.DisableBit.CONSTRAINT.value):
+    d.nefc.zero_()
     d.nefc_total.zero_()
-    d.efc_J.zero_()
+    d.efc_overflow.zero_()
+    wp.launch(_contact_overflow, dim=(1,), inputs=[d])
 
     refsafe = not m.opt.disableflags & types.DisableBit.REFSAFE.value
-
-    if not (m.opt.disableflags & types.DisableBit.LIMIT.value) and (
+    limit = not (m.opt.disableflags & types.DisableBit.LIMIT.value) and (
       m.jnt_limited_slide_hinge_adr.size != 0
-    ):
+    )
+    pyramidal = m.opt.cone == types.ConeType.PYRAMIDAL.value
+
+    # count the rows of each world, then lay each world out contiguously at
+    # efc_adr: [limits, contacts]
+    if limit:
       wp.launch(
-        _efc_limit_slide_hinge,
+        _count_limit_slide_hinge,
         dim=(d.nworld, m.jnt_limited_slide_hinge_adr.size),
-        inputs=[m, d, refsafe],
+        inputs=[m, d],
+      )
+
+    # pyramidal cones have 2 * (dim - 1) rows per contact, elliptic cones dim
+    nrow = 4 if pyramidal else 3
+
+    # keep the deepest contacts of each world: sort by depth, then stable sort
+    # by world
+    if m.opt.max_contacts_per_world > 0:
+      wp.launch(_contact_sort_key, dim=(d.nconmax,), inputs=[d, 1.0])
+      wp.utils.radix_sort_pairs(d.con_sort_key, d.con_sort_id, d.nconmax)
+      wp.launch(_contact_world_key, dim=(d.nconmax,), inputs=[d])
+      wp.utils.radix_sort_pairs(d.con_sort_key, d.con_sort_id, d.nconmax)
+      wp.launch(
+        _contact_budget,
+        dim=(d.nconmax,),
+        inputs=[d, m.opt.max_contacts_per_world],
       )
 
-    if m.opt.cone == types.ConeType.PYRAMIDAL.value:
+    # contacts claim the rows left after the limits by penetration
+    dropped = m.opt.overflow in (
+      types.OverflowPolicy.DROP_SHALLOWEST.value,
+      types.OverflowPolicy.DROP_DEEPEST.value,
+    )
+    if dropped:
+      sign = 1.0 if m.opt.overflow == types.OverflowPolicy.DROP_SHALLOWEST else -1.0
+      wp.launch(_contact_sort_key, dim=(d.nconmax,), inputs=[d, sign])
+      wp.utils.radix_sort_pairs(d.con_sort_key, d.con_sort_id, d.nconmax)
+      wp.launch(_contact_sort_rows, dim=(d.nconmax,), inputs=[d, nrow])
+      wp.utils.array_scan(d.con_sort_rows, d.con_sort_rows, inclusive=True)
+      wp.launch(_drop_contact, dim=(d.nconmax,), inputs=[d])
+
+    # contacts take the rows after the limits of their world in contact id
+    # order, so the layout does not depend on thread scheduling
+    flag_world = m.opt.overflow == types.OverflowPolicy.FLAG_WORLD
+    truncate = m.opt.overflow == types.OverflowPolicy.TRUNCATE
+    wp.utils.array_scan(d.nefc, d.efc_adr, inclusive=False)
+    wp.launch(_contact_order_key, dim=(d.nconmax,), inputs=[d])
+    wp.utils.radix_sort_pairs(d.con_sort_key, d.con_sort_id, d.nconmax)
+    wp.launch(_contact_address, dim=(d.nconmax,), inputs=[d, nrow, truncate])
+    if not flag_world:
+      wp.launch(_truncate_limit, dim=(d.nworld,), inputs=[d, nrow])
+    wp.launch(_count_contact, dim=(d.nconmax,), inputs=[d, nrow])
+
+    if flag_world:
+      wp.utils.array_scan(d.nefc, d.efc_adr, inclusive=False)
+      wp.launch(_flag_world, dim=(d.nworld,), inputs=[d])
+
+    wp.utils.array_scan(d.nefc, d.efc_adr, inclusive=False)
+    wp.launch(_efc_overflow, dim=(d.nworld,), inputs=[d])
+
+    if limit:
       wp.launch(
-        _efc_contact_pyramidal,
-        dim=(d.nconmax, 4),
+        _efc_limit_slide_hinge,
+        dim=(d.nworld, m.jnt_limited_slide_hinge_adr.size),
         inputs=[m, d, refsafe],
       )
+
+    # one thread per contact computes the contact's Jacobian and all its rows
+    wp.launch(
+      _efc_contact_pyramidal if pyramidal else _efc_contact_elliptic,
+      dim=(d.nconmax,),
+      inputs=[m, d, refsafe],
+    )
+    wp.launch(_contact_efc_address, dim=(d.nconmax,), inputs=[d])
@@ -21,6 +21,7 @@ from . import test_util
 import mujoco
 from mujoco import mjx
 import numpy as np
+import warp as wp
 
 # tolerance for difference between MuJoCo and MJX constraint calculations,
 # mostly due to float precision
@@ -34,10 +35,14 @@ def _assert_eq(a, b, name):
 
 
 class ConstraintTest(parameterized.TestCase):
-  def test_constraints(self):
+  @parameterized.product(
+    sparse=(False, True),
+    cone=(mujoco.mjtCone.mjCONE_PYRAMIDAL, mujoco.mjtCone.mjCONE_ELLIPTIC),
+  )
+  def test_constraints(self, sparse: bool, cone):
     """Test constraints."""
-    mjm, mjd, _, _ = test_util.fixture("constraints.xml", sparse=False)
-    mjm.opt.cone = mujoco.mjtCone.mjCONE_PYRAMIDAL
+    mjm, mjd, _, _ = test_util.fixture("constraints.xml", sparse=sparse)
+    mjm.opt.cone = cone
 
     for key in range(3):
       mujoco.mj_resetDataKeyframe(mjm, mjd, key)
@@ -47,12 +52,200 @@ class ConstraintTest(parameterized.TestCase):
       d = mjx.put_data(mjm, mjd)
       mjx.make_constraint(m, d)
 
-      _assert_eq(d.efc_J.numpy()[: mjd.nefc, :].reshape(-1), mjd.efc_J, "efc_J")
+      # rows of dense and sparse models hold the dofs of two body chains
+      self.assertLess(d.efc_J.shape[1], mjm.nv)
+      efc_J = np.zeros((mjd.nefc, mjm.nv))
+      rownnz = d.efc_J_rownnz.numpy()
+      colind = d.efc_J_colind.numpy()
+      for i in range(mjd.nefc):
+        efc_J[i, colind[i, : rownnz[i]]] = d.efc_J.numpy()[i, : rownnz[i]]
+      mj_efc_J = np.zeros((mjd.nefc, mjm.nv))
+      if sparse:
+        mujoco.mju_sparse2dense(
+          mj_efc_J,
+          mjd.efc_J,
+          mjd.efc_J_rownnz,
+          mjd.efc_J_rowadr,
+          mjd.efc_J_colind,
+        )
+      else:
+        mj_efc_J = mjd.efc_J.reshape((mjd.nefc, mjm.nv))
+      np.testing.assert_equal(d.efc_type.numpy()[: mjd.nefc], mjd.efc_type)
+      np.testing.assert_equal(d.efc_id.numpy()[: mjd.nefc], mjd.efc_id)
+      _assert_eq(efc_J, mj_efc_J, "efc_J")
       _assert_eq(d.efc_D.numpy()[: mjd.nefc], mjd.efc_D, "efc_D")
       _assert_eq(d.efc_aref.numpy()[: mjd.nefc], mjd.efc_aref, "efc_aref")
       _assert_eq(d.efc_pos.numpy()[: mjd.nefc], mjd.efc_pos, "efc_pos")
       _assert_eq(d.efc_margin.numpy()[: mjd.nefc], mjd.efc_margin, "efc_margin")
 
+  def test_constraints_batch(self):
+    """Test that each world's constraint rows are contiguous."""
+    mjm, mjd, _, _ = test_util.fixture("constraints.xml", sparse=False)
+    mjm.opt.cone = mujoco.mjtCone.mjCONE_PYRAMIDAL
+    mujoco.mj_resetDataKeyframe(mjm, mjd, 2)
+    mujoco.mj_forward(mjm, mjd)
+
+    nworld = 3
+    m = mjx.put_model(mjm)
+    d = mjx.put_data(mjm, mjd, nworld=nworld)
+    mjx.make_constraint(m, d)
+
+    nefc = mjd.nefc
+    np.testing.assert_equal(d.nefc.numpy(), [nefc] * nworld)
+    np.testing.assert_equal(d.nefc_total.numpy()[0], nefc * nworld)
+    np.testing.assert_equal(d.efc_adr.numpy(), np.arange(nworld) * nefc)
+    np.testing.assert_equal(
+      d.contact.efc_address.numpy()[: mjd.ncon * nworld],
+      np.concatenate([mjd.contact.efc_address + i * nefc for i in range(nworld)]),
+    )
+
+    for i in range(nworld):
+      rows = slice(i * nefc, (i + 1) * nefc)
+      np.testing.assert_equal(d.efc_worldid.numpy()[rows], i)
+      _assert_eq(d.efc_D.numpy()[rows], mjd.efc_D, "efc_D")
+      _assert_eq(d.efc_aref.numpy()[rows], mjd.efc_aref, "efc_aref")
+      _assert_eq(d.efc_pos.numpy()[rows], mjd.efc_pos, "efc_pos")
+
+  def test_constraints_order(self):
+    """Test that contacts take the rows of their world in contact id order."""
+    mjm, mjd, _, _ = test_util.fixture("constraints.xml", sparse=False)
+    mjm.opt.cone = mujoco.mjtCone.mjCONE_PYRAMIDAL
+    mujoco.mj_resetDataKeyframe(mjm, mjd, 2)
+    mujoco.mj_forward(mjm, mjd)
+
+    # interleave the contacts of the two worlds
+    nworld = 2
+    ncon = mjd.ncon * nworld
+    m = mjx.put_model(mjm)
+    d = mjx.put_data(mjm, mjd, nworld=nworld)
+    worldid = np.arange(ncon) % nworld
+    d.contact.worldid = wp.array(
+      np.concatenate([worldid, d.contact.worldid.numpy()[ncon:]]), dtype=wp.int32
+    )
+    mjx.make_constraint(m, d)
+
+    efc_adr = d.efc_adr.numpy()
+    efc_address = d.contact.efc_address.numpy()[:ncon]
+    nlimit = mjd.nefc - 4 * mjd.ncon
+    for i in range(nworld):
+      rank = np.arange(mjd.ncon)
+      np.testing.assert_equal(efc_address[worldid == i], efc_adr[i] + nlimit + 4 * rank)
+      np.testing.assert_equal(
+        d.efc_id.numpy()[efc_address[worldid == i]], np.flatnonzero(worldid == i)
+      )
+
+  @parameterized.parameters(
+    (mjx.OverflowPolicy.TRUNCATE, 48, [0, 16]),
+    (mjx.OverflowPolicy.TRUNCATE, 46, [0, 20]),
+    (mjx.OverflowPolicy.DROP_SHALLOWEST, 48, [8, 8]),
+    (mjx.OverflowPolicy.DROP_DEEPEST, 48, [8, 8]),
+    (mjx.OverflowPolicy.FLAG_WORLD, 48, [0, 32]),
+    (mjx.OverflowPolicy.FLAG_WORLD, 46, [0, 32]),
+  )
+  def test_constraints_overflow(self, overflow, njmax, efc_overflow):
+    """Test that rows past njmax are dropped by the overflow policy and counted."""
+    mjm, mjd, _, _ = test_util.fixture("constraints.xml", sparse=False)
+    mjm.opt.cone = mujoco.mjtCone.mjCONE_PYRAMIDAL
+    mujoco.mj_resetDataKeyframe(mjm, mjd, 2)
+    mujoco.mj_forward(mjm, mjd)
+
+    # 8 contacts with 4 rows each per world, with njmax 46 the twelfth contact
+    # straddles njmax and is dropped whole
+    nworld = 2
+    m = mjx.put_model(mjm)
+    m.opt.overflow = overflow
+    d = mjx.put_data(mjm, mjd, nworld=nworld)
+    d.njmax = njmax
+    mjx.make_constraint(m, d)
+
+    np.testing.assert_equal(d.efc_overflow.numpy(), efc_overflow)
+    np.testing.assert_equal(mjx.overflow(d)["cnstrfull"], sum(efc_overflow))
+
+    # the counters sum over calls
+    mjx.make_constraint(m, d)
+    np.testing.assert_equal(mjx.overflow(d)["cnstrfull"], 2 * sum(efc_overflow))
+    np.testing.assert_equal(mjx.overflow(d)["broadphasefull"], 0)
+
+    # dropped rows are not counted
+    ncon = mjd.ncon * nworld
+    nefc = d.nefc.numpy()
+    efc_address = d.contact.efc_address.numpy()[:ncon]
+    np.testing.assert_equal(nefc, 32 - np.array(efc_overflow))
+    np.testing.assert_equal(d.nefc_total.numpy()[0], nefc.sum())
+    self.assertLessEqual(nefc.sum(), njmax)
+
+    # kept contacts have all their rows
+    efc_id = d.efc_id.numpy()
+    for conid in np.nonzero(efc_address >= 0)[0]:
+      self.assertLessEqual(efc_address[conid] + 4, njmax)
+      np.testing.assert_equal(
+        efc_id[efc_address[conid] : efc_address[conid] + 4], conid
+      )
+    np.testing.assert_equal(4 * np.sum(efc_address >= 0), nefc.sum())
+
+    if overflow in (
+      mjx.OverflowPolicy.DROP_SHALLOWEST,
+      mjx.OverflowPolicy.DROP_DEEPEST,
+    ):
+      dist = d.contact.dist.numpy()[:ncon]
+      kept, dropped = dist[efc_address >= 0], dist[efc_address < 0]
+      self.assertLen(dropped, 4)
+      if overflow == mjx.OverflowPolicy.DROP_SHALLOWEST:
+        self.assertLessEqual(kept.max(), dropped.min())
+      else:
+        self.assertGreaterEqual(kept.min(), dropped.max())
+
+  def test_constraints_contact_overflow(self):
+    """Test that contacts counted past nconmax are counted and ignored."""
+    mjm, mjd, _, _ = test_util.fixture("constraints.xml", sparse=False)
+    mujoco.mj_resetDataKeyframe(mjm, mjd, 2)
+    mujoco.mj_forward(mjm, mjd)
+
+    m = mjx.put_model(mjm)
+    d = mjx.put_data(mjm, mjd)
+    d.ncon_total.fill_(d.nconmax + 5)
+    mjx.make_constraint(m, d)
+
+    np.testing.assert_equal(mjx.overflow(d)["contactfull"], 5)
+    np.testing.assert_equal(d.ncon_total.numpy()[0], d.nconmax)
+    np.testing.assert_equal(d.nefc.numpy()[0], mjd.nefc)
+
+  @parameterized.parameters(
+    (mjx.OverflowPolicy.TRUNCATE, 0),
+    (mjx.OverflowPolicy.DROP_SHALLOWEST, 4),
+  )
+  def test_constraints_max_contacts(self, overflow, njmax_short):
+    """Test that only the deepest contacts of each world get rows."""
+    mjm, mjd, _, _ = test_util.fixture("constraints.xml", sparse=False)
+    mjm.opt.cone = mujoco.mjtCone.mjCONE_PYRAMIDAL
+    mujoco.mj_resetDataKeyframe(mjm, mjd, 2)
+    mujoco.mj_forward(mjm, mjd)
+
+    # 8 contacts per world, 3 are kept
+    nworld, ncon = 2, 3
+    m = mjx.put_model(mjm)
+    m.opt.overflow = overflow
+    m.opt.max_contacts_per_world = ncon
+    d = mjx.put_data(mjm, mjd, nworld=nworld)
+    d.njmax = nworld * ncon * 4 - njmax_short
+    mjx.make_constraint(m, d)
+
+    efc_address = d.contact.efc_address.numpy()[: mjd.ncon * nworld]
+    dist = d.contact.dist.numpy()[: mjd.ncon * nworld]
+    kept = efc_address >= 0
+    deepest = np.argsort(mjd.contact.dist)[:ncon]
+    if njmax_short:
+      # the shallowest kept contact does not fit
+      np.testing.assert_equal(d.efc_overflow.numpy().sum(), 4)
+      self.assertLen(np.nonzero(kept)[0], nworld * ncon - 1)
+    else:
+      np.testing.assert_equal(d.nefc.numpy(), [ncon * 4] * nworld)
+      np.testing.assert_equal(d.efc_overflow.numpy(), [0] * nworld)
+      for i in range(nworld):
+        worldkept = kept[i * mjd.ncon : (i + 1) * mjd.ncon]
+        np.testing.assert_equal(np.nonzero(worldkept)[0], np.sort(deepest))
+    self.assertLessEqual(dist[kept].max(), dist[~kept].min())
+
 
 if __name__ == "__main__":
   absltest.main()
@@ -19,6 +19,7 @@ import warp as wp
 import mujoco
 
 from . import constraint
+from . import island
 from . import math
 from . import passive
 from . import smooth
@@ -387,6 +388,7 @@ def fwd_position(m: Model, d: Data):
   smooth.factor_m(m, d)
   # TODO(team): collision_driver.collision
   constraint.make_constraint(m, d)
+  island.island(m, d)
   smooth.transmission(m, d)
 
 
@@ -33,6 +33,7 @@ def put_model(mjm: mujoco.MjModel) -> types.Model:
   m.nsite = mjm.nsite
   m.nmocap = mjm.nmocap
   m.nM = mjm.nM
+  m.ntree = mjm.ntree
   m.opt.timestep = mjm.opt.timestep
   m.opt.tolerance = mjm.opt.tolerance
   m.opt.ls_tolerance = mjm.opt.ls_tolerance
@@ -43,8 +44,14 @@ def put_model(mjm: mujoco.MjModel) -> types.Model:
   m.opt.ls_iterations = mjm.opt.ls_iterations
   m.opt.integrator = mjm.opt.integrator
   m.opt.disableflags = mjm.opt.disableflags
+  m.opt.enableflags = mjm.opt.enableflags
   m.opt.impratio = wp.float32(mjm.opt.impratio)
   m.opt.is_sparse = support.is_sparse(mjm)
+  m.opt.ls_exact = False
+  m.opt.preconditioner = types.PreconditionerType.MASS
+  m.opt.overflow = types.OverflowPolicy.TRUNCATE
+  m.opt.max_contacts_per_world = 0
+  m.opt.fused_cg = False
   m.stat.meaninertia = mjm.stat.meaninertia
 
   m.qpos0 = wp.array(mjm.qpos0, dtype=wp.float32, ndim=1)
@@ -105,6 +112,19 @@ def put_model(mjm: mujoco.MjModel) -> types.Model:
   qLD_tile = np.empty(shape=(0,), dtype=int)
   qLD_tileadr = np.empty(shape=(0,), dtype=int)
   qLD_tilesize = np.empty(shape=(0,), dtype=int)
+  hfactor_coladr = np.empty(shape=(0,), dtype=int)
+  hfactor_colnnz = np.empty(shape=(0,), dtype=int)
+  hfactor_rowind = np.empty(shape=(0,), dtype=int)
+  hfactor_parent = np.empty(shape=(0,), dtype=int)
+  hfactor_adr = np.empty(shape=(0, 0), dtype=int)
+  hfactor_level = np.empty(shape=(0,), dtype=int)
+  hfactor_leveladr = np.empty(shape=(0,), dtype=int)
+  hfactor_update = np.empty(shape=(0, 3), dtype=int)
+  hfactor_target = np.empty(shape=(0, 2), dtype=int)
+  hfactor_targetadr = np.empty(shape=(0,), dtype=int)
+  hfactor_row = np.empty(shape=(0, 2), dtype=int)
+  hfactor_rowadr = np.empty(shape=(0,), dtype=int)
+  hfactor_rownnz = np.empty(shape=(0,), dtype=int)
 
   if support.is_sparse(mjm):
     # qLD_update_tree has dof tree ordering of qLD updates for sparse factor m
@@ -123,6 +143,23 @@ def put_model(mjm: mujoco.MjModel) -> types.Model:
     qLD_update_tree = np.concatenate([qLD_updates[i] for i in range(len(qLD_updates))])
     tree_off = [0] + [len(qLD_updates[i]) for i in range(len(qLD_updates))]
     qLD_update_treeadr = np.cumsum(tree_off)[:-1]
+
+    # sparse factor of the Newton Hessian, see _hfactor
+    (
+      hfactor_coladr,
+      hfactor_colnnz,
+      hfactor_rowind,
+      hfactor_parent,
+      hfactor_adr,
+      hfactor_level,
+      hfactor_leveladr,
+      hfactor_update,
+      hfactor_target,
+      hfactor_targetadr,
+      hfactor_row,
+      hfactor_rowadr,
+      hfactor_rownnz,
+    ) = _hfactor_cached(mjm)
   else:
     # qLD_tile has the dof id of each tile in qLD for dense factor m
     # qLD_tileadr contains starting index in qLD_tile of each tile group
@@ -189,6 +226,21 @@ def put_model(mjm: mujoco.MjModel) -> types.Model:
   m.qLD_update_treeadr = wp.array(
     qLD_update_treeadr, dtype=wp.int32, ndim=1, device="cpu"
   )
+  m.hfactor_coladr = wp.array(hfactor_coladr, dtype=wp.int32, ndim=1)
+  m.hfactor_colnnz = wp.array(hfactor_colnnz, dtype=wp.int32, ndim=1)
+  m.hfactor_rowind = wp.array(hfactor_rowind, dtype=wp.int32, ndim=1)
+  m.hfactor_parent = wp.array(hfactor_parent, dtype=wp.int32, ndim=1)
+  m.hfactor_adr = wp.array(hfactor_adr, dtype=wp.int32, ndim=2)
+  m.hfactor_level = wp.array(hfactor_level, dtype=wp.int32, ndim=1)
+  m.hfactor_leveladr = wp.array(hfactor_leveladr, dtype=wp.int32, ndim=1, device="cpu")
+  m.hfactor_update = wp.array(hfactor_update, dtype=wp.vec3i, ndim=1)
+  m.hfactor_target = wp.array(hfactor_target, dtype=wp.vec2i, ndim=1)
+  m.hfactor_targetadr = wp.array(
+    hfactor_targetadr, dtype=wp.int32, ndim=1, device="cpu"
+  )
+  m.hfactor_row = wp.array(hfactor_row, dtype=wp.vec2i, ndim=1)
+  m.hfactor_rowadr = wp.array(hfactor_rowadr, dtype=wp.int32, ndim=1)
+  m.hfactor_rownnz = wp.array(hfactor_rownnz, dtype=wp.int32, ndim=1)
   m.qLD_tile = wp.array(qLD_tile, dtype=wp.int32, ndim=1)
   m.qLD_tileadr = wp.array(qLD_tileadr, dtype=wp.int32, ndim=1, device="cpu")
   m.qLD_tilesize = wp.array(qLD_tilesize, dtype=wp.int32, ndim=1, device="cpu")
@@ -213,6 +265,15 @@ def put_model(mjm: mujoco.MjModel) -> types.Model:
   m.body_jntnum = wp.array(mjm.body_jntnum, dtype=wp.int32, ndim=1)
   m.body_parentid = wp.array(mjm.body_parentid, dtype=wp.int32, ndim=1)
   m.body_mocapid = wp.array(mjm.body_mocapid, dtype=wp.int32, ndim=1)
+  m.body_treeid = wp.array(mjm.body_treeid, dtype=wp.int32, ndim=1)
+  body_chain = _body_chain(mjm)
+  body_chainnum = np.array([len(c) for c in body_chain], dtype=int)
+  body_chainadr = np.concatenate([[0], np.cumsum(body_chainnum)[:-1]])
+  m.body_chainadr = wp.array(body_chainadr, dtype=wp.int32, ndim=1)
+  m.body_chainnum = wp.array(body_chainnum, dtype=wp.int32, ndim=1)
+  m.body_chain = wp.array(
+    np.concatenate(body_chain).astype(int), dtype=wp.int32, ndim=1
+  )
   m.body_pos = wp.array(mjm.body_pos, dtype=wp.vec3, ndim=1)
   m.body_quat = wp.array(mjm.body_quat, dtype=wp.quat, ndim=1)
   m.body_ipos = wp.array(mjm.body_ipos, dtype=wp.vec3, ndim=1)
@@ -245,6 +306,7 @@ def put_model(mjm: mujoco.MjModel) -> types.Model:
   m.site_quat = wp.array(mjm.site_quat, dtype=wp.quat, ndim=1)
   m.dof_bodyid = wp.array(mjm.dof_bodyid, dtype=wp.int32, ndim=1)
   m.dof_jntid = wp.array(mjm.dof_jntid, dtype=wp.int32, ndim=1)
+  m.dof_treeid = wp.array(mjm.dof_treeid, dtype=wp.int32, ndim=1)
   m.dof_parentid = wp.array(mjm.dof_parentid, dtype=wp.int32, ndim=1)
   m.dof_Madr = wp.array(mjm.dof_Madr, dtype=wp.int32, ndim=1)
   m.dof_armature = wp.array(mjm.dof_armature, dtype=wp.float32, ndim=1)
@@ -278,8 +340,258 @@ def put_model(mjm: mujoco.MjModel) -> types.Model:
   return m
 
 
+def _body_chain(mjm: mujoco.MjModel) -> list[list[int]]:
+  """Returns the dofs on the kinematic chain of each body, in increasing order.
+
+  These are the dofs that move the body. A body's dofs follow its parent's, so
+  each chain is its parent's chain followed by the body's own dofs.
+  """
+  chain = [[] for _ in range(mjm.nbody)]
+  for i in range(1, mjm.nbody):
+    dofadr, dofnum = mjm.body_dofadr[i], mjm.body_dofnum[i]
+    chain[i] = chain[mjm.body_parentid[i]] + list(range(dofadr, dofadr + dofnum))
+  return chain
+
+
+def _hfactor(mjm: mujoco.MjModel):
+  """Symbolic Cholesky factorization of the sparse Newton Hessian.
+
+  The Hessian qM + J^T D J is factored as L L^T in elimination order
+  e = nv - 1 - dofid, so that children are eliminated before their parents and
+  the tree structure of qM causes no fill-in. The sparsity pattern of J^T D J is
+  bounded by the dofs on the chains of every body pair that may collide.
+
+  Returns:
+    coladr, colnnz, rowind: CSC pattern of L, diagonal first in each column
+    parent: elimination tree parent of each column, -1 for roots
+    adr: (nv, nv) address of L[row, col] in rowind, -1 outside the pattern
+    level, leveladr: columns grouped by elimination tree level, leaves first
+    update: (L[i, k], L[j, k], L[i, j]) addresses of the updates applied once
+      column k is computed, sorted by the level of k, then by L[i, j], then by k
+    target, targetadr: (first update, number of updates) of each L[i, j] that
+      the columns of a level update, grouped by level
+    row, rowadr, rownnz: (address, column) of the strictly lower entries of
+      each row of L, sorted by column
+  """
+  nv = mjm.nv
+  chain = [set(c) for c in _body_chain(mjm)]
+
+  # bodies that may touch: each body with the world and with itself (qM, limits),
+  # and the bodies of geom pairs that pass the contype / conaffinity filter
+  body_pairs = {(i, i) for i in range(1, mjm.nbody)}
+  filt = (mjm.geom_contype[:, None] & mjm.geom_conaffinity[None, :]) != 0
+  g1, g2 = np.nonzero(filt | filt.T)
+  g1 = np.concatenate([g1, mjm.pair_geom1]).astype(int)
+  g2 = np.concatenate([g2, mjm.pair_geom2]).astype(int)
+  b1, b2 = mjm.geom_bodyid[g1], mjm.geom_bodyid[g2]
+  body_pairs.update(zip(np.minimum(b1, b2), np.maximum(b1, b2)))
+
+  # strictly lower neighbors of each column in elimination order
+  adj = [set() for _ in range(nv)]
+  cliques = {frozenset(chain[b1] | chain[b2]) for b1, b2 in body_pairs}
+  for clique in cliques:
+    elim = sorted(nv - 1 - i for i in clique)
+    for k, col in enumerate(elim):
+      adj[col].update(elim[k + 1 :])
+
+  # column patterns and elimination tree
+  struct = [set() for _ in range(nv)]
+  children = [[] for _ in range(nv)]
+  parent = np.full(nv, -1, dtype=int)
+  level = np.zeros(nv, dtype=int)
+  for col in range(nv):
+    struct[col] = set(adj[col])
+    for child in children[col]:
+      struct[col] |= struct[child] - {col}
+      level[col] = max(level[col], level[child] + 1)
+    if struct[col]:
+      parent[col] = min(struct[col])
+      children[parent[col]].append(col)
+
+  rows = [[col] + sorted(struct[col]) for col in range(nv)]
+  colnnz = np.array([len(r) for r in rows], dtype=int)
+  coladr = np.concatenate([[0], np.cumsum(colnnz)[:-1]]).astype(int)
+  rowind = np.concatenate(rows).astype(int)
+  adr = np.full((nv, nv), -1, dtype=int)
+  for col in range(nv):
+    adr[rows[col], col] = coladr[col] + np.arange(colnnz[col])
+
+  nlevel = level.max() + 1
+  levels = [np.flatnonzero(level == i) for i in range(nlevel)]
+  updates = [[] for _ in range(nlevel)]
+  for col in range(nv):
+    below = rows[col][1:]
+    for a, i in enumerate(below):
+      for j in below[: a + 1]:
+        updates[level[col]].append((adr[i, col], adr[j, col], adr[i, j]))
+
+  # the updates of one L[i, j] are applied in column order by a single thread
+  targets, update = [[] for _ in range(nlevel)], []
+  for lvl in range(nlevel):
+    updates[lvl].sort(key=lambda u: u[2])
+    for u in updates[lvl]:
+      if not targets[lvl] or update[-1][2] != u[2]:
+        targets[lvl].append([len(update), 0])
+      targets[lvl][-1][1] += 1
+      update.append(u)
+  update = np.array(update, dtype=int).reshape((-1, 3))
+  target = np.array([t for x in targets for t in x], dtype=int).reshape((-1, 2))
+
+  row = [[] for _ in range(nv)]
+  for col in range(nv):
+    for i in rows[col][1:]:
+      row[i].append((adr[i, col], col))
+  rownnz = np.array([len(r) for r in row], dtype=int)
+  rowadr = np.concatenate([[0], np.cumsum(rownnz)[:-1]]).astype(int)
+  row = np.array([r for x in row for r in x], dtype=int).reshape((-1, 2))
+
+  level_off = [0] + [len(x) for x in levels]
+  target_off = [0] + [len(x) for x in targets]
+
+  return (
+    coladr,
+    colnnz,
+    rowind,
+    parent,
+    adr,
+    np.concatenate(levels).astype(int),
+    np.cumsum(level_off)[:-1],
+    update,
+    target,
+    np.cumsum(target_off)[:-1],
+    row,
+    rowadr,
+    rownnz,
+  )
+
+
+# symbolic factors by model structure, shared by put_model and every make_data,
+# put_data and resize_data of a model
+_HFACTOR_CACHE = {}
+_HFACTOR_CACHE_SIZE = 8
+
+
+def _hfactor_cached(mjm: mujoco.MjModel):
+  """Returns _hfactor(mjm), computed once per kinematic tree and collision filter."""
+  key = (mjm.nv,) + tuple(
+    getattr(mjm, name).tobytes()
+    for name in (
+      "body_parentid",
+      "body_dofadr",
+      "body_dofnum",
+      "geom_bodyid",
+      "geom_contype",
+      "geom_conaffinity",
+      "pair_geom1",
+      "pair_geom2",
+    )
+  )
+  if key not in _HFACTOR_CACHE:
+    if len(_HFACTOR_CACHE) >= _HFACTOR_CACHE_SIZE:
+      _HFACTOR_CACHE.pop(next(iter(_HFACTOR_CACHE)))
+    _HFACTOR_CACHE[key] = _hfactor(mjm)
+  return _HFACTOR_CACHE[key]
+
+
+def _efc_J_rowmax(mjm: mujoco.MjModel) -> int:
+  """Returns the number of stored entries per efc_J row.
+
+  Rows narrower than nv store (value, column) pairs for dense and sparse models
+  alike, rows nv wide store the value of each dof.
+  """
+  # a contact row touches the dofs on the kinematic chains of two bodies
+  chain_dofnum = max(len(c) for c in _body_chain(mjm))
+
+  return max(1, min(mjm.nv, 2 * chain_dofnum))
+
+
+def _lspoint(nworld: int) -> types.LSPoint:
+  ls_pnt = types.LSPoint()
+  ls_pnt.alpha = wp.zeros((nworld,), dtype=wp.float32)
+  ls_pnt.cost = wp.zeros((nworld,), dtype=wp.float32)
+  ls_pnt.deriv_0 = wp.zeros((nworld,), dtype=wp.float32)
+  ls_pnt.deriv_1 = wp.zeros((nworld,), dtype=wp.float32)
+  return ls_pnt
+
+
+def _solver_workspace(
+  mjm: mujoco.MjModel, nworld: int, njmax: int, nefc_world: int
+) -> types.SolverWorkspace:
+  """Allocates the constraint solver scratch memory once per Data."""
+  ls = types.LSContext()
+  ls.p0 = _lspoint(nworld)
+  ls.lo = _lspoint(nworld)
+  ls.lo_next = _lspoint(nworld)
+  ls.hi = _lspoint(nworld)
+  ls.hi_next = _lspoint(nworld)
+  ls.mid = _lspoint(nworld)
+  ls.swap = wp.zeros((nworld,), dtype=wp.int32)
+  ls.ls_iter = wp.zeros((nworld,), dtype=wp.int32)
+  ls.done = wp.zeros((nworld,), dtype=wp.int32)
+  ls.nsolving = wp.zeros((1,), dtype=wp.int32)
+  # segmented sort needs twice the number of keys
+  ls.breakpoint = wp.zeros((2 * njmax,), dtype=wp.float32)
+  ls.breakpoint_efcid = wp.zeros((2 * njmax,), dtype=wp.int32)
+  ls.efc_end = wp.zeros((nworld,), dtype=wp.int32)
+
+  ctx = types.SolverWorkspace()
+  ctx.Jaref = wp.zeros((njmax,), dtype=wp.float32)
+  ctx.Ma = wp.zeros((nworld, mjm.nv), dtype=wp.float32)
+  ctx.grad = wp.zeros((nworld, mjm.nv), dtype=wp.float32)
+  ctx.grad_dot = wp.zeros((nworld,), dtype=wp.float32)
+  ctx.Mgrad = wp.zeros((nworld, mjm.nv), dtype=wp.float32)
+  ctx.search = wp.zeros((nworld, mjm.nv), dtype=wp.float32)
+  ctx.search_dot = wp.zeros((nworld,), dtype=wp.float32)
+  ctx.gauss = wp.zeros((nworld,), dtype=wp.float32)
+  ctx.cost = wp.zeros((nworld,), dtype=wp.float32)
+  ctx.prev_cost = wp.zeros((nworld,), dtype=wp.float32)
+  ctx.active = wp.zeros((njmax,), dtype=wp.int32)
+  ctx.prev_active = wp.zeros((njmax,), dtype=wp.int32)
+  ctx.gtol = wp.zeros((nworld,), dtype=wp.float32)
+  ctx.mv = wp.zeros((nworld, mjm.nv), dtype=wp.float32)
+  ctx.jv = wp.zeros((njmax,), dtype=wp.float32)
+  ctx.quad = wp.zeros((njmax,), dtype=wp.vec3f)
+  ctx.quad_gauss = wp.zeros((nworld,), dtype=wp.vec3f)
+  # sparse models assemble and factor the Newton Hessian in place in the
+  # pattern of _hfactor, dense models keep the full matrices
+  nv_dense = 0 if support.is_sparse(mjm) else mjm.nv
+  nnz_sparse = len(_hfactor_cached(mjm)[2]) if support.is_sparse(mjm) else 0
+  ctx.h = wp.zeros((nworld, nv_dense, nv_dense), dtype=wp.float32)
+  ctx.hfactor = wp.zeros((nworld, nv_dense, nv_dense), dtype=wp.float32)
+  ctx.hfactor_sparse = wp.zeros((nworld, nnz_sparse), dtype=wp.float32)
+  ctx.hupdate = wp.zeros((nworld, mjm.nv), dtype=wp.float32)
+  ctx.precond = wp.zeros((nworld, mjm.nv), dtype=wp.float32)
+  # rows of M^-1 @ efc_J.T for PGS, and each row's entries of the diagonal block
+  # of J M^-1 J^T + R over the rows of its elliptic cone, (AR_ii, 0, 0) otherwise
+  ndual = support.dual_nefc(mjm, nefc_world)
+  nv_pgs = mjm.nv if mjm.opt.solver == mujoco.mjtSolver.mjSOL_PGS or ndual else 0
+  ctx.MinvJT = wp.zeros((njmax, nv_pgs), dtype=wp.float32)
+  ctx.AR_diag = wp.zeros((njmax,), dtype=wp.vec3)
+  # per world Delassus matrix, Newton system and right hand side of the
+  # constraint space Newton solve, see solver._newton_dual
+  ctx.dual_A = wp.zeros((nworld, ndual, ndual), dtype=wp.float32)
+  ctx.dual_S = wp.zeros((nworld, ndual, ndual), dtype=wp.float32)
+  ctx.dual_b = wp.zeros((nworld, ndual), dtype=wp.float32)
+  ctx.dual = wp.zeros((nworld,), dtype=wp.int32)
+  ctx.refactor = wp.zeros((nworld,), dtype=wp.int32)
+  ctx.alpha = wp.zeros((nworld,), dtype=wp.float32)
+  ctx.prev_grad = wp.zeros((nworld, mjm.nv), dtype=wp.float32)
+  ctx.prev_Mgrad = wp.zeros((nworld, mjm.nv), dtype=wp.float32)
+  ctx.beta = wp.zeros((nworld,), dtype=wp.float32)
+  ctx.done = wp.zeros((nworld,), dtype=wp.int32)
+  ctx.nsolving = wp.zeros((1,), dtype=wp.int32)
+  ctx.ls = ls
+
+  return ctx
+
+
 def make_data(
-  mjm: mujoco.MjModel, nworld: int = 1, nconmax: int = -1, njmax: int = -1
+  mjm: mujoco.MjModel,
+  nworld: int = 1,
+  nconmax: int = -1,
+  njmax: int = -1,
+  max_num_overlaps_per_world: int = -1,
+  nefc_world: int = -1,
 ) -> types.Data:
   d = types.Data()
   d.nworld = nworld
@@ -298,6 +610,7 @@ def make_data(
 
   d.ncon = 0
   d.nefc = wp.zeros(nworld, dtype=wp.int32)
+  d.efc_adr = wp.zeros(nworld, dtype=wp.int32)
   d.nl = 0
   d.time = 0.0
 
@@ -361,16 +674,38 @@ def make_data(
   d.qfrc_smooth = wp.zeros((nworld, mjm.nv), dtype=wp.float32)
   d.qfrc_constraint = wp.zeros((nworld, mjm.nv), dtype=wp.float32)
   d.qacc_smooth = wp.zeros((nworld, mjm.nv), dtype=wp.float32)
-  d.efc_J = wp.zeros((njmax, mjm.nv), dtype=wp.float32)
+  d.efc_type = wp.zeros((njmax,), dtype=wp.int32)
+  d.efc_id = wp.zeros((njmax,), dtype=wp.int32)
+  efc_J_rowmax = _efc_J_rowmax(mjm)
+  d.efc_J = wp.zeros((njmax, efc_J_rowmax), dtype=wp.float32)
+  d.efc_J_rownnz = wp.zeros((njmax,), dtype=wp.int32)
+  d.efc_J_colind = wp.zeros((njmax, efc_J_rowmax), dtype=wp.int32)
   d.efc_D = wp.zeros((njmax,), dtype=wp.float32)
   d.efc_pos = wp.zeros((njmax,), dtype=wp.float32)
   d.efc_aref = wp.zeros((njmax,), dtype=wp.float32)
   d.efc_force = wp.zeros((njmax,), dtype=wp.float32)
   d.efc_margin = wp.zeros((njmax,), dtype=wp.float32)
   d.efc_worldid = wp.zeros((njmax,), dtype=wp.int32)
+  d.nisland = wp.zeros((nworld,), dtype=wp.int32)
+  d.tree_island = wp.full((nworld, mjm.ntree), -1, dtype=wp.int32)
+  d.dof_island = wp.full((nworld, mjm.nv), -1, dtype=wp.int32)
+  d.dof_islandind = wp.full((nworld, mjm.nv), -1, dtype=wp.int32)
+  d.island_dofadr = wp.zeros((nworld, mjm.ntree), dtype=wp.int32)
+  d.island_dofnum = wp.zeros((nworld, mjm.ntree), dtype=wp.int32)
+  d.island_dofind = wp.full((nworld, mjm.nv), -1, dtype=wp.int32)
+  d.efc_island = wp.full((njmax,), -1, dtype=wp.int32)
 
   d.xfrc_applied = wp.zeros((nworld, mjm.nbody), dtype=wp.spatial_vector)
 
+  d.warning = wp.zeros((len(types.WarningType),), dtype=wp.int32)
+  d.efc_overflow = wp.zeros((nworld,), dtype=wp.int32)
+
+  d.solver_niter = wp.zeros((nworld,), dtype=wp.int32)
+  d.solver_improvement = wp.zeros((nworld,), dtype=wp.float32)
+  d.solver_gradient = wp.zeros((nworld,), dtype=wp.float32)
+  d.solver_nls = wp.zeros((nworld,), dtype=wp.int32)
+  d.solver_nactive = wp.zeros((nworld,), dtype=wp.int32)
+
   # internal tmp arrays
   d.qfrc_integration = wp.zeros((nworld, mjm.nv), dtype=wp.float32)
   d.qacc_integration = wp.zeros((nworld, mjm.nv), dtype=wp.float32)
@@ -378,11 +713,18 @@ def make_data(
   d.qLD_integration = wp.zeros_like(d.qLD)
   d.qLDiagInv_integration = wp.zeros_like(d.qLDiagInv)
   d.act_vel_integration = wp.zeros_like(d.ctrl)
+  d.con_sort_key = wp.zeros((2 * nconmax,), dtype=wp.float32)
+  d.con_sort_id = wp.zeros((2 * nconmax,), dtype=wp.int32)
+  d.con_sort_rows = wp.zeros((nconmax,), dtype=wp.int32)
+
+  # without a bound on the rows of a world Newton solves in dof space
+  d.solver_workspace = _solver_workspace(mjm, nworld, njmax, nefc_world)
 
   # the result of the broadphase gets stored in this array
-  d.max_num_overlaps_per_world = (
-    mjm.ngeom * (mjm.ngeom - 1) // 2
-  )  # TODO: this is a hack to estimate the maximum number of overlaps per world
+  if max_num_overlaps_per_world == -1:
+    # TODO: this is a hack to estimate the maximum number of overlaps per world
+    max_num_overlaps_per_world = mjm.ngeom * (mjm.ngeom - 1) // 2
+  d.max_num_overlaps_per_world = max_num_overlaps_per_world
   d.broadphase_pairs = wp.zeros((nworld, d.max_num_overlaps_per_world), dtype=wp.vec2i)
   d.result_count = wp.zeros(nworld, dtype=wp.int32)
 
@@ -411,6 +753,8 @@ def put_data(
   nworld: int = 1,
   nconmax: int = -1,
   njmax: int = -1,
+  max_num_overlaps_per_world: int = -1,
+  nefc_world: int = -1,
 ) -> types.Data:
   d = types.Data()
   d.nworld = nworld
@@ -427,11 +771,15 @@ def put_data(
     njmax = max(512, mjd.nefc * nworld)
   d.njmax = njmax
 
+  if nworld * mjd.ncon > nconmax:
+    raise ValueError("nworld * ncon > nconmax")
+
   if nworld * mjd.nefc > njmax:
     raise ValueError("nworld * nefc > njmax")
 
   d.nl = mjd.nl
-  d.nefc = wp.zeros(1, dtype=wp.int32)
+  d.nefc = wp.full(nworld, mjd.nefc, dtype=wp.int32)
+  d.efc_adr = wp.array(np.arange(nworld) * mjd.nefc, dtype=wp.int32)
   d.time = mjd.time
 
   # TODO(erikfrey): would it be better to tile on the gpu?
@@ -441,15 +789,37 @@ def put_data(
   if support.is_sparse(mjm):
     qM = np.expand_dims(mjd.qM, axis=0)
     qLD = np.expand_dims(mjd.qLD, axis=0)
-    efc_J = np.zeros((mjd.nefc, mjm.nv))
+    efc_J_dense = np.zeros((mjd.nefc, mjm.nv))
     mujoco.mju_sparse2dense(
-      efc_J, mjd.efc_J, mjd.efc_J_rownnz, mjd.efc_J_rowadr, mjd.efc_J_colind
+      efc_J_dense,
+      mjd.efc_J,
+      mjd.efc_J_rownnz,
+      mjd.efc_J_rowadr,
+      mjd.efc_J_colind,
     )
   else:
     qM = np.zeros((mjm.nv, mjm.nv))
     mujoco.mj_fullM(mjm, qM, mjd.qM)
     qLD = np.linalg.cholesky(qM)
-    efc_J = mjd.efc_J.reshape((mjd.nefc, mjm.nv))
+    efc_J_dense = mjd.efc_J.reshape((mjd.nefc, mjm.nv))
+
+  # efc_J rows store the value of each dof, or up to efc_J_rowmax (value, column)
+  # pairs if that is fewer
+  efc_J_rowmax = _efc_J_rowmax(mjm)
+  if efc_J_rowmax == mjm.nv:
+    efc_J = efc_J_dense
+    efc_J_rownnz = np.full(mjd.nefc, mjm.nv)
+    efc_J_colind = np.tile(np.arange(mjm.nv), (mjd.nefc, 1))
+  else:
+    efc_J = np.zeros((mjd.nefc, efc_J_rowmax))
+    efc_J_colind = np.zeros((mjd.nefc, efc_J_rowmax), dtype=int)
+    efc_J_rownnz = np.count_nonzero(efc_J_dense, axis=1)
+    if np.any(efc_J_rownnz > efc_J_rowmax):
+      raise ValueError("efc_J row has more nonzeros than efc_J_rowmax")
+    for i in range(mjd.nefc):
+      colind = np.flatnonzero(efc_J_dense[i])
+      efc_J[i, : colind.size] = efc_J_dense[i, colind]
+      efc_J_colind[i, : colind.size] = colind
 
   # TODO(taylorhowell): sparse actuator_moment
   actuator_moment = np.zeros((mjm.nu, mjm.nv))
@@ -507,32 +877,46 @@ def put_data(
 
   nefc = mjd.nefc
   efc_worldid = np.zeros(njmax, dtype=int)
+  efc_type = np.zeros(njmax, dtype=int)
+  efc_id = np.zeros(njmax, dtype=int)
 
+  # contact rows refer to the contact of the same world
+  efc_contact = np.isin(
+    mjd.efc_type,
+    [types.ConstraintType.CONTACT_PYRAMIDAL, types.ConstraintType.CONTACT_ELLIPTIC],
+  )
   for i in range(nworld):
     efc_worldid[i * nefc : (i + 1) * nefc] = i
+    efc_type[i * nefc : (i + 1) * nefc] = mjd.efc_type
+    efc_id[i * nefc : (i + 1) * nefc] = mjd.efc_id + efc_contact * i * mjd.ncon
 
   nefc_fill = njmax - nworld * nefc
 
   efc_J_fill = np.vstack(
-    [np.repeat(efc_J, nworld, axis=0), np.zeros((nefc_fill, mjm.nv))]
-  )
-  efc_D_fill = np.concatenate(
-    [np.repeat(mjd.efc_D, nworld, axis=0), np.zeros(nefc_fill)]
+    [np.tile(efc_J, (nworld, 1)), np.zeros((nefc_fill, efc_J_rowmax))]
   )
-  efc_pos_fill = np.concatenate(
-    [np.repeat(mjd.efc_pos, nworld, axis=0), np.zeros(nefc_fill)]
+  efc_J_rownnz_fill = np.concatenate(
+    [np.tile(efc_J_rownnz, nworld), np.zeros(nefc_fill, dtype=int)]
   )
-  efc_aref_fill = np.concatenate(
-    [np.repeat(mjd.efc_aref, nworld, axis=0), np.zeros(nefc_fill)]
-  )
-  efc_force_fill = np.concatenate(
-    [np.repeat(mjd.efc_force, nworld, axis=0), np.zeros(nefc_fill)]
+  efc_J_colind_fill = np.vstack(
+    [
+      np.tile(efc_J_colind, (nworld, 1)),
+      np.zeros((nefc_fill, efc_J_rowmax), dtype=int),
+    ]
   )
+  efc_D_fill = np.concatenate([np.tile(mjd.efc_D, nworld), np.zeros(nefc_fill)])
+  efc_pos_fill = np.concatenate([np.tile(mjd.efc_pos, nworld), np.zeros(nefc_fill)])
+  efc_aref_fill = np.concatenate([np.tile(mjd.efc_aref, nworld), np.zeros(nefc_fill)])
+  efc_force_fill = np.concatenate([np.tile(mjd.efc_force, nworld), np.zeros(nefc_fill)])
   efc_margin_fill = np.concatenate(
-    [np.repeat(mjd.efc_margin, nworld, axis=0), np.zeros(nefc_fill)]
+    [np.tile(mjd.efc_margin, nworld), np.zeros(nefc_fill)]
   )
 
+  d.efc_type = wp.array(efc_type, dtype=wp.int32, ndim=1)
+  d.efc_id = wp.array(efc_id, dtype=wp.int32, ndim=1)
   d.efc_J = wp.array(efc_J_fill, dtype=wp.float32, ndim=2)
+  d.efc_J_rownnz = wp.array(efc_J_rownnz_fill, dtype=wp.int32, ndim=1)
+  d.efc_J_colind = wp.array(efc_J_colind_fill, dtype=wp.int32, ndim=2)
   d.efc_D = wp.array(efc_D_fill, dtype=wp.float32, ndim=1)
   d.efc_pos = wp.array(efc_pos_fill, dtype=wp.float32, ndim=1)
   d.efc_aref = wp.array(efc_aref_fill, dtype=wp.float32, ndim=1)
@@ -540,45 +924,74 @@ def put_data(
   d.efc_margin = wp.array(efc_margin_fill, dtype=wp.float32, ndim=1)
   d.efc_worldid = wp.from_numpy(efc_worldid, dtype=wp.int32)
 
+  # mjData only holds islands when discovery is enabled
+  nisland = 0
+  tree_island = np.full(mjm.ntree, -1)
+  dof_island = np.full(mjm.nv, -1)
+  dof_islandind = np.full(mjm.nv, -1)
+  island_dofadr = np.zeros(mjm.ntree, dtype=int)
+  island_dofnum = np.zeros(mjm.ntree, dtype=int)
+  island_dofind = np.full(mjm.nv, -1)
+  efc_island = np.full(nefc, -1)
+  if mjm.opt.enableflags & types.EnableBit.ISLAND:
+    nisland = mjd.nisland
+    tree_island[mjm.dof_treeid] = mjd.dof_island
+    dof_island = mjd.dof_island
+    dof_islandind = mjd.dof_islandind
+    island_dofadr[:nisland] = mjd.island_dofadr
+    island_dofnum[:nisland] = mjd.island_dofnum
+    island_dofind = mjd.island_dofind
+    efc_island = mjd.efc_island
+  efc_island_fill = np.concatenate(
+    [np.tile(efc_island, nworld), np.full(nefc_fill, -1)]
+  )
+
+  d.nisland = wp.full(nworld, nisland, dtype=wp.int32)
+  d.tree_island = wp.array(tile(tree_island), dtype=wp.int32, ndim=2)
+  d.dof_island = wp.array(tile(dof_island), dtype=wp.int32, ndim=2)
+  d.dof_islandind = wp.array(tile(dof_islandind), dtype=wp.int32, ndim=2)
+  d.island_dofadr = wp.array(tile(island_dofadr), dtype=wp.int32, ndim=2)
+  d.island_dofnum = wp.array(tile(island_dofnum), dtype=wp.int32, ndim=2)
+  d.island_dofind = wp.array(tile(island_dofind), dtype=wp.int32, ndim=2)
+  d.efc_island = wp.array(efc_island_fill, dtype=wp.int32, ndim=1)
+
   ncon = mjd.ncon
   con_efc_address = np.zeros(nconmax, dtype=int)
   con_worldid = np.zeros(nconmax, dtype=int)
 
   for i in range(nworld):
-    con_efc_address[i * ncon : (i + 1) * ncon] = mjd.contact.efc_address + i * ncon
+    con_efc_address[i * ncon : (i + 1) * ncon] = mjd.contact.efc_address + i * nefc
     con_worldid[i * ncon : (i + 1) * ncon] = i
 
   ncon_fill = nconmax - nworld * ncon
 
   con_dist_fill = np.concatenate(
-    [np.repeat(mjd.contact.dist, nworld, axis=0), np.zeros(ncon_fill)]
+    [np.tile(mjd.contact.dist, nworld), np.zeros(ncon_fill)]
   )
   con_pos_fill = np.vstack(
-    [np.repeat(mjd.contact.pos, nworld, axis=0), np.zeros((ncon_fill, 3))]
+    [np.tile(mjd.contact.pos, (nworld, 1)), np.zeros((ncon_fill, 3))]
   )
   con_frame_fill = np.vstack(
-    [np.repeat(mjd.contact.frame, nworld, axis=0), np.zeros((ncon_fill, 9))]
+    [np.tile(mjd.contact.frame, (nworld, 1)), np.zeros((ncon_fill, 9))]
   )
   con_includemargin_fill = np.concatenate(
-    [np.repeat(mjd.contact.includemargin, nworld, axis=0), np.zeros(ncon_fill)]
+    [np.tile(mjd.contact.includemargin, nworld), np.zeros(ncon_fill)]
   )
   con_friction_fill = np.vstack(
-    [np.repeat(mjd.contact.friction, nworld, axis=0), np.zeros((ncon_fill, 5))]
+    [np.tile(mjd.contact.friction, (nworld, 1)), np.zeros((ncon_fill, 5))]
   )
   con_solref_fill = np.vstack(
-    [np.repeat(mjd.contact.solref, nworld, axis=0), np.zeros((ncon_fill, 2))]
+    [np.tile(mjd.contact.solref, (nworld, 1)), np.zeros((ncon_fill, 2))]
   )
   con_solreffriction_fill = np.vstack(
-    [np.repeat(mjd.contact.solreffriction, nworld, axis=0), np.zeros((ncon_fill, 2))]
+    [np.tile(mjd.contact.solreffriction, (nworld, 1)), np.zeros((ncon_fill, 2))]
   )
   con_solimp_fill = np.vstack(
-    [np.repeat(mjd.contact.solimp, nworld, axis=0), np.zeros((ncon_fill, 5))]
-  )
-  con_dim_fill = np.concatenate(
-    [np.repeat(mjd.contact.dim, nworld, axis=0), np.zeros(ncon_fill)]
+    [np.tile(mjd.contact.solimp, (nworld, 1)), np.zeros((ncon_fill, 5))]
   )
+  con_dim_fill = np.concatenate([np.tile(mjd.contact.dim, nworld), np.zeros(ncon_fill)])
   con_geom_fill = np.vstack(
-    [np.repeat(mjd.contact.geom, nworld, axis=0), np.zeros((ncon_fill, 2))]
+    [np.tile(mjd.contact.geom, (nworld, 1)), np.zeros((ncon_fill, 2))]
   )
 
   d.contact.dist = wp.array(con_dist_fill, dtype=wp.float32, ndim=1)
@@ -595,6 +1008,24 @@ def put_data(
   d.contact.worldid = wp.array(con_worldid, dtype=wp.int32, ndim=1)
 
   d.xfrc_applied = wp.array(tile(mjd.xfrc_applied), dtype=wp.spatial_vector, ndim=2)
+
+  d.warning = wp.zeros((len(types.WarningType),), dtype=wp.int32)
+  d.efc_overflow = wp.zeros((nworld,), dtype=wp.int32)
+
+  # MuJoCo reports linesearch evaluations rather than iterations, so nls is
+  # left at zero
+  niter = mjd.solver_niter[0]
+  stat = mjd.solver[niter - 1] if niter else None
+  d.solver_niter = wp.full((nworld,), niter, dtype=wp.int32)
+  d.solver_improvement = wp.full(
+    (nworld,), stat.improvement if stat else 0.0, dtype=wp.float32
+  )
+  d.solver_gradient = wp.full(
+    (nworld,), stat.gradient if stat else 0.0, dtype=wp.float32
+  )
+  d.solver_nls = wp.zeros((nworld,), dtype=wp.int32)
+  d.solver_nactive = wp.full((nworld,), stat.nactive if stat else 0, dtype=wp.int32)
+
   # internal tmp arrays
   d.qfrc_integration = wp.zeros((nworld, mjm.nv), dtype=wp.float32)
   d.qacc_integration = wp.zeros((nworld, mjm.nv), dtype=wp.float32)
@@ -602,9 +1033,19 @@ def put_data(
   d.qLD_integration = wp.zeros_like(d.qLD)
   d.qLDiagInv_integration = wp.zeros_like(d.qLDiagInv)
   d.act_vel_integration = wp.zeros_like(d.ctrl)
+  d.con_sort_key = wp.zeros((2 * nconmax,), dtype=wp.float32)
+  d.con_sort_id = wp.zeros((2 * nconmax,), dtype=wp.int32)
+  d.con_sort_rows = wp.zeros((nconmax,), dtype=wp.int32)
+
+  # the rows of mjd bound the rows of a world unless a bound is given
+  if nefc_world == -1:
+    nefc_world = mjd.nefc
+  d.solver_workspace = _solver_workspace(mjm, nworld, njmax, nefc_world)
 
   # the result of the broadphase gets stored in this array
-  d.max_num_overlaps_per_world = mjm.ngeom * (mjm.ngeom - 1) // 2
+  if max_num_overlaps_per_world == -1:
+    max_num_overlaps_per_world = mjm.ngeom * (mjm.ngeom - 1) // 2
+  d.max_num_overlaps_per_world = max_num_overlaps_per_world
   d.broadphase_pairs = wp.zeros((nworld, d.max_num_overlaps_per_world), dtype=wp.vec2i)
   d.result_count = wp.zeros(nworld, dtype=wp.int32)
 
@@ -625,3 +1066,172 @@ def put_data(
   )
 
   return d
+
+
+def _resize(a: wp.array, shape: tuple[int, ...], fill=0) -> wp.array:
+  """Returns a copy of a with the given shape, keeping the overlapping entries."""
+  src = a.numpy()
+  dst = np.full(shape + src.shape[a.ndim :], fill, dtype=src.dtype)
+  keep = tuple(slice(0, min(n, k)) for n, k in zip(a.shape, shape))
+  dst[keep] = src[keep]
+  return wp.array(dst, dtype=a.dtype, device=a.device)
+
+
+def resize_data(
+  mjm: mujoco.MjModel,
+  d: types.Data,
+  nconmax: int = -1,
+  njmax: int = -1,
+  max_num_overlaps_per_world: int = -1,
+  nefc_world: int = -1,
+) -> types.Data:
+  """Resizes the contact, constraint and broadphase buffers of d in place.
+
+  Sizes of -1 are kept. Entries that fit in the new buffers are kept, the
+  solver scratch memory is reallocated. nefc_world bounds the rows of a world
+  for the constraint space Newton solve, see support.dual_nefc.
+
+  The resized buffers are new allocations: CUDA graphs captured with d, and
+  kernels launched with its old arrays, must be captured again.
+  """
+  if nconmax != -1 and nconmax != d.nconmax:
+    d.nconmax = nconmax
+    c = d.contact
+    c.dist = _resize(c.dist, (nconmax,))
+    c.pos = _resize(c.pos, (nconmax,))
+    c.frame = _resize(c.frame, (nconmax,))
+    c.includemargin = _resize(c.includemargin, (nconmax,))
+    c.friction = _resize(c.friction, (nconmax,))
+    c.solref = _resize(c.solref, (nconmax,))
+    c.solreffriction = _resize(c.solreffriction, (nconmax,))
+    c.solimp = _resize(c.solimp, (nconmax,))
+    c.dim = _resize(c.dim, (nconmax,))
+    c.geom = _resize(c.geom, (nconmax,))
+    c.efc_address = _resize(c.efc_address, (nconmax,))
+    c.worldid = _resize(c.worldid, (nconmax,))
+    ncon_total = min(int(d.ncon_total.numpy()[0]), nconmax)
+    d.ncon_total = wp.array([ncon_total], dtype=wp.int32, ndim=1)
+    d.con_sort_key = wp.zeros((2 * nconmax,), dtype=wp.float32)
+    d.con_sort_id = wp.zeros((2 * nconmax,), dtype=wp.int32)
+    d.con_sort_rows = wp.zeros((nconmax,), dtype=wp.int32)
+
+  if njmax != -1 and njmax != d.njmax:
+    d.njmax = njmax
+    rowmax = d.efc_J.shape[1]
+    d.efc_type = _resize(d.efc_type, (njmax,))
+    d.efc_id = _resize(d.efc_id, (njmax,))
+    d.efc_J = _resize(d.efc_J, (njmax, rowmax))
+    d.efc_J_rownnz = _resize(d.efc_J_rownnz, (njmax,))
+    d.efc_J_colind = _resize(d.efc_J_colind, (njmax, rowmax))
+    d.efc_D = _resize(d.efc_D, (njmax,))
+    d.efc_pos = _resize(d.efc_pos, (njmax,))
+    d.efc_aref = _resize(d.efc_aref, (njmax,))
+    d.efc_force = _resize(d.efc_force, (njmax,))
+    d.efc_margin = _resize(d.efc_margin, (njmax,))
+    d.efc_worldid = _resize(d.efc_worldid, (njmax,))
+    d.efc_island = _resize(d.efc_island, (njmax,), fill=-1)
+
+  if njmax != -1 or nefc_world != -1:
+    if nefc_world == -1:
+      nefc_world = d.solver_workspace.dual_A.shape[1]
+    d.solver_workspace = _solver_workspace(mjm, d.nworld, d.njmax, nefc_world)
+
+  if max_num_overlaps_per_world != -1:
+    d.max_num_overlaps_per_world = max_num_overlaps_per_world
+    d.broadphase_pairs = _resize(
+      d.broadphase_pairs, (d.nworld, max_num_overlaps_per_world)
+    )
+
+  return d
+
+
+def _count_overlaps(mjm: mujoco.MjModel, mjd: mujoco.MjData) -> int:
+  """Counts the geom pairs with overlapping bounding boxes as the broadphase does."""
+  center = np.einsum(
+    "gij,gj->gi", mjd.geom_xmat.reshape(-1, 3, 3), mjm.geom_aabb[:, :3]
+  )
+  center += mjd.geom_xpos
+  extents = np.einsum(
+    "gi,gij->gj", mjm.geom_aabb[:, 3:], np.abs(mjd.geom_xmat.reshape(-1, 3, 3))
+  )
+  lo, hi = center - 0.5 * extents, center + 0.5 * extents
+  overlap = np.all((lo[:, None] <= hi[None, :]) & (lo[None, :] <= hi[:, None]), axis=-1)
+  return int(np.triu(overlap, k=1).sum())
+
+
+def _count_efc(mjm: mujoco.MjModel, mjd: mujoco.MjData) -> int:
+  """Counts the constraint rows of mjd that mjx builds.
+
+  MuJoCo also emits equality, friction loss, tendon limit and other rows, mjx
+  only builds slide and hinge joint limits and condim 3 contacts.
+  """
+  efc_type = mjd.efc_type[: mjd.nefc]
+  efc_id = mjd.efc_id[: mjd.nefc]
+
+  limit = efc_type == mujoco.mjtConstraint.mjCNSTR_LIMIT_JOINT
+  jnt_type = mjm.jnt_type[efc_id[limit]]
+  nlimit = np.sum(
+    (jnt_type == mujoco.mjtJoint.mjJNT_SLIDE)
+    | (jnt_type == mujoco.mjtJoint.mjJNT_HINGE)
+  )
+
+  contact = (efc_type == mujoco.mjtConstraint.mjCNSTR_CONTACT_PYRAMIDAL) | (
+    efc_type == mujoco.mjtConstraint.mjCNSTR_CONTACT_ELLIPTIC
+  )
+  ncontact = np.sum(mjd.contact.dim[efc_id[contact]] == 3)
+
+  return int(nlimit + ncontact)
+
+
+def buffer_sizes(
+  mjm: mujoco.MjModel,
+  mjd: mujoco.MjData = None,
+  nworld: int = 1,
+  nsample: int = 8,
+  nstep: int = 100,
+  noise: float = 0.01,
+  margin: float = 1.5,
+  seed: int = 0,
+) -> dict[str, int]:
+  """Recommends buffer sizes from short randomized rollouts.
+
+  Rolls out nsample worlds for nstep steps with MuJoCo from mjd (or the reset
+  state), with the initial qpos and qvel perturbed by gaussian noise of scale
+  noise and random controls. The peak number of contacts, constraint rows and
+  broadphase overlaps of any world is scaled by margin, the result can be passed
+  to make_data, put_data or resize_data as keyword arguments. Rows are counted
+  as mjx builds them, see _count_efc. The peak rows of a world also bound the
+  constraint space Newton solve, see support.dual_nefc.
+  """
+  rng = np.random.default_rng(seed)
+  ctrlrange = mjm.actuator_ctrlrange
+  limited = mjm.actuator_ctrllimited.astype(bool)
+
+  ncon, nefc, noverlap = 0, 0, 0
+  for _ in range(nsample):
+    sample = mujoco.MjData(mjm)
+    if mjd is not None:
+      sample.qpos[:] = mjd.qpos
+      sample.qvel[:] = mjd.qvel
+      sample.act[:] = mjd.act
+    sample.qpos[:] += noise * rng.standard_normal(mjm.nq)
+    mujoco.mj_normalizeQuat(mjm, sample.qpos)
+    sample.qvel[:] += noise * rng.standard_normal(mjm.nv)
+
+    for _ in range(nstep):
+      ctrl = rng.standard_normal(mjm.nu)
+      sample.ctrl[:] = np.where(
+        limited, rng.uniform(ctrlrange[:, 0], ctrlrange[:, 1]), ctrl
+      )
+      mujoco.mj_step(mjm, sample)
+      ncon = max(ncon, sample.ncon)
+      nefc = max(nefc, _count_efc(mjm, sample))
+      noverlap = max(noverlap, _count_overlaps(mjm, sample))
+
+  npair = mjm.ngeom * (mjm.ngeom - 1) // 2
+  return {
+    "nconmax": max(1, int(np.ceil(margin * ncon)) * nworld),
+    "njmax": max(1, int(np.ceil(margin * nefc)) * nworld),
+    "max_num_overlaps_per_world": max(1, min(npair, int(np.ceil(margin * noverlap)))),
+    "nefc_world": max(1, int(np.ceil(margin * nefc))),
+  }
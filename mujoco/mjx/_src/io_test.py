@@ -0,0 +1,128 @@
+# Copyright 2025 The Physics-Next Project Developers
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+"""Tests for io functions."""
+
+from unittest import mock
+
+import numpy as np
+from absl.testing import absltest
+
+import mujoco
+from mujoco import mjx
+
+from . import io, test_util
+
+
+class IOTest(absltest.TestCase):
+  def test_buffer_sizes(self):
+    """Tests that the recommended sizes cover the sampled worlds."""
+    mjm, mjd, _, _ = test_util.fixture("constraints.xml", sparse=False)
+    mujoco.mj_resetDataKeyframe(mjm, mjd, 2)
+    mujoco.mj_forward(mjm, mjd)
+
+    sizes = mjx.buffer_sizes(mjm, mjd, nworld=4, nsample=2, nstep=5, margin=1.0)
+    self.assertGreaterEqual(sizes["nconmax"], 4 * mjd.ncon)
+    self.assertGreaterEqual(sizes["njmax"], 4 * mjd.nefc)
+    self.assertLessEqual(
+      sizes["max_num_overlaps_per_world"], mjm.ngeom * (mjm.ngeom - 1) // 2
+    )
+
+    d = mjx.make_data(mjm, nworld=4, **sizes)
+    self.assertEqual(d.nconmax, sizes["nconmax"])
+    self.assertEqual(d.njmax, sizes["njmax"])
+    self.assertEqual(d.broadphase_pairs.shape, (4, sizes["max_num_overlaps_per_world"]))
+
+  def test_buffer_sizes_rows(self):
+    """Tests that the recommended rows count only the rows mjx builds."""
+    mjm = mujoco.MjModel.from_xml_string("""
+      <mujoco>
+        <worldbody>
+          <body>
+            <joint name="hinge" limited="true" range="0.1 1" frictionloss="0.1"/>
+            <geom type="capsule" size="0.05" fromto="0 0 0 1 0 0"/>
+            <body pos="1 0 0">
+              <joint type="slide" axis="1 0 0" frictionloss="0.1"/>
+              <geom size="0.05"/>
+            </body>
+          </body>
+        </worldbody>
+        <equality>
+          <joint joint1="hinge" polycoef="0.5 0 0 0 0"/>
+        </equality>
+      </mujoco>
+    """)
+    mjd = mujoco.MjData(mjm)
+    mujoco.mj_forward(mjm, mjd)
+
+    # MuJoCo adds an equality and two friction loss rows to the hinge limit
+    self.assertEqual(mjd.nefc, 4)
+    self.assertEqual(io._count_efc(mjm, mjd), 1)
+
+    sizes = io.buffer_sizes(mjm, mjd, nworld=2, nsample=1, nstep=1, margin=1.0)
+    self.assertEqual(sizes["njmax"], 2)
+    self.assertEqual(sizes["nefc_world"], 1)
+
+  def test_resize_data(self):
+    """Tests that resizing keeps the contacts and constraint rows that fit."""
+    mjm, mjd, _, _ = test_util.fixture("constraints.xml", sparse=False)
+    mujoco.mj_resetDataKeyframe(mjm, mjd, 2)
+    mujoco.mj_forward(mjm, mjd)
+
+    m = mjx.put_model(mjm)
+    d = mjx.put_data(mjm, mjd)
+    mjx.resize_data(
+      mjm, d, nconmax=mjd.ncon, njmax=2 * mjd.nefc, max_num_overlaps_per_world=3
+    )
+
+    self.assertEqual(d.contact.dist.shape, (mjd.ncon,))
+    self.assertEqual(d.con_sort_key.shape, (2 * mjd.ncon,))
+    self.assertEqual(d.efc_D.shape, (2 * mjd.nefc,))
+    self.assertEqual(d.solver_workspace.Jaref.shape, (2 * mjd.nefc,))
+    self.assertEqual(d.broadphase_pairs.shape, (1, 3))
+    np.testing.assert_allclose(d.contact.dist.numpy(), mjd.contact.dist, atol=1e-6)
+    np.testing.assert_allclose(d.efc_D.numpy()[: mjd.nefc], mjd.efc_D, rtol=1e-5)
+
+    # the resized data steps like the original
+    mjx.make_constraint(m, d)
+    mjx.solve(m, d)
+    np.testing.assert_allclose(d.qacc.numpy()[0], mjd.qacc, atol=5e-3)
+
+  def test_hfactor_cached(self):
+    """Tests that the sparse Hessian pattern is computed once per model."""
+    mjm, mjd, _, _ = test_util.fixture("humanoid/humanoid.xml", sparse=True)
+    io._HFACTOR_CACHE.clear()
+
+    with mock.patch.object(io, "_hfactor", wraps=io._hfactor) as hfactor:
+      m = io.put_model(mjm)
+      io.make_data(mjm, nworld=2)
+      d = io.put_data(mjm, mjd)
+      io.resize_data(mjm, d, njmax=2 * d.njmax)
+
+    hfactor.assert_called_once()
+    self.assertEqual(
+      d.solver_workspace.hfactor_sparse.shape, (1, m.hfactor_rowind.size)
+    )
+
+    # another collision filter has another pattern
+    mjm.geom_contype[:] = 0
+    mjm.geom_conaffinity[:] = 0
+    with mock.patch.object(io, "_hfactor", wraps=io._hfactor) as hfactor:
+      io.put_model(mjm)
+    hfactor.assert_called_once()
+
+
+if __name__ == "__main__":
+  absltest.main()
@@ -0,0 +1,136 @@
+# Copyright 2025 The Physics-Next Project Developers
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+import warp as wp
+
+from . import types
+
+
+@wp.func
+def _efc_trees(m: types.Model, d: types.Data, efcid: int) -> wp.vec2i:
+  """Returns the kinematic trees a constraint row acts on, -1 for the world."""
+  efc_id = d.efc_id[efcid]
+
+  if d.efc_type[efcid] == wp.static(types.ConstraintType.LIMIT_JOINT.value):
+    treeid = m.dof_treeid[m.jnt_dofadr[efc_id]]
+    return wp.vec2i(treeid, treeid)
+
+  # contacts
+  geom = d.contact.geom[efc_id]
+  return wp.vec2i(
+    m.body_treeid[m.geom_bodyid[geom[0]]], m.body_treeid[m.geom_bodyid[geom[1]]]
+  )
+
+
+@wp.func
+def _find(d: types.Data, worldid: int, treeid: int) -> int:
+  root = int(treeid)
+  while d.tree_island[worldid, root] != root:
+    root = d.tree_island[worldid, root]
+  return root
+
+
+@wp.func
+def _union(d: types.Data, worldid: int, trees: wp.vec2i):
+  # a tree joins the forest once a row acts on it
+  for i in range(2):
+    if trees[i] >= 0 and d.tree_island[worldid, trees[i]] == -1:
+      d.tree_island[worldid, trees[i]] = trees[i]
+
+  if trees[0] < 0 or trees[1] < 0:
+    return
+
+  # each component points to its smallest tree, so parents precede children
+  root0 = _find(d, worldid, trees[0])
+  root1 = _find(d, worldid, trees[1])
+  if root0 < root1:
+    d.tree_island[worldid, root1] = root0
+  elif root1 < root0:
+    d.tree_island[worldid, root0] = root1
+
+
+@wp.kernel
+def _island(m: types.Model, d: types.Data):
+  worldid = wp.tid()
+
+  for treeid in range(m.ntree):
+    d.tree_island[worldid, treeid] = -1
+
+  efcadr = d.efc_adr[worldid]
+  efcend = wp.min(efcadr + d.nefc[worldid], d.njmax)
+  for efcid in range(efcadr, efcend):
+    _union(d, worldid, _efc_trees(m, d, efcid))
+
+  # number the islands in the order of their smallest tree, like mj_island
+  nisland = wp.int32(0)
+  for treeid in range(m.ntree):
+    parent = d.tree_island[worldid, treeid]
+    if parent == treeid:
+      d.tree_island[worldid, treeid] = nisland
+      nisland += 1
+    elif parent >= 0:
+      d.tree_island[worldid, treeid] = d.tree_island[worldid, parent]
+  d.nisland[worldid] = nisland
+
+  # the dofs of each island in increasing order
+  for islandid in range(nisland):
+    d.island_dofnum[worldid, islandid] = 0
+
+  for dofid in range(m.nv):
+    island = d.tree_island[worldid, m.dof_treeid[dofid]]
+    d.dof_island[worldid, dofid] = island
+    d.dof_islandind[worldid, dofid] = -1
+    if island >= 0:
+      d.dof_islandind[worldid, dofid] = d.island_dofnum[worldid, island]
+      d.island_dofnum[worldid, island] += 1
+
+  dofadr = wp.int32(0)
+  for islandid in range(nisland):
+    d.island_dofadr[worldid, islandid] = dofadr
+    dofadr += d.island_dofnum[worldid, islandid]
+
+  for dofid in range(dofadr, m.nv):
+    d.island_dofind[worldid, dofid] = -1
+
+  for dofid in range(m.nv):
+    island = d.dof_island[worldid, dofid]
+    if island >= 0:
+      dofind = d.island_dofadr[worldid, island] + d.dof_islandind[worldid, dofid]
+      d.island_dofind[worldid, dofind] = dofid
+
+  for efcid in range(efcadr, efcend):
+    trees = _efc_trees(m, d, efcid)
+    treeid = wp.max(trees[0], trees[1])
+    island = wp.int32(-1)
+    if treeid >= 0:
+      island = d.tree_island[worldid, treeid]
+    d.efc_island[efcid] = island
+
+
+def island(m: types.Model, d: types.Data):
+  """Finds the constraint islands: trees coupled by constraint rows.
+
+  Trees that no row acts on belong to no island (-1). One thread per world runs a
+  union-find over the world's trees, so the pass is cheap next to the solver.
+
+  The islands split the CG solve of small models (see solver._solve_small) and
+  the factorization of the dense Newton Hessian. Sparse Newton factors keep the
+  model's symbolic pattern, which couples every pair of trees that may collide.
+  """
+
+  if not (m.opt.enableflags & types.EnableBit.ISLAND.value):
+    return
+
+  wp.launch(_island, dim=(d.nworld,), inputs=[m, d])
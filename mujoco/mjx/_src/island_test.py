@@ -0,0 +1,83 @@
+# Copyright 2025 The Physics-Next Project Developers
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+"""Tests for island functions."""
+
+import numpy as np
+from absl.testing import absltest, parameterized
+
+import mujoco
+from mujoco import mjx
+
+from . import test_util
+
+
+class IslandTest(parameterized.TestCase):
+  @parameterized.parameters(
+    mujoco.mjtCone.mjCONE_PYRAMIDAL, mujoco.mjtCone.mjCONE_ELLIPTIC
+  )
+  def test_island(self, cone):
+    """Tests that islands match MuJoCo."""
+    mjm, mjd, _, _ = test_util.fixture("islands.xml")
+    mjm.opt.cone = cone
+    mujoco.mj_forward(mjm, mjd)
+    self.assertGreater(mjd.nisland, 1)
+
+    m = mjx.put_model(mjm)
+    d = mjx.put_data(mjm, mjd, nworld=2)
+    d.nisland.zero_()
+    d.dof_island.zero_()
+    d.efc_island.zero_()
+    d.dof_islandind.zero_()
+    d.island_dofadr.zero_()
+    d.island_dofnum.zero_()
+    d.island_dofind.zero_()
+    mjx.island(m, d)
+
+    nisland = mjd.nisland
+    np.testing.assert_array_equal(d.nisland.numpy(), [nisland] * 2)
+    np.testing.assert_array_equal(d.dof_island.numpy(), np.tile(mjd.dof_island, (2, 1)))
+    np.testing.assert_array_equal(
+      d.dof_islandind.numpy(), np.tile(mjd.dof_islandind, (2, 1))
+    )
+    np.testing.assert_array_equal(
+      d.island_dofadr.numpy()[:, :nisland], np.tile(mjd.island_dofadr, (2, 1))
+    )
+    np.testing.assert_array_equal(
+      d.island_dofnum.numpy()[:, :nisland], np.tile(mjd.island_dofnum, (2, 1))
+    )
+    np.testing.assert_array_equal(
+      d.island_dofind.numpy(), np.tile(mjd.island_dofind, (2, 1))
+    )
+    np.testing.assert_array_equal(
+      d.efc_island.numpy()[: 2 * mjd.nefc], np.tile(mjd.efc_island, 2)
+    )
+
+  def test_island_disabled(self):
+    """Tests that islands are only found when enabled."""
+    mjm, mjd, _, _ = test_util.fixture("islands.xml")
+    mjm.opt.enableflags = 0
+    mujoco.mj_forward(mjm, mjd)
+
+    m = mjx.put_model(mjm)
+    d = mjx.put_data(mjm, mjd)
+    mjx.island(m, d)
+
+    self.assertEqual(d.nisland.numpy()[0], 0)
+    np.testing.assert_array_equal(d.dof_island.numpy(), -1)
+
+
+if __name__ == "__main__":
+  absltest.main()
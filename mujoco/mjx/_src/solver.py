@@ -1,460 +1,1237 @@
 import warp as wp
 import mujoco
+import numpy as np
 from . import smooth
 from . import support
 from . import types
 
+# number of eager solver iterations between host-side convergence checks
+_EAGER_CHECK_FREQ = 4
 
-@wp.struct
-class Context:
-  Jaref: wp.array(dtype=wp.float32, ndim=1)
-  Ma: wp.array(dtype=wp.float32, ndim=2)
-  grad: wp.array(dtype=wp.float32, ndim=2)
-  grad_dot: wp.array(dtype=wp.float32, ndim=1)
-  Mgrad: wp.array(dtype=wp.float32, ndim=2)
-  search: wp.array(dtype=wp.float32, ndim=2)
-  search_dot: wp.array(dtype=wp.float32, ndim=1)
-  gauss: wp.array(dtype=wp.float32, ndim=1)
-  cost: wp.array(dtype=wp.float32, ndim=1)
-  prev_cost: wp.array(dtype=wp.float32, ndim=1)
-  solver_niter: wp.array(dtype=wp.int32, ndim=1)
-  active: wp.array(dtype=wp.int32, ndim=1)
-  gtol: wp.array(dtype=wp.float32, ndim=1)
-  mv: wp.array(dtype=wp.float32, ndim=2)
-  jv: wp.array(dtype=wp.float32, ndim=1)
-  quad: wp.array(dtype=wp.vec3f, ndim=1)
-  quad_gauss: wp.array(dtype=wp.vec3f, ndim=1)
-  h: wp.array(dtype=wp.float32, ndim=3)
-  alpha: wp.array(dtype=wp.float32, ndim=1)
-  prev_grad: wp.array(dtype=wp.float32, ndim=2)
-  prev_Mgrad: wp.array(dtype=wp.float32, ndim=2)
-  beta: wp.array(dtype=wp.float32, ndim=1)
-  beta_num: wp.array(dtype=wp.float32, ndim=1)
-  beta_den: wp.array(dtype=wp.float32, ndim=1)
-  done: wp.array(dtype=wp.int32, ndim=1)
-
-
-def _context(m: types.Model, d: types.Data) -> Context:
-  ctx = Context()
-  ctx.Jaref = wp.empty(shape=(d.njmax,), dtype=wp.float32)
-  ctx.Ma = wp.empty(shape=(d.nworld, m.nv), dtype=wp.float32)
-  ctx.grad = wp.empty(shape=(d.nworld, m.nv), dtype=wp.float32)
-  ctx.grad_dot = wp.empty(shape=(d.nworld,), dtype=wp.float32)
-  ctx.Mgrad = wp.empty(shape=(d.nworld, m.nv), dtype=wp.float32)
-  ctx.search = wp.empty(shape=(d.nworld, m.nv), dtype=wp.float32)
-  ctx.search_dot = wp.empty(shape=(d.nworld,), dtype=wp.float32)
-  ctx.gauss = wp.empty(shape=(d.nworld,), dtype=wp.float32)
-  ctx.cost = wp.empty(shape=(d.nworld,), dtype=wp.float32)
-  ctx.prev_cost = wp.empty(shape=(d.nworld,), dtype=wp.float32)
-  ctx.solver_niter = wp.empty(shape=(d.nworld,), dtype=wp.int32)
-  ctx.active = wp.empty(shape=(d.njmax,), dtype=wp.int32)
-  ctx.gtol = wp.empty(shape=(d.nworld,), dtype=wp.float32)
-  ctx.mv = wp.empty(shape=(d.nworld, m.nv), dtype=wp.float32)
-  ctx.jv = wp.empty(shape=(d.njmax,), dtype=wp.float32)
-  ctx.quad = wp.empty(shape=(d.njmax,), dtype=wp.vec3f)
-  ctx.quad_gauss = wp.empty(shape=(d.nworld,), dtype=wp.vec3f)
-  ctx.h = wp.empty(shape=(d.nworld, m.nv, m.nv), dtype=wp.float32)
-  ctx.alpha = wp.empty(shape=(d.nworld,), dtype=wp.float32)
-  ctx.prev_grad = wp.empty(shape=(d.nworld, m.nv), dtype=wp.float32)
-  ctx.prev_Mgrad = wp.empty(shape=(d.nworld, m.nv), dtype=wp.float32)
-  ctx.beta = wp.empty(shape=(d.nworld,), dtype=wp.float32)
-  ctx.beta_num = wp.empty(shape=(d.nworld,), dtype=wp.float32)
-  ctx.beta_den = wp.empty(shape=(d.nworld,), dtype=wp.float32)
-  ctx.done = wp.empty(shape=(d.nworld,), dtype=wp.int32)
-
-  return ctx
-
-
-def _create_context(ctx: Context, m: types.Model, d: types.Data, grad: bool = True):
-  # jaref = d.efc_J @ d.qacc - d.efc_aref
-  ctx.Jaref.zero_()
+# Newton refactors the Hessian instead of applying rank-1 updates when more
+# constraints than this change active state in an iteration
+_CHOLESKY_UPDATE_MAXRANK = 8
 
-  @wp.kernel
-  def _jaref(ctx: Context, m: types.Model, d: types.Data):
-    efcid, dofid = wp.tid()
 
-    if efcid >= d.nefc_total[0]:
+# threads in the block that reduces each world's rows or dofs
+_BLOCK_DIM = 32
+
+
+def _launch_world(kernel, d: types.Data, inputs):
+  """Launches a tiled kernel with one block of _BLOCK_DIM threads per world.
+
+  Kernels reduce into per-world values with wp.tile_sum instead of atomics, so
+  the summation order, and the result, does not depend on scheduling.
+  """
+  wp.launch_tiled(kernel, dim=(d.nworld,), inputs=inputs, block_dim=_BLOCK_DIM)
+
+
+# threads per multiprocessor of a row kernel launch
+_EFC_THREADS_PER_SM = 2048
+
+
+@wp.func
+def _nefc(d: types.Data) -> int:
+  # rows past njmax are dropped
+  return wp.min(d.nefc_total[0], d.njmax)
+
+
+@wp.func
+def _efc_J_dof(d: types.Data, efcid: int, dofid: int) -> float:
+  """Returns efc_J[efcid] at a dof, searching the sorted columns of the row."""
+  lo = wp.int32(0)
+  hi = d.efc_J_rownnz[efcid]
+  while lo < hi:
+    mid = (lo + hi) // 2
+    if d.efc_J_colind[efcid, mid] < dofid:
+      lo = mid + 1
+    else:
+      hi = mid
+
+  if lo >= d.efc_J_rownnz[efcid]:
+    return 0.0
+  if d.efc_J_colind[efcid, lo] != dofid:
+    return 0.0
+
+  return d.efc_J[efcid, lo]
+
+
+def _launch_efc(kernel, d: types.Data, inputs, dim=()):
+  """Launches a kernel over the constraint rows in use.
+
+  The row count d.nefc_total lives on the device, so the grid is still sized
+  from njmax, capped at what fills the device once. Each thread strides over the
+  rows below _nefc(d), and threads past them return without touching a row. The
+  kernel's first dimension is the thread, and its last input the number of
+  threads.
+  """
+  sm_count = max(d.nefc_total.device.sm_count, 1)
+  nthread = max(min(d.njmax, sm_count * _EFC_THREADS_PER_SM), 1)
+  wp.launch(kernel, dim=(nthread,) + dim, inputs=inputs + [nthread])
+
+
+def _search_newton(m: types.Model, d: types.Data, ctx: types.SolverWorkspace):
+  # search = -Mgrad
+  @wp.kernel(enable_backward=False)
+  def _search(ctx: types.SolverWorkspace, m: types.Model):
+    worldid, tid = wp.tid()
+
+    if ctx.done[worldid]:
       return
 
-    worldid = d.efc_worldid[efcid]
-    wp.atomic_add(
-      ctx.Jaref,
-      efcid,
-      d.efc_J[efcid, dofid] * d.qacc[worldid, dofid] - d.efc_aref[efcid] / float(m.nv),
-    )
+    search_dot = wp.float32(0.0)
+    for dofid in range(tid, m.nv, wp.block_dim()):
+      search = -1.0 * ctx.Mgrad[worldid, dofid]
+      ctx.search[worldid, dofid] = search
+      search_dot += search * search
+    search_dot_sum = wp.tile_sum(wp.tile(search_dot))
+
+    if tid == 0:
+      ctx.search_dot[worldid] = wp.tile_extract(search_dot_sum, 0)
+
+  _launch_world(_search, d, [ctx, m])
+
 
-  wp.launch(_jaref, dim=(d.njmax, m.nv), inputs=[ctx, m, d])
+def _create_context(
+  ctx: types.SolverWorkspace, m: types.Model, d: types.Data, grad: bool = True
+):
+  ctx.done.zero_()
+  ctx.refactor.fill_(1)
+  ctx.nsolving.fill_(d.nworld)
+
+  # jaref = efc_J @ qacc - efc_aref
+  @wp.kernel
+  def _jaref(ctx: types.SolverWorkspace, m: types.Model, d: types.Data, nthread: int):
+    tid = wp.tid()
+
+    for efcid in range(tid, _nefc(d), nthread):
+      worldid = d.efc_worldid[efcid]
+
+      if ctx.done[worldid]:
+        continue
+
+      Jaref = -d.efc_aref[efcid]
+      for nnzid in range(d.efc_J_rownnz[efcid]):
+        dofid = d.efc_J_colind[efcid, nnzid]
+        Jaref += d.efc_J[efcid, nnzid] * d.qacc[worldid, dofid]
+      ctx.Jaref[efcid] = Jaref
+
+  _launch_efc(_jaref, d, [ctx, m, d])
 
   # Ma = qM @ qacc
   support.mul_m(m, d, ctx.Ma, d.qacc)
 
+  if m.opt.solver == mujoco.mjtSolver.mjSOL_NEWTON and _use_dual(d):
+    _dual_matrix(m, d, ctx)
+
   ctx.cost.fill_(wp.inf)
-  ctx.solver_niter.zero_()
-  ctx.done.zero_()
+  d.solver_niter.zero_()
+  d.solver_improvement.zero_()
+  d.solver_gradient.zero_()
+  d.solver_nls.zero_()
 
   _update_constraint(m, d, ctx)
   if grad:
     _update_gradient(m, d, ctx)
 
-    # search = -Mgrad
-    ctx.search_dot.zero_()
+    _search_newton(m, d, ctx)
 
-    @wp.kernel
-    def _search(ctx: Context):
-      worldid, dofid = wp.tid()
-      search = -1.0 * ctx.Mgrad[worldid, dofid]
-      ctx.search[worldid, dofid] = search
-      wp.atomic_add(ctx.search_dot, worldid, search * search)
 
-    wp.launch(_search, dim=(d.nworld, m.nv), inputs=[ctx])
+@wp.func
+def _elliptic_mu(m: types.Model, d: types.Data, conid: wp.int32) -> wp.float32:
+  """Returns the friction coefficient of the contact's circular cone."""
+  return d.contact.friction[conid][0] / wp.sqrt(m.opt.impratio)
 
 
-@wp.struct
-class LSPoint:
-  alpha: wp.array(dtype=wp.float32, ndim=1)
-  cost: wp.array(dtype=wp.float32, ndim=1)
-  deriv_0: wp.array(dtype=wp.float32, ndim=1)
-  deriv_1: wp.array(dtype=wp.float32, ndim=1)
+@wp.func
+def _elliptic_zone(
+  m: types.Model, d: types.Data, ctx: types.SolverWorkspace, efcid: wp.int32
+) -> wp.vec3:
+  """Returns (n, t, zone) of the elliptic cone whose first row is efcid.
+
+  n and t are the normal and tangential components of Jaref scaled to the
+  circular cone, zone is 0 for the top, 1 for the middle and 2 for the bottom.
+  """
+  conid = d.efc_id[efcid]
+  friction = d.contact.friction[conid]
+  mu = _elliptic_mu(m, d, conid)
+  n = ctx.Jaref[efcid] * mu
+  u1 = ctx.Jaref[efcid + 1] * friction[0]
+  u2 = ctx.Jaref[efcid + 2] * friction[1]
+  t = wp.sqrt(u1 * u1 + u2 * u2)
+
+  zone = wp.float32(0.0)
+  if (t <= 0.0 and n < 0.0) or (t > 0.0 and mu * n + t <= 0.0):
+    zone = 2.0
+  elif t > 0.0 and n < mu * t:
+    zone = 1.0
+  return wp.vec3(n, t, zone)
 
 
-def _lspoint(d: types.Data) -> LSPoint:
-  ls_pnt = LSPoint()
-  ls_pnt.alpha = wp.empty(shape=(d.nworld), dtype=wp.float32)
-  ls_pnt.cost = wp.empty(shape=(d.nworld), dtype=wp.float32)
-  ls_pnt.deriv_0 = wp.empty(shape=(d.nworld), dtype=wp.float32)
-  ls_pnt.deriv_1 = wp.empty(shape=(d.nworld), dtype=wp.float32)
+@wp.func
+def _eval_pt(quad: wp.vec3, alpha: wp.float32) -> wp.vec3:
+  """Returns the cost and its first and second derivatives of a quadratic."""
+  alpha_sq = alpha * alpha
+  return wp.vec3(
+    alpha_sq * quad[2] + alpha * quad[1] + quad[0],
+    2.0 * alpha * quad[2] + quad[1],
+    2.0 * quad[2],
+  )
 
-  return ls_pnt
 
+@wp.func
+def _eval_pt_elliptic(
+  quad: wp.vec3, quad1: wp.vec3, quad2: wp.vec3, mu: wp.float32, alpha: wp.float32
+) -> wp.vec3:
+  """Returns the cost and its derivatives of an elliptic cone.
+
+  quad is the sum of the quadratics of the cone's rows, quad1 and quad2 hold
+  (u0, v0, uu) and (uv, vv, dm) as set up in _linesearch.
+  """
+  u0, v0, uu = quad1[0], quad1[1], quad1[2]
+  uv, vv, dm = quad2[0], quad2[1], quad2[2]
+
+  n = u0 + alpha * v0
+  tsqr = uu + alpha * (2.0 * uv + alpha * vv)
+  t = wp.sqrt(wp.max(tsqr, 0.0))
+
+  # bottom zone: quadratic cost
+  if (tsqr <= 0.0 and n < 0.0) or (tsqr > 0.0 and mu * n + t <= 0.0):
+    return _eval_pt(quad, alpha)
+
+  # top zone: no cost
+  if tsqr <= 0.0 or n >= mu * t:
+    return wp.vec3(0.0)
+
+  # middle zone: cone
+  n1 = v0
+  t1 = (uv + alpha * vv) / t
+  t2 = vv / t - (uv + alpha * vv) * t1 / tsqr
+  nmt = n - mu * t
+  return wp.vec3(
+    0.5 * dm * nmt * nmt,
+    dm * nmt * (n1 - mu * t1),
+    dm * ((n1 - mu * t1) * (n1 - mu * t1) - nmt * mu * t2),
+  )
+
+
+@wp.func
+def _eval_pt_efc(
+  m: types.Model,
+  d: types.Data,
+  ctx: types.SolverWorkspace,
+  efcid: wp.int32,
+  alpha: wp.float32,
+) -> wp.vec3:
+  if d.efc_type[efcid] == wp.static(types.ConstraintType.CONTACT_ELLIPTIC.value):
+    # the first row of a cone evaluates the whole cone
+    conid = d.efc_id[efcid]
+    if d.contact.efc_address[conid] != efcid or efcid + 2 >= d.njmax:
+      return wp.vec3(0.0)
+    return _eval_pt_elliptic(
+      ctx.quad[efcid],
+      ctx.quad[efcid + 1],
+      ctx.quad[efcid + 2],
+      _elliptic_mu(m, d, conid),
+      alpha,
+    )
+
+  # TODO(team): active and conditionally active constraints
+  if ctx.Jaref[efcid] + alpha * ctx.jv[efcid] < 0.0:
+    return _eval_pt(ctx.quad[efcid], alpha)
+  return wp.vec3(0.0)
+
+
+def _eval_lspoint(
+  ls_pnt: types.LSPoint,
+  m: types.Model,
+  d: types.Data,
+  ctx: types.SolverWorkspace,
+  done: wp.array,
+):
+  """Evaluates the cost and derivatives at one alpha per world.
+
+  A block of threads reduces the world's rows, which are contiguous from efc_adr.
+  """
+
+  @wp.kernel(enable_backward=False)
+  def _cost_deriv(
+    ls_pnt: types.LSPoint,
+    ctx: types.SolverWorkspace,
+    m: types.Model,
+    d: types.Data,
+    done: wp.array(dtype=wp.int32),
+  ):
+    worldid, tid = wp.tid()
+
+    if done[worldid]:
+      return
 
-def _eval_lspoint(ls_pnt: LSPoint, m: types.Model, d: types.Data, ctx: Context):
-  @wp.kernel
-  def _cost_deriv_gauss(ls_pnt: LSPoint, ctx: Context):
-    worldid = wp.tid()
     alpha = ls_pnt.alpha[worldid]
-    alpha_sq = alpha * alpha
-    quad_total0 = ctx.quad_gauss[worldid][0]
-    quad_total1 = ctx.quad_gauss[worldid][1]
-    quad_total2 = ctx.quad_gauss[worldid][2]
 
-    ls_pnt.cost[worldid] = alpha_sq * quad_total2 + alpha * quad_total1 + quad_total0
-    ls_pnt.deriv_0[worldid] = 2.0 * alpha * quad_total2 + quad_total1
-    ls_pnt.deriv_1[worldid] = 2.0 * quad_total2
+    pnt = wp.vec3(0.0)
+    efcadr = d.efc_adr[worldid]
+    efcend = wp.min(efcadr + d.nefc[worldid], d.njmax)
+    for efcid in range(efcadr + tid, efcend, wp.block_dim()):
+      pnt += _eval_pt_efc(m, d, ctx, efcid, alpha)
 
-  wp.launch(_cost_deriv_gauss, dim=(d.nworld,), inputs=[ls_pnt, ctx])
+    cost = wp.tile_sum(wp.tile(pnt[0]))
+    deriv_0 = wp.tile_sum(wp.tile(pnt[1]))
+    deriv_1 = wp.tile_sum(wp.tile(pnt[2]))
 
-  @wp.kernel
-  def _cost_deriv_quad(ls_pnt: LSPoint, ctx: Context, d: types.Data):
-    efcid = wp.tid()
+    if tid == 0:
+      pnt_gauss = _eval_pt(ctx.quad_gauss[worldid], alpha)
+      ls_pnt.cost[worldid] = pnt_gauss[0] + wp.tile_extract(cost, 0)
+      ls_pnt.deriv_0[worldid] = pnt_gauss[1] + wp.tile_extract(deriv_0, 0)
+      ls_pnt.deriv_1[worldid] = pnt_gauss[2] + wp.tile_extract(deriv_1, 0)
 
-    if efcid >= d.nefc_total[0]:
-      return
+  _launch_world(_cost_deriv, d, [ls_pnt, ctx, m, d, done])
 
-    worldid = d.efc_worldid[efcid]
-    alpha = ls_pnt.alpha[worldid]
-    x = ctx.Jaref[efcid] + alpha * ctx.jv[efcid]
-    # TODO(team): active and conditionally active constraints
-    if x < 0.0:
-      alpha_sq = alpha * alpha
-      quad_total0 = ctx.quad[efcid][0]
-      quad_total1 = ctx.quad[efcid][1]
-      quad_total2 = ctx.quad[efcid][2]
 
-      wp.atomic_add(
-        ls_pnt.cost, worldid, alpha_sq * quad_total2 + alpha * quad_total1 + quad_total0
-      )
-      wp.atomic_add(ls_pnt.deriv_0, worldid, 2.0 * alpha * quad_total2 + quad_total1)
-      wp.atomic_add(ls_pnt.deriv_1, worldid, 2.0 * quad_total2)
+def _eval_lspoint_next_mid(
+  m: types.Model, d: types.Data, ctx: types.SolverWorkspace, ls_ctx: types.LSContext
+):
+  """Evaluates lo_next, hi_next and mid in a single pass over each world's rows."""
 
-  wp.launch(_cost_deriv_quad, dim=(d.njmax,), inputs=[ls_pnt, ctx, d])
+  @wp.kernel(enable_backward=False)
+  def _cost_deriv_next_mid(
+    ls_ctx: types.LSContext,
+    ctx: types.SolverWorkspace,
+    m: types.Model,
+    d: types.Data,
+  ):
+    worldid, tid = wp.tid()
 
+    if ls_ctx.done[worldid]:
+      return
 
-@wp.struct
-class LSContext:
-  p0: LSPoint
-  lo: LSPoint
-  lo_next: LSPoint
-  hi: LSPoint
-  hi_next: LSPoint
-  mid: LSPoint
-  swap: wp.array(ndim=1, dtype=wp.int32)
-  ls_iter: wp.array(ndim=1, dtype=wp.int32)
-  done: wp.array(ndim=1, dtype=wp.int32)
+    lo_next_alpha = ls_ctx.lo_next.alpha[worldid]
+    hi_next_alpha = ls_ctx.hi_next.alpha[worldid]
+    mid_alpha = ls_ctx.mid.alpha[worldid]
+
+    lo_next = wp.vec3(0.0)
+    hi_next = wp.vec3(0.0)
+    mid = wp.vec3(0.0)
+    efcadr = d.efc_adr[worldid]
+    efcend = wp.min(efcadr + d.nefc[worldid], d.njmax)
+    for efcid in range(efcadr + tid, efcend, wp.block_dim()):
+      lo_next += _eval_pt_efc(m, d, ctx, efcid, lo_next_alpha)
+      hi_next += _eval_pt_efc(m, d, ctx, efcid, hi_next_alpha)
+      mid += _eval_pt_efc(m, d, ctx, efcid, mid_alpha)
+
+    lo_next_cost = wp.tile_sum(wp.tile(lo_next[0]))
+    lo_next_deriv_0 = wp.tile_sum(wp.tile(lo_next[1]))
+    lo_next_deriv_1 = wp.tile_sum(wp.tile(lo_next[2]))
+    hi_next_cost = wp.tile_sum(wp.tile(hi_next[0]))
+    hi_next_deriv_0 = wp.tile_sum(wp.tile(hi_next[1]))
+    hi_next_deriv_1 = wp.tile_sum(wp.tile(hi_next[2]))
+    mid_cost = wp.tile_sum(wp.tile(mid[0]))
+    mid_deriv_0 = wp.tile_sum(wp.tile(mid[1]))
+    mid_deriv_1 = wp.tile_sum(wp.tile(mid[2]))
+
+    if tid == 0:
+      quad_gauss = ctx.quad_gauss[worldid]
+
+      pnt = _eval_pt(quad_gauss, lo_next_alpha)
+      ls_ctx.lo_next.cost[worldid] = pnt[0] + wp.tile_extract(lo_next_cost, 0)
+      ls_ctx.lo_next.deriv_0[worldid] = pnt[1] + wp.tile_extract(lo_next_deriv_0, 0)
+      ls_ctx.lo_next.deriv_1[worldid] = pnt[2] + wp.tile_extract(lo_next_deriv_1, 0)
+
+      pnt = _eval_pt(quad_gauss, hi_next_alpha)
+      ls_ctx.hi_next.cost[worldid] = pnt[0] + wp.tile_extract(hi_next_cost, 0)
+      ls_ctx.hi_next.deriv_0[worldid] = pnt[1] + wp.tile_extract(hi_next_deriv_0, 0)
+      ls_ctx.hi_next.deriv_1[worldid] = pnt[2] + wp.tile_extract(hi_next_deriv_1, 0)
+
+      pnt = _eval_pt(quad_gauss, mid_alpha)
+      ls_ctx.mid.cost[worldid] = pnt[0] + wp.tile_extract(mid_cost, 0)
+      ls_ctx.mid.deriv_0[worldid] = pnt[1] + wp.tile_extract(mid_deriv_0, 0)
+      ls_ctx.mid.deriv_1[worldid] = pnt[2] + wp.tile_extract(mid_deriv_1, 0)
+
+  _launch_world(_cost_deriv_next_mid, d, [ls_ctx, ctx, m, d])
+
+
+@wp.func
+def _efc_elliptic(
+  ctx: types.SolverWorkspace, m: types.Model, d: types.Data, efcid: wp.int32
+) -> wp.vec2:
+  """Updates the active state and force of an elliptic cone's rows.
+
+  Returns the cone's cost and its number of active rows.
+  """
+  # the first row of a cone updates the whole cone
+  conid = d.efc_id[efcid]
+  if d.contact.efc_address[conid] != efcid:
+    return wp.vec2(0.0)
+
+  nrow = wp.min(3, d.njmax - efcid)
+
+  # cones cut off by njmax are inactive
+  nt = wp.vec3(0.0)
+  if nrow == 3:
+    nt = _elliptic_zone(m, d, ctx, efcid)
+  n, t, zone = nt[0], nt[1], nt[2]
+
+  # bottom zone: quadratic, like the rows of a pyramidal cone
+  active = int(zone == 2.0)
+  cost = wp.float32(0.0)
+  for i in range(nrow):
+    Jaref = ctx.Jaref[efcid + i]
+    efc_D = d.efc_D[efcid + i]
+    ctx.prev_active[efcid + i] = ctx.active[efcid + i]
+    ctx.active[efcid + i] = active
+    d.efc_force[efcid + i] = -1.0 * efc_D * Jaref * float(active)
+    cost += 0.5 * efc_D * Jaref * Jaref * float(active)
+
+  # middle zone: cone
+  if zone == 1.0:
+    friction = d.contact.friction[conid]
+    mu = _elliptic_mu(m, d, conid)
+    dm = d.efc_D[efcid] / wp.max(mu * mu * (1.0 + mu * mu), types.MJ_MINVAL)
+    nmt = n - mu * t
+    cost += 0.5 * dm * nmt * nmt
+
+    force = -dm * nmt * mu
+    d.efc_force[efcid] = force
+    d.efc_force[efcid + 1] = (
+      -force / t * ctx.Jaref[efcid + 1] * friction[0] * friction[0]
+    )
+    d.efc_force[efcid + 2] = (
+      -force / t * ctx.Jaref[efcid + 2] * friction[1] * friction[1]
+    )
 
+  # the rows of cones in the middle and bottom zones are active
+  return wp.vec2(cost, float(nrow * int(zone != 0.0)))
 
-def _create_lscontext(m: types.Model, d: types.Data, ctx: Context) -> LSContext:
-  ls_ctx = LSContext()
 
-  ls_ctx.p0 = _lspoint(d)
-  ls_ctx.lo = _lspoint(d)
-  ls_ctx.lo_next = _lspoint(d)
-  ls_ctx.hi = _lspoint(d)
-  ls_ctx.hi_next = _lspoint(d)
-  ls_ctx.mid = _lspoint(d)
+@wp.func
+def _cone_hessian(
+  m: types.Model, d: types.Data, ctx: types.SolverWorkspace, efcid: wp.int32
+) -> wp.mat33:
+  """Returns the Hessian of the cost of an elliptic cone in its middle zone."""
+  nt = _elliptic_zone(m, d, ctx, efcid)
+  n, t = nt[0], nt[1]
+  if nt[2] != 1.0:
+    return wp.mat33(0.0)
+
+  conid = d.efc_id[efcid]
+  friction = d.contact.friction[conid]
+  mu = _elliptic_mu(m, d, conid)
+  dm = d.efc_D[efcid] / wp.max(mu * mu * (1.0 + mu * mu), types.MJ_MINVAL)
+  u = wp.vec3(n, ctx.Jaref[efcid + 1] * friction[0], ctx.Jaref[efcid + 2] * friction[1])
+  fri = wp.vec3(mu, friction[0], friction[1])
+
+  # h = mu * N / T^3 * U * U' + (mu^2 - mu * N / T) * I
+  h = (mu * n / (t * t * t)) * wp.outer(u, u)
+  h += (mu * mu - mu * n / t) * wp.identity(n=3, dtype=wp.float32)
+
+  # first row and column: (1, -mu / T * U)
+  h[0, 0] = 1.0
+  for i in range(1, 3):
+    h[0, i] = -mu / t * u[i]
+    h[i, 0] = -mu / t * u[i]
+
+  # pre and post multiply by diag(mu, friction), scale by dm
+  for i in range(3):
+    for j in range(3):
+      h[i, j] = h[i, j] * dm * fri[i] * fri[j]
+  return h
+
+
+def _update_constraint(m: types.Model, d: types.Data, ctx: types.SolverWorkspace):
+  @wp.kernel(enable_backward=False)
+  def _efc_kernel(ctx: types.SolverWorkspace, m: types.Model, d: types.Data):
+    worldid, tid = wp.tid()
+
+    if ctx.done[worldid]:
+      return
 
-  ls_ctx.swap = wp.empty(shape=(d.nworld), dtype=wp.int32)
-  ls_ctx.ls_iter = wp.empty(shape=(d.nworld), dtype=wp.int32)
-  ls_ctx.done = wp.zeros((d.nworld), dtype=wp.int32)
+    cost = wp.float32(0.0)
+    nactive = wp.float32(0.0)
+    efcadr = d.efc_adr[worldid]
+    efcend = wp.min(efcadr + d.nefc[worldid], d.njmax)
+    for efcid in range(efcadr + tid, efcend, wp.block_dim()):
+      if d.efc_type[efcid] == wp.static(types.ConstraintType.CONTACT_ELLIPTIC.value):
+        cone = _efc_elliptic(ctx, m, d, efcid)
+        cost += cone[0]
+        nactive += cone[1]
+        continue
+
+      Jaref = ctx.Jaref[efcid]
+      efc_D = d.efc_D[efcid]
 
-  return ls_ctx
+      # TODO(team): active and conditionally active constraints
+      active = int(Jaref < 0.0)
+      ctx.prev_active[efcid] = ctx.active[efcid]
+      ctx.active[efcid] = active
+
+      # efc_force = -efc_D * Jaref * active
+      d.efc_force[efcid] = -1.0 * efc_D * Jaref * float(active)
+
+      # cost = 0.5 * sum(efc_D * Jaref * Jaref * active))
+      cost += 0.5 * efc_D * Jaref * Jaref * float(active)
+      nactive += float(active)
+
+    # gauss = 0.5 * (Ma - qfrc_smooth).T @ (qacc - qacc_smooth)
+    gauss = wp.float32(0.0)
+    for dofid in range(tid, m.nv, wp.block_dim()):
+      gauss += (
+        0.5
+        * (ctx.Ma[worldid, dofid] - d.qfrc_smooth[worldid, dofid])
+        * (d.qacc[worldid, dofid] - d.qacc_smooth[worldid, dofid])
+      )
 
+    cost_sum = wp.tile_sum(wp.tile(cost))
+    nactive_sum = wp.tile_sum(wp.tile(nactive))
+    gauss_sum = wp.tile_sum(wp.tile(gauss))
 
-def _update_constraint(m: types.Model, d: types.Data, ctx: Context):
-  wp.copy(ctx.prev_cost, ctx.cost)
-  ctx.cost.zero_()
+    if tid == 0:
+      gauss_total = wp.tile_extract(gauss_sum, 0)
+      ctx.prev_cost[worldid] = ctx.cost[worldid]
+      ctx.cost[worldid] = gauss_total + wp.tile_extract(cost_sum, 0)
+      ctx.gauss[worldid] = gauss_total
+      d.solver_nactive[worldid] = int(wp.tile_extract(nactive_sum, 0))
 
+  _launch_world(_efc_kernel, d, [ctx, m, d])
+
+  # qfrc_constraint = efc_J.T @ efc_force, summed in row order for each dof
   @wp.kernel
-  def _efc_kernel(ctx: Context, d: types.Data):
-    efcid = wp.tid()
+  def _qfrc_constraint(ctx: types.SolverWorkspace, d: types.Data):
+    worldid, dofid = wp.tid()
 
-    if efcid >= d.nefc_total[0]:
+    if ctx.done[worldid]:
       return
 
-    worldid = d.efc_worldid[efcid]
-    Jaref = ctx.Jaref[efcid]
-    efc_D = d.efc_D[efcid]
+    efcadr = d.efc_adr[worldid]
+    efcend = wp.min(efcadr + d.nefc[worldid], d.njmax)
+    qfrc = wp.float32(0.0)
+    for efcid in range(efcadr, efcend):
+      efc_force = d.efc_force[efcid]
+      if efc_force != 0.0:
+        qfrc += _efc_J_dof(d, efcid, dofid) * efc_force
 
-    # TODO(team): active and conditionally active constraints
-    active = int(Jaref < 0.0)
-    ctx.active[efcid] = active
+    d.qfrc_constraint[worldid, dofid] = qfrc
 
-    # efc_force = -efc_D * Jaref * active
-    d.efc_force[efcid] = -1.0 * efc_D * Jaref * float(active)
+  wp.launch(_qfrc_constraint, dim=(d.nworld, m.nv), inputs=[ctx, d])
 
-    # cost = 0.5 * sum(efc_D * Jaref * Jaref * active))
-    wp.atomic_add(ctx.cost, worldid, 0.5 * efc_D * Jaref * Jaref * float(active))
 
-  wp.launch(_efc_kernel, dim=(d.njmax,), inputs=[ctx, d])
+@wp.func
+def _cholesky_rank1(
+  L: wp.array(dtype=wp.float32, ndim=2),
+  v: wp.array(dtype=wp.float32, ndim=1),
+  n: wp.int32,
+  sign: wp.float32,
+) -> bool:
+  """Updates the lower factor L in place to L L^T + sign * v v^T, overwriting v.
+
+  Returns False if a downdate loses positive definiteness.
+  """
+  for k in range(n):
+    Lkk = L[k, k]
+    r2 = Lkk * Lkk + sign * v[k] * v[k]
+    if r2 < types.MJ_MINVAL:
+      return False
+    r = wp.sqrt(r2)
+    c = r / Lkk
+    s = v[k] / Lkk
+    L[k, k] = r
+    for i in range(k + 1, n):
+      Lik = (L[i, k] + sign * s * v[i]) / c
+      L[i, k] = Lik
+      v[i] = c * v[i] - s * Lik
+  return True
+
+
+@wp.func
+def _hfactor_col(m: types.Model, adr: int) -> int:
+  """Returns the column of the factor pattern entry at adr."""
+  lo = wp.int32(0)
+  hi = m.nv - 1
+  while lo < hi:
+    mid = (lo + hi + 1) // 2
+    if m.hfactor_coladr[mid] <= adr:
+      lo = mid
+    else:
+      hi = mid - 1
+  return lo
 
-  # qfrc_constraint = efc_J.T @ efc_force
-  d.qfrc_constraint.zero_()
+
+@wp.func
+def _cholesky_rank1_sparse(
+  m: types.Model,
+  L: wp.array(dtype=wp.float32, ndim=1),
+  v: wp.array(dtype=wp.float32, ndim=1),
+  k: wp.int32,
+  sign: wp.float32,
+) -> bool:
+  """Sparse _cholesky_rank1 on the factor pattern in m.hfactor_*.
+
+  v is in elimination order and k is its first nonzero: only the columns on the
+  elimination tree path from k change.
+  """
+  while k != -1:
+    adr = m.hfactor_coladr[k]
+    Lkk = L[adr]
+    r2 = Lkk * Lkk + sign * v[k] * v[k]
+    if r2 < types.MJ_MINVAL:
+      return False
+    r = wp.sqrt(r2)
+    c = r / Lkk
+    s = v[k] / Lkk
+    L[adr] = r
+    for p in range(adr + 1, adr + m.hfactor_colnnz[k]):
+      i = m.hfactor_rowind[p]
+      Lik = (L[p] + sign * s * v[i]) / c
+      L[p] = Lik
+      v[i] = c * v[i] - s * Lik
+    k = m.hfactor_parent[k]
+  return True
+
+
+def _precondition(m: types.Model, d: types.Data, ctx: types.SolverWorkspace):
+  """Applies the CG preconditioner: Mgrad = P^-1 @ grad.
+
+  The Jacobi variants replace the factored mass matrix solve with a division by
+  a diagonal, optionally including J^T D J over the active rows.
+  """
+  if m.opt.preconditioner == types.PreconditionerType.MASS:
+    smooth.solve_m(m, d, ctx.Mgrad, ctx.grad)
+    return
 
   @wp.kernel
-  def _qfrc_constraint(d: types.Data):
-    dofid, efcid = wp.tid()
+  def _diag_m(ctx: types.SolverWorkspace, m: types.Model, d: types.Data):
+    worldid, dofid = wp.tid()
 
-    if efcid >= d.nefc_total[0]:
+    if ctx.done[worldid]:
       return
 
-    worldid = d.efc_worldid[efcid]
-    wp.atomic_add(
-      d.qfrc_constraint[worldid],
-      dofid,
-      d.efc_J[efcid, dofid] * d.efc_force[efcid],
-    )
+    if m.opt.is_sparse:
+      ctx.precond[worldid, dofid] = d.qM[worldid, 0, m.dof_Madr[dofid]]
+    else:
+      ctx.precond[worldid, dofid] = d.qM[worldid, dofid, dofid]
 
-  wp.launch(_qfrc_constraint, dim=(m.nv, d.njmax), inputs=[d])
+  wp.launch(_diag_m, dim=(d.nworld, m.nv), inputs=[ctx, m, d])
 
-  # gauss = 0.5 * (Ma - qfrc_smooth).T @ (qacc - qacc_smooth)
-  ctx.gauss.zero_()
+  if m.opt.preconditioner == types.PreconditionerType.JACOBI_CONSTRAINT:
+
+    @wp.kernel
+    def _diag_jtdj(ctx: types.SolverWorkspace, d: types.Data):
+      worldid, dofid = wp.tid()
+
+      if ctx.done[worldid]:
+        return
+
+      efcadr = d.efc_adr[worldid]
+      efcend = wp.min(efcadr + d.nefc[worldid], d.njmax)
+      jtdj = wp.float32(0.0)
+      for efcid in range(efcadr, efcend):
+        if ctx.active[efcid]:
+          J = _efc_J_dof(d, efcid, dofid)
+          jtdj += d.efc_D[efcid] * J * J
+
+      ctx.precond[worldid, dofid] += jtdj
+
+    wp.launch(_diag_jtdj, dim=(d.nworld, m.nv), inputs=[ctx, d])
 
   @wp.kernel
-  def _gauss(ctx: Context, d: types.Data):
+  def _mgrad(ctx: types.SolverWorkspace):
     worldid, dofid = wp.tid()
-    gauss_cost = (
-      0.5
-      * (ctx.Ma[worldid, dofid] - d.qfrc_smooth[worldid, dofid])
-      * (d.qacc[worldid, dofid] - d.qacc_smooth[worldid, dofid])
+
+    if ctx.done[worldid]:
+      return
+
+    ctx.Mgrad[worldid, dofid] = ctx.grad[worldid, dofid] / wp.max(
+      ctx.precond[worldid, dofid], types.MJ_MINVAL
     )
-    wp.atomic_add(ctx.gauss, worldid, gauss_cost)
-    wp.atomic_add(ctx.cost, worldid, gauss_cost)
 
-  wp.launch(_gauss, dim=(d.nworld, m.nv), inputs=[ctx, d])
+  wp.launch(_mgrad, dim=(d.nworld, m.nv), inputs=[ctx])
+
+
+@wp.kernel
+def _factored(ctx: types.SolverWorkspace):
+  worldid = wp.tid()
+
+  if ctx.done[worldid]:
+    return
 
+  ctx.refactor[worldid] = 0
 
-def _update_gradient(m: types.Model, d: types.Data, ctx: Context):
+
+@wp.func
+def _block_dof(d: types.Data, worldid: int, adr: int, i: int, island: bool) -> int:
+  if island:
+    return d.island_dofind[worldid, adr + i]
+  return adr + i
+
+
+@wp.func
+def _cholesky_block(
+  d: types.Data,
+  worldid: int,
+  h: wp.array2d(dtype=wp.float32),
+  L: wp.array2d(dtype=wp.float32),
+  adr: int,
+  num: int,
+  island: bool,
+):
+  """Dense Cholesky factor of the block of h on the dofs of an island or tree."""
+  for a in range(num):
+    i = _block_dof(d, worldid, adr, a, island)
+    for b in range(a + 1):
+      j = _block_dof(d, worldid, adr, b, island)
+      s = h[i, j]
+      for c in range(b):
+        k = _block_dof(d, worldid, adr, c, island)
+        s -= L[i, k] * L[j, k]
+      if a == b:
+        L[i, i] = wp.sqrt(s)
+      else:
+        L[i, j] = s / L[j, j]
+
+
+def _update_gradient(m: types.Model, d: types.Data, ctx: types.SolverWorkspace):
   # grad = Ma - qfrc_smooth - qfrc_constraint
-  ctx.grad_dot.zero_()
+  @wp.kernel(enable_backward=False)
+  def _grad(ctx: types.SolverWorkspace, m: types.Model, d: types.Data):
+    worldid, tid = wp.tid()
 
-  @wp.kernel
-  def _grad(ctx: Context, d: types.Data):
-    worldid, dofid = wp.tid()
-    grad = (
-      ctx.Ma[worldid, dofid]
-      - d.qfrc_smooth[worldid, dofid]
-      - d.qfrc_constraint[worldid, dofid]
-    )
-    ctx.grad[worldid, dofid] = grad
-    wp.atomic_add(ctx.grad_dot, worldid, grad * grad)
+    if ctx.done[worldid]:
+      return
+
+    grad_dot = wp.float32(0.0)
+    for dofid in range(tid, m.nv, wp.block_dim()):
+      grad = (
+        ctx.Ma[worldid, dofid]
+        - d.qfrc_smooth[worldid, dofid]
+        - d.qfrc_constraint[worldid, dofid]
+      )
+      ctx.grad[worldid, dofid] = grad
+      grad_dot += grad * grad
+    grad_dot_sum = wp.tile_sum(wp.tile(grad_dot))
+
+    if tid == 0:
+      ctx.grad_dot[worldid] = wp.tile_extract(grad_dot_sum, 0)
 
-  wp.launch(_grad, dim=(d.nworld, m.nv), inputs=[ctx, d])
+  _launch_world(_grad, d, [ctx, m, d])
 
   if m.opt.solver == 1:  # CG
-    smooth.solve_m(m, d, ctx.grad, ctx.Mgrad)
+    _precondition(m, d, ctx)
   elif m.opt.solver == 2:  # Newton
+    if _use_dual(d):
+      # in constraint space for the worlds whose rows fit in dual_A, the rest
+      # factor the Hessian below
+      _newton_dual(m, d, ctx)
+
+    MAXRANK = _CHOLESKY_UPDATE_MAXRANK
+
+    # update the factor with the rows that changed active state, or flag the
+    # world for a full refactorization
+    @wp.kernel
+    def _cholesky_update(ctx: types.SolverWorkspace, m: types.Model, d: types.Data):
+      worldid = wp.tid()
+
+      if ctx.done[worldid] or ctx.refactor[worldid] or ctx.dual[worldid]:
+        return
+
+      efcadr = d.efc_adr[worldid]
+      efcend = wp.min(efcadr + d.nefc[worldid], d.njmax)
+
+      rank = wp.int32(0)
+      for efcid in range(efcadr, efcend):
+        rank += int(ctx.active[efcid] != ctx.prev_active[efcid])
+
+      if rank > MAXRANK:
+        ctx.refactor[worldid] = 1
+        return
+
+      v = ctx.hupdate[worldid]
+      for efcid in range(efcadr, efcend):
+        active = ctx.active[efcid]
+        if active == ctx.prev_active[efcid]:
+          continue
+
+        sqrt_D = wp.sqrt(d.efc_D[efcid])
+        sign = float(2 * active - 1)
+        for i in range(m.nv):
+          v[i] = 0.0
+
+        if m.opt.is_sparse:
+          # sparse factor columns are in elimination order
+          start = m.nv
+          for nnzid in range(d.efc_J_rownnz[efcid]):
+            i = m.nv - 1 - d.efc_J_colind[efcid, nnzid]
+            v[i] = sqrt_D * d.efc_J[efcid, nnzid]
+            start = wp.min(start, i)
+          ok = _cholesky_rank1_sparse(m, ctx.hfactor_sparse[worldid], v, start, sign)
+        else:
+          for nnzid in range(d.efc_J_rownnz[efcid]):
+            v[d.efc_J_colind[efcid, nnzid]] = sqrt_D * d.efc_J[efcid, nnzid]
+          ok = _cholesky_rank1(ctx.hfactor[worldid], v, m.nv, sign)
+
+        if not ok:
+          ctx.refactor[worldid] = 1
+          return
+
+    if m.opt.cone == types.ConeType.ELLIPTIC:
+      # the Hessian of a cone in its middle zone is not a sum of rank-1 terms
+      ctx.refactor.fill_(1)
+    else:
+      wp.launch(_cholesky_update, dim=(d.nworld,), inputs=[ctx, m, d])
+
     # h = qM + (efc_J.T * efc_D * active) @ efc_J
     if m.opt.is_sparse:
-
+      # assemble the lower triangle in elimination order e = nv - 1 - dofid
+      # directly into the pattern of the sparse factor
       @wp.kernel
-      def _zero_h_lower(m: types.Model, ctx: Context):
-        worldid, elementid = wp.tid()
-        rowid = m.dof_tri_row[elementid]
-        colid = m.dof_tri_col[elementid]
-        ctx.h[worldid, rowid, colid] = 0.0
+      def _zero_h_sparse(ctx: types.SolverWorkspace):
+        worldid, nnzid = wp.tid()
 
-      wp.launch(_zero_h_lower, dim=(d.nworld, m.dof_tri_row.size), inputs=[m, ctx])
+        if ctx.done[worldid] or not ctx.refactor[worldid]:
+          return
+
+        ctx.hfactor_sparse[worldid, nnzid] = 0.0
+
+      wp.launch(_zero_h_sparse, dim=(d.nworld, m.hfactor_rowind.size), inputs=[ctx])
 
       @wp.kernel
-      def _set_h_qM_lower_sparse(m: types.Model, d: types.Data, ctx: Context):
+      def _set_h_qM_sparse(m: types.Model, d: types.Data, ctx: types.SolverWorkspace):
         worldid, elementid = wp.tid()
+
+        if ctx.done[worldid] or not ctx.refactor[worldid]:
+          return
+
+        # qM[i, j] with j <= i is L[nv - 1 - j, nv - 1 - i] in elimination order
         i = m.qM_fullm_i[elementid]
         j = m.qM_fullm_j[elementid]
-        ctx.h[worldid, i, j] = d.qM[worldid, 0, elementid]
+        adr = m.hfactor_adr[m.nv - 1 - j, m.nv - 1 - i]
+        ctx.hfactor_sparse[worldid, adr] = d.qM[worldid, 0, elementid]
+
+      wp.launch(_set_h_qM_sparse, dim=(d.nworld, m.qM_fullm_i.size), inputs=[m, d, ctx])
+
+      @wp.kernel
+      def _JTDAJ_sparse(ctx: types.SolverWorkspace, m: types.Model, d: types.Data):
+        worldid, adr = wp.tid()
+
+        if ctx.done[worldid] or not ctx.refactor[worldid]:
+          return
+
+        # L[row, col] in elimination order, summed in row order
+        coli = _hfactor_col(m, adr)
+        dofi = m.nv - 1 - coli
+        dofj = m.nv - 1 - m.hfactor_rowind[adr]
+        efcadr = d.efc_adr[worldid]
+        efcend = wp.min(efcadr + d.nefc[worldid], d.njmax)
+        h = wp.float32(0.0)
+        for efcid in range(efcadr, efcend):
+          efc_D = d.efc_D[efcid]
+          if efc_D == 0.0 or ctx.active[efcid] == 0:
+            continue
+
+          Ji = _efc_J_dof(d, efcid, dofi)
+          if Ji != 0.0:
+            h += Ji * _efc_J_dof(d, efcid, dofj) * efc_D
+
+        ctx.hfactor_sparse[worldid, adr] += h
 
       wp.launch(
-        _set_h_qM_lower_sparse, dim=(d.nworld, m.qM_fullm_i.size), inputs=[m, d, ctx]
+        _JTDAJ_sparse, dim=(d.nworld, m.hfactor_rowind.size), inputs=[ctx, m, d]
       )
+    elif d.efc_J.shape[1] < m.nv:
+      # compressed rows: each thread sums one row of h in row order
+      @wp.kernel
+      def _JTDAJ_rows(ctx: types.SolverWorkspace, m: types.Model, d: types.Data):
+        worldid, dofi = wp.tid()
+
+        if ctx.done[worldid] or not ctx.refactor[worldid]:
+          return
+
+        h = ctx.h[worldid, dofi]
+        for dofj in range(m.nv):
+          h[dofj] = d.qM[worldid, dofi, dofj]
+
+        efcadr = d.efc_adr[worldid]
+        efcend = wp.min(efcadr + d.nefc[worldid], d.njmax)
+        for efcid in range(efcadr, efcend):
+          efc_D = d.efc_D[efcid]
+          if efc_D == 0.0 or ctx.active[efcid] == 0:
+            continue
+
+          DJi = efc_D * _efc_J_dof(d, efcid, dofi)
+          if DJi == 0.0:
+            continue
+
+          for nnzid in range(d.efc_J_rownnz[efcid]):
+            h[d.efc_J_colind[efcid, nnzid]] += DJi * d.efc_J[efcid, nnzid]
+
+      wp.launch(_JTDAJ_rows, dim=(d.nworld, m.nv), inputs=[ctx, m, d])
     else:
+      # dense rows: accumulate tiles of TILE_EFC rows with tile_matmul
+      TILE_EFC = 32
+      NV = m.nv
+
+      @wp.func
+      def _in_world(efcid: wp.float32, efcend: wp.float32) -> wp.float32:
+        return float(efcid < efcend)
+
+      @wp.kernel(enable_backward=False)
+      def _JTDAJ_tiled(ctx: types.SolverWorkspace, d: types.Data):
+        worldid = wp.tid()
 
+        if ctx.done[worldid] or not ctx.refactor[worldid]:
+          return
+
+        h = wp.tile_load(d.qM[worldid], shape=(NV, NV))
+
+        efcadr = d.efc_adr[worldid]
+        efcend = wp.min(efcadr + d.nefc[worldid], d.njmax)
+        tileid = wp.tile_arange(TILE_EFC, dtype=wp.float32)
+        for efcid in range(efcadr, efcend, TILE_EFC):
+          # rows past the end of the world are masked out of D
+          J = wp.tile_load(d.efc_J, shape=(TILE_EFC, NV), offset=(efcid, 0))
+          efc_D = wp.tile_load(d.efc_D, shape=TILE_EFC, offset=efcid)
+          active = wp.tile_load(ctx.active, shape=TILE_EFC, offset=efcid)
+          tileend = wp.tile_ones(shape=TILE_EFC, dtype=wp.float32) * float(
+            efcend - efcid
+          )
+          D = wp.tile_map(
+            wp.mul,
+            wp.tile_map(wp.mul, efc_D, wp.tile_astype(active, dtype=wp.float32)),
+            wp.tile_map(_in_world, tileid, tileend),
+          )
+          JTD = wp.tile_map(
+            wp.mul,
+            wp.tile_transpose(J),
+            wp.tile_broadcast(D, shape=(NV, TILE_EFC)),
+          )
+          wp.tile_matmul(JTD, J, h)
+
+        wp.tile_store(ctx.h[worldid], h)
+
+      wp.launch_tiled(
+        _JTDAJ_tiled, dim=(d.nworld,), inputs=[ctx, d], block_dim=TILE_EFC
+      )
+
+    if m.opt.cone == types.ConeType.ELLIPTIC:
+      # h += efc_J.T @ cone_hessian @ efc_J for the cones in their middle zone
       @wp.kernel
-      def _copy_lower_triangle(m: types.Model, d: types.Data, ctx: Context):
+      def _JTCJ(ctx: types.SolverWorkspace, m: types.Model, d: types.Data):
         worldid, elementid = wp.tid()
-        rowid = m.dof_tri_row[elementid]
-        colid = m.dof_tri_col[elementid]
-        ctx.h[worldid, rowid, colid] = d.qM[worldid, rowid, colid]
 
-      wp.launch(
-        _copy_lower_triangle, dim=(d.nworld, m.dof_tri_row.size), inputs=[m, d, ctx]
-      )
+        if ctx.done[worldid] or not ctx.refactor[worldid]:
+          return
+
+        # sparse: an entry of the factor pattern, dense: an entry of h
+        if m.opt.is_sparse:
+          dofi = m.nv - 1 - _hfactor_col(m, elementid)
+          dofj = m.nv - 1 - m.hfactor_rowind[elementid]
+        else:
+          dofi = elementid // m.nv
+          dofj = elementid % m.nv
+
+        efcadr = d.efc_adr[worldid]
+        efcend = wp.min(efcadr + d.nefc[worldid], d.njmax)
+        val = wp.float32(0.0)
+        for efcid in range(efcadr, efcend):
+          efc_type = d.efc_type[efcid]
+          if efc_type != wp.static(types.ConstraintType.CONTACT_ELLIPTIC.value):
+            continue
+
+          # the first row of each cone, its contacts are never split
+          if d.contact.efc_address[d.efc_id[efcid]] != efcid:
+            continue
+
+          Ji = wp.vec3(
+            _efc_J_dof(d, efcid, dofi),
+            _efc_J_dof(d, efcid + 1, dofi),
+            _efc_J_dof(d, efcid + 2, dofi),
+          )
+          if Ji == wp.vec3(0.0):
+            continue
+
+          Jj = wp.vec3(
+            _efc_J_dof(d, efcid, dofj),
+            _efc_J_dof(d, efcid + 1, dofj),
+            _efc_J_dof(d, efcid + 2, dofj),
+          )
+          val += wp.dot(Ji, _cone_hessian(m, d, ctx, efcid) * Jj)
+
+        if m.opt.is_sparse:
+          ctx.hfactor_sparse[worldid, elementid] += val
+        else:
+          ctx.h[worldid, dofi, dofj] += val
+
+      if m.opt.is_sparse:
+        nelement = m.hfactor_rowind.size
+      else:
+        nelement = m.nv * m.nv
+      wp.launch(_JTCJ, dim=(d.nworld, nelement), inputs=[ctx, m, d])
 
-    @wp.kernel
-    def _JTDAJ(ctx: Context, m: types.Model, d: types.Data):
-      efcid, elementid = wp.tid()
-      dofi = m.dof_tri_row[elementid]
-      dofj = m.dof_tri_col[elementid]
+    if m.opt.is_sparse:
+      _factor_solve_sparse(m, d, ctx)
+      return
 
-      if efcid >= d.nefc_total[0]:
-        return
+    TILE = m.nv
 
-      efc_D = d.efc_D[efcid]
-      active = ctx.active[efcid]
-      if efc_D == 0.0 or active == 0:
-        return
+    if m.opt.enableflags & types.EnableBit.ISLAND.value:
+      # h is block diagonal over the islands and the unconstrained trees, so its
+      # factor is too: factor each block on its own and zero the rest
+      @wp.kernel
+      def _zero_hfactor(ctx: types.SolverWorkspace):
+        worldid, i, j = wp.tid()
 
-      worldid = d.efc_worldid[efcid]
-      # TODO(team): sparse efc_J
-      wp.atomic_add(
-        ctx.h[worldid, dofi],
-        dofj,
-        d.efc_J[efcid, dofi] * d.efc_J[efcid, dofj] * efc_D * float(active),
+        if ctx.done[worldid] or not ctx.refactor[worldid]:
+          return
+
+        ctx.hfactor[worldid, i, j] = 0.0
+
+      @wp.kernel
+      def _cholesky_factor_island(
+        ctx: types.SolverWorkspace, m: types.Model, d: types.Data
+      ):
+        worldid, treeid = wp.tid()
+
+        if ctx.done[worldid] or not ctx.refactor[worldid]:
+          return
+
+        h = ctx.h[worldid]
+        L = ctx.hfactor[worldid]
+
+        if treeid < d.nisland[worldid]:
+          _cholesky_block(
+            d,
+            worldid,
+            h,
+            L,
+            d.island_dofadr[worldid, treeid],
+            d.island_dofnum[worldid, treeid],
+            True,
+          )
+
+        # the dofs of a tree are contiguous
+        if d.tree_island[worldid, treeid] < 0:
+          dofadr = wp.int32(-1)
+          dofnum = wp.int32(0)
+          for dofid in range(m.nv):
+            if m.dof_treeid[dofid] == treeid:
+              if dofadr < 0:
+                dofadr = dofid
+              dofnum += 1
+          _cholesky_block(d, worldid, h, L, dofadr, dofnum, False)
+
+      wp.launch(_zero_hfactor, dim=(d.nworld, m.nv, m.nv), inputs=[ctx])
+      wp.launch(
+        _cholesky_factor_island, dim=(d.nworld, max(m.ntree, 1)), inputs=[ctx, m, d]
       )
+      wp.launch(_factored, dim=(d.nworld,), inputs=[ctx])
+    else:
+
+      @wp.kernel
+      def _cholesky_factor(ctx: types.SolverWorkspace):
+        worldid = wp.tid()
 
-    wp.launch(_JTDAJ, dim=(d.njmax, m.dof_tri_row.size), inputs=[ctx, m, d])
+        if ctx.done[worldid] or not ctx.refactor[worldid]:
+          return
 
-    TILE = m.nv
+        mat_tile = wp.tile_load(ctx.h[worldid], shape=(TILE, TILE))
+        fact_tile = wp.tile_cholesky(mat_tile)
+        wp.tile_store(ctx.hfactor[worldid], fact_tile)
+        ctx.refactor[worldid] = 0
+
+      wp.launch_tiled(_cholesky_factor, dim=(d.nworld,), inputs=[ctx], block_dim=32)
 
     @wp.kernel
-    def _cholesky(ctx: Context):
+    def _cholesky_solve(ctx: types.SolverWorkspace):
       worldid = wp.tid()
-      mat_tile = wp.tile_load(ctx.h[worldid], shape=(TILE, TILE))
-      fact_tile = wp.tile_cholesky(mat_tile)
+
+      if ctx.done[worldid] or ctx.dual[worldid]:
+        return
+
+      fact_tile = wp.tile_load(ctx.hfactor[worldid], shape=(TILE, TILE))
       input_tile = wp.tile_load(ctx.grad[worldid], shape=TILE)
       output_tile = wp.tile_cholesky_solve(fact_tile, input_tile)
       wp.tile_store(ctx.Mgrad[worldid], output_tile)
 
-    wp.launch_tiled(_cholesky, dim=(d.nworld,), inputs=[ctx], block_dim=32)
+    wp.launch_tiled(_cholesky_solve, dim=(d.nworld,), inputs=[ctx], block_dim=32)
 
 
-@wp.func
-def _rescale(m: types.Model, value: float) -> float:
-  return value / (m.stat.meaninertia * float(wp.max(1, m.nv)))
+def _factor_solve_sparse(m: types.Model, d: types.Data, ctx: types.SolverWorkspace):
+  """Factors the sparse Newton Hessian by elimination tree level and solves."""
 
+  @wp.kernel
+  def _factor_div(m: types.Model, ctx: types.SolverWorkspace, leveladr: int):
+    worldid, nodeid = wp.tid()
 
-@wp.func
-def _in_bracket(x: float, y: float) -> bool:
-  return (x < y) and (y < 0.0) or (x > y) and (y > 0.0)
+    if ctx.done[worldid] or not ctx.refactor[worldid]:
+      return
 
+    k = m.hfactor_level[leveladr + nodeid]
+    adr = m.hfactor_coladr[k]
+    L = ctx.hfactor_sparse[worldid]
+    Lkk = wp.sqrt(L[adr])
+    L[adr] = Lkk
+    for p in range(adr + 1, adr + m.hfactor_colnnz[k]):
+      L[p] = L[p] / Lkk
 
-def _linesearch(m: types.Model, d: types.Data, ctx: Context):
   @wp.kernel
-  def _gtol(ctx: Context, m: types.Model):
-    worldid = wp.tid()
-    smag = (
-      wp.math.sqrt(ctx.search_dot[worldid])
-      * m.stat.meaninertia
-      * float(wp.max(1, m.nv))
-    )
-    ctx.gtol[worldid] = m.opt.tolerance * m.opt.ls_tolerance * smag
+  def _factor_update(m: types.Model, ctx: types.SolverWorkspace, targetadr: int):
+    worldid, targetid = wp.tid()
 
-  wp.launch(_gtol, dim=(d.nworld,), inputs=[ctx, m])
+    if ctx.done[worldid] or not ctx.refactor[worldid]:
+      return
 
-  # mv = qM @ search
-  support.mul_m(m, d, ctx.mv, ctx.search)
+    # L[i, j] -= L[i, k] * L[j, k] for the columns k of the level, in order
+    target = m.hfactor_target[targetadr + targetid]
+    L = ctx.hfactor_sparse[worldid]
+    Lij = L[m.hfactor_update[target[0]][2]]
+    for updateid in range(target[0], target[0] + target[1]):
+      update = m.hfactor_update[updateid]
+      Lij -= L[update[0]] * L[update[1]]
+    L[m.hfactor_update[target[0]][2]] = Lij
+
+  # columns in a level only depend on the updates of lower levels
+  leveladr = m.hfactor_leveladr.numpy()
+  targetadr = m.hfactor_targetadr.numpy()
+  nnode = np.diff(np.append(leveladr, m.hfactor_level.size))
+  ntarget = np.diff(np.append(targetadr, m.hfactor_target.size))
+
+  for i in range(len(leveladr)):
+    wp.launch(_factor_div, dim=(d.nworld, nnode[i]), inputs=[m, ctx, int(leveladr[i])])
+    if ntarget[i]:
+      wp.launch(
+        _factor_update,
+        dim=(d.nworld, ntarget[i]),
+        inputs=[m, ctx, int(targetadr[i])],
+      )
 
-  # jv = efc_J @ search
-  ctx.jv.zero_()
+  wp.launch(_factored, dim=(d.nworld,), inputs=[ctx])
 
+  # Mgrad = L^-T L^-1 grad, with x[e] = Mgrad[nv - 1 - e]
   @wp.kernel
-  def _jv(ctx: Context, d: types.Data):
-    efcid, dofid = wp.tid()
+  def _solve_forward(m: types.Model, ctx: types.SolverWorkspace, leveladr: int):
+    worldid, nodeid = wp.tid()
 
-    if efcid >= d.nefc_total[0]:
+    if ctx.done[worldid] or ctx.dual[worldid]:
       return
 
-    worldid = d.efc_worldid[efcid]
-    wp.atomic_add(
-      ctx.jv,
-      efcid,
-      d.efc_J[efcid, dofid] * ctx.search[worldid, dofid],
-    )
+    # x[k] = (x[k] - L[k, :k] @ x[:k]) / L[k, k], the columns of row k are in
+    # lower levels
+    k = m.hfactor_level[leveladr + nodeid]
+    L = ctx.hfactor_sparse[worldid]
+    x = ctx.Mgrad[worldid]
+    xk = x[m.nv - 1 - k]
+    rowadr = m.hfactor_rowadr[k]
+    for p in range(rowadr, rowadr + m.hfactor_rownnz[k]):
+      row = m.hfactor_row[p]
+      xk -= L[row[0]] * x[m.nv - 1 - row[1]]
+    x[m.nv - 1 - k] = xk / L[m.hfactor_coladr[k]]
 
-  wp.launch(_jv, dim=(d.njmax, m.nv), inputs=[ctx, d])
+  @wp.kernel
+  def _solve_backward(m: types.Model, ctx: types.SolverWorkspace, leveladr: int):
+    worldid, nodeid = wp.tid()
 
-  # prepare quadratics
-  # quad_gauss = [gauss, search.T @ Ma - search.T @ qfrc_smooth, 0.5 * search.T @ mv]
-  ctx.quad_gauss.zero_()
+    if ctx.done[worldid] or ctx.dual[worldid]:
+      return
+
+    k = m.hfactor_level[leveladr + nodeid]
+    adr = m.hfactor_coladr[k]
+    L = ctx.hfactor_sparse[worldid]
+    x = ctx.Mgrad[worldid]
+    xk = x[m.nv - 1 - k]
+    for p in range(adr + 1, adr + m.hfactor_colnnz[k]):
+      xk -= L[p] * x[m.nv - 1 - m.hfactor_rowind[p]]
+    x[m.nv - 1 - k] = xk / L[adr]
 
   @wp.kernel
-  def _quad_gauss(ctx: Context, m: types.Model, d: types.Data):
+  def _copy_grad(ctx: types.SolverWorkspace):
     worldid, dofid = wp.tid()
-    search = ctx.search[worldid, dofid]
-    quad_gauss = wp.vec3(
-      ctx.gauss[worldid] / float(m.nv),
-      search * (ctx.Ma[worldid, dofid] - d.qfrc_smooth[worldid, dofid]),
-      0.5 * search * ctx.mv[worldid, dofid],
+
+    if ctx.done[worldid] or ctx.dual[worldid]:
+      return
+
+    ctx.Mgrad[worldid, dofid] = ctx.grad[worldid, dofid]
+
+  wp.launch(_copy_grad, dim=(d.nworld, m.nv), inputs=[ctx])
+
+  for i in range(len(leveladr)):
+    wp.launch(
+      _solve_forward, dim=(d.nworld, nnode[i]), inputs=[m, ctx, int(leveladr[i])]
     )
-    wp.atomic_add(ctx.quad_gauss, worldid, quad_gauss)
 
-  wp.launch(_quad_gauss, dim=(d.nworld, m.nv), inputs=[ctx, m, d])
+  for i in reversed(range(len(leveladr))):
+    wp.launch(
+      _solve_backward, dim=(d.nworld, nnode[i]), inputs=[m, ctx, int(leveladr[i])]
+    )
 
-  # quad = [0.5 * Jaref * Jaref * efc_D, jv * Jaref * efc_D, 0.5 * jv * jv * efc_D]
-  @wp.kernel
-  def _quad(ctx: Context, d: types.Data):
-    efcid = wp.tid()
 
-    if efcid >= d.nefc_total[0]:
-      return
+@wp.func
+def _rescale(m: types.Model, value: float) -> float:
+  return value / (m.stat.meaninertia * float(wp.max(1, m.nv)))
+
 
-    Jaref = ctx.Jaref[efcid]
-    jv = ctx.jv[efcid]
-    efc_D = d.efc_D[efcid]
-    ctx.quad[efcid][0] = 0.5 * Jaref * Jaref * efc_D
-    ctx.quad[efcid][1] = jv * Jaref * efc_D
-    ctx.quad[efcid][2] = 0.5 * jv * jv * efc_D
+@wp.func
+def _in_bracket(x: float, y: float) -> bool:
+  return (x < y) and (y < 0.0) or (x > y) and (y > 0.0)
 
-  wp.launch(_quad, dim=(d.njmax), inputs=[ctx, d])
 
+def _while_loop(body, condition: wp.array, niter: int):
+  """Runs body until condition[0] is zero, for at most niter iterations.
+
+  Under graph capture the loop is a device-side conditional node. In eager mode
+  the condition is read back every _EAGER_CHECK_FREQ iterations.
+  """
+  if condition.device.is_capturing:
+    wp.capture_while(condition, body)
+  else:
+    for i in range(niter):
+      body()
+      if (i + 1) % _EAGER_CHECK_FREQ == 0 and not condition.numpy()[0]:
+        break
+
+
+def _linesearch_iterative(m: types.Model, d: types.Data, ctx: types.SolverWorkspace):
   # initialize interval
-  ls_ctx = _create_lscontext(m, d, ctx)
+  ls_ctx = ctx.ls
+
+  # worlds that converged in the solver are already done in the linesearch
+  ls_ctx.nsolving.zero_()
+
+  @wp.kernel
+  def _init_done(ls_ctx: types.LSContext, ctx: types.SolverWorkspace):
+    worldid = wp.tid()
+    done = ctx.done[worldid]
+    ls_ctx.done[worldid] = done
+    ls_ctx.swap[worldid] = 1
+    ls_ctx.ls_iter[worldid] = 0
+
+    if not done:
+      wp.atomic_add(ls_ctx.nsolving, 0, 1)
+
+  wp.launch(_init_done, dim=(d.nworld,), inputs=[ls_ctx, ctx])
 
   ls_ctx.p0.alpha.zero_()
-  _eval_lspoint(ls_ctx.p0, m, d, ctx)
+  _eval_lspoint(ls_ctx.p0, m, d, ctx, ls_ctx.done)
 
   @wp.kernel
-  def _lo_alpha(lo: LSPoint, p0: LSPoint, ctx: Context):
+  def _lo_alpha(lo: types.LSPoint, p0: types.LSPoint, ctx: types.SolverWorkspace):
     worldid = wp.tid()
+
+    if ctx.done[worldid]:
+      return
+
     lo.alpha[worldid] = p0.alpha[worldid] - p0.deriv_0[worldid] / (
       p0.deriv_1[worldid] + float(p0.deriv_1[worldid] == 0.0) * mujoco.mjMINVAL
     )
 
   wp.launch(_lo_alpha, dim=(d.nworld,), inputs=[ls_ctx.lo, ls_ctx.p0, ctx])
 
-  _eval_lspoint(ls_ctx.lo, m, d, ctx)
+  _eval_lspoint(ls_ctx.lo, m, d, ctx, ls_ctx.done)
 
   @wp.kernel
-  def _tree_map(ls_ctx: LSContext):
+  def _tree_map(ls_ctx: types.LSContext, ctx: types.SolverWorkspace):
     worldid = wp.tid()
 
+    if ctx.done[worldid]:
+      return
+
     lesser = float(ls_ctx.lo.deriv_0[worldid] < ls_ctx.p0.deriv_0[worldid])
     not_lesser = 1.0 - lesser
 
@@ -484,16 +1261,17 @@ def _linesearch(m: types.Model, d: types.Data, ctx: Context):
       lesser * ls_ctx.lo.deriv_1[worldid] + not_lesser * ls_ctx.p0.deriv_1[worldid]
     )
 
-  wp.launch(_tree_map, dim=(d.nworld,), inputs=[ls_ctx])
-
-  ls_ctx.swap.fill_(1)
-  ls_ctx.ls_iter.fill_(0)
+  wp.launch(_tree_map, dim=(d.nworld,), inputs=[ls_ctx, ctx])
 
-  for i in range(m.opt.ls_iterations):
+  def _ls_iteration():
 
     @wp.kernel
-    def _alpha_lo_next_hi_next_mid(ls_ctx: LSContext):
+    def _alpha_lo_next_hi_next_mid(ls_ctx: types.LSContext):
       worldid = wp.tid()
+
+      if ls_ctx.done[worldid]:
+        return
+
       ls_ctx.lo_next.alpha[worldid] = ls_ctx.lo.alpha[worldid] - ls_ctx.lo.deriv_0[
         worldid
       ] / (
@@ -512,14 +1290,15 @@ def _linesearch(m: types.Model, d: types.Data, ctx: Context):
 
     wp.launch(_alpha_lo_next_hi_next_mid, dim=(d.nworld,), inputs=[ls_ctx])
 
-    _eval_lspoint(ls_ctx.lo_next, m, d, ctx)
-    _eval_lspoint(ls_ctx.hi_next, m, d, ctx)
-    _eval_lspoint(ls_ctx.mid, m, d, ctx)
+    _eval_lspoint_next_mid(m, d, ctx, ls_ctx)
 
     @wp.kernel
-    def _swap_lo_hi(ls_ctx: LSContext):
+    def _swap_lo_hi(ls_ctx: types.LSContext):
       worldid = wp.tid()
 
+      if ls_ctx.done[worldid]:
+        return
+
       ls_ctx.ls_iter[worldid] += 1
 
       lo_alpha = ls_ctx.lo.alpha[worldid]
@@ -645,10 +1424,17 @@ def _linesearch(m: types.Model, d: types.Data, ctx: Context):
 
     wp.launch(_swap_lo_hi, dim=(d.nworld,), inputs=[ls_ctx])
 
+    # done flags are sticky, nsolving counts the worlds that are not bracketed
+    ls_ctx.nsolving.zero_()
+
     @wp.kernel
-    def _done(ls_ctx: LSContext, ctx: Context, m: types.Model, ls_iter: int):
+    def _done(ls_ctx: types.LSContext, ctx: types.SolverWorkspace, m: types.Model):
       worldid = wp.tid()
-      done = ls_iter >= m.opt.ls_iterations
+
+      if ls_ctx.done[worldid]:
+        return
+
+      done = ls_ctx.ls_iter[worldid] >= m.opt.ls_iterations
       done = done or (1 - ls_ctx.swap[worldid])
       done = done or (
         (ls_ctx.lo.deriv_0[worldid] < 0.0)
@@ -660,12 +1446,23 @@ def _linesearch(m: types.Model, d: types.Data, ctx: Context):
       )
       ls_ctx.done[worldid] = int(done)
 
-    wp.launch(_done, dim=(d.nworld,), inputs=[ls_ctx, ctx, m, i])
-    # TODO(team): return if all done
+      if not done:
+        wp.atomic_add(ls_ctx.nsolving, 0, 1)
+
+    wp.launch(_done, dim=(d.nworld,), inputs=[ls_ctx, ctx, m])
+
+  if m.opt.ls_iterations:
+    _while_loop(_ls_iteration, ls_ctx.nsolving, m.opt.ls_iterations)
 
   @wp.kernel
-  def _alpha(ctx: Context, ls_ctx: LSContext):
+  def _alpha(ctx: types.SolverWorkspace, ls_ctx: types.LSContext, d: types.Data):
     worldid = wp.tid()
+
+    if ctx.done[worldid]:
+      return
+
+    d.solver_nls[worldid] += ls_ctx.ls_iter[worldid]
+
     p0_cost = ls_ctx.p0.cost[worldid]
     lo_cost = ls_ctx.lo.cost[worldid]
     hi_cost = ls_ctx.hi.cost[worldid]
@@ -677,11 +1474,227 @@ def _linesearch(m: types.Model, d: types.Data, ctx: Context):
       + (1.0 - lo_hi_cost) * ls_ctx.hi.alpha[worldid]
     )
 
-  wp.launch(_alpha, dim=(d.nworld,), inputs=[ctx, ls_ctx])
+  wp.launch(_alpha, dim=(d.nworld,), inputs=[ctx, ls_ctx, d])
+
+
+def _linesearch_exact(m: types.Model, d: types.Data, ctx: types.SolverWorkspace):
+  """Finds the minimizer of the cost along the search direction in one sweep.
+
+  The cost is piecewise quadratic in alpha: quad_gauss plus the quad of every row
+  with Jaref + alpha * jv < 0. The active set only changes at the breakpoints
+  alpha = -Jaref / jv, so each world's breakpoints are sorted and swept in
+  ascending order until the derivative turns non-negative.
+  """
+  ls_ctx = ctx.ls
 
   @wp.kernel
-  def _qacc_ma(ctx: Context, d: types.Data):
+  def _efc_end(ls_ctx: types.LSContext, d: types.Data):
+    worldid = wp.tid()
+    efcadr = d.efc_adr[worldid]
+    ls_ctx.efc_end[worldid] = wp.max(efcadr, wp.min(efcadr + d.nefc[worldid], d.njmax))
+
+  wp.launch(_efc_end, dim=(d.nworld,), inputs=[ls_ctx, d])
+
+  @wp.kernel
+  def _breakpoint(
+    ls_ctx: types.LSContext, ctx: types.SolverWorkspace, d: types.Data, nthread: int
+  ):
+    tid = wp.tid()
+
+    for efcid in range(tid, _nefc(d), nthread):
+      if ctx.done[d.efc_worldid[efcid]]:
+        continue
+
+      # rows with jv == 0 never change state and are sorted last
+      jv = ctx.jv[efcid]
+      breakpoint = float(wp.inf)
+      if jv != 0.0:
+        breakpoint = -ctx.Jaref[efcid] / jv
+      ls_ctx.breakpoint[efcid] = breakpoint
+      ls_ctx.breakpoint_efcid[efcid] = efcid
+
+  _launch_efc(_breakpoint, d, [ls_ctx, ctx, d])
+
+  wp.utils.segmented_sort_pairs(
+    ls_ctx.breakpoint, ls_ctx.breakpoint_efcid, d.njmax, d.efc_adr, ls_ctx.efc_end
+  )
+
+  @wp.kernel
+  def _sweep(ls_ctx: types.LSContext, ctx: types.SolverWorkspace, d: types.Data):
+    worldid = wp.tid()
+
+    if ctx.done[worldid]:
+      return
+
+    efcadr = d.efc_adr[worldid]
+    efcend = ls_ctx.efc_end[worldid]
+
+    # rows with jv > 0 are active as alpha -> -inf
+    quad = ctx.quad_gauss[worldid]
+    for efcid in range(efcadr, efcend):
+      jv = ctx.jv[efcid]
+      if jv > 0.0 or (jv == 0.0 and ctx.Jaref[efcid] < 0.0):
+        quad += ctx.quad[efcid]
+
+    # the minimizer is in the first interval whose upper breakpoint has a
+    # non-negative derivative
+    lo = float(-wp.inf)
+    hi = float(wp.inf)
+    for i in range(efcadr, efcend):
+      d.solver_nls[worldid] += 1
+      breakpoint = ls_ctx.breakpoint[i]
+      if breakpoint == wp.inf or 2.0 * quad[2] * breakpoint + quad[1] >= 0.0:
+        hi = breakpoint
+        break
+
+      efcid = ls_ctx.breakpoint_efcid[i]
+      if ctx.jv[efcid] > 0.0:
+        quad -= ctx.quad[efcid]
+      else:
+        quad += ctx.quad[efcid]
+      lo = breakpoint
+
+    alpha = -quad[1] / (2.0 * quad[2] + float(quad[2] == 0.0) * mujoco.mjMINVAL)
+    ctx.alpha[worldid] = wp.clamp(alpha, lo, hi)
+
+  wp.launch(_sweep, dim=(d.nworld,), inputs=[ls_ctx, ctx, d])
+
+
+@wp.func
+def _quad_elliptic(
+  ctx: types.SolverWorkspace, m: types.Model, d: types.Data, efcid: wp.int32
+):
+  """Sets up the quadratics of an elliptic cone for _eval_pt_elliptic."""
+  # the first row of a cone sets up the whole cone
+  conid = d.efc_id[efcid]
+  if d.contact.efc_address[conid] != efcid or efcid + 2 >= d.njmax:
+    return
+
+  # complete vector quadratic (for bottom zone)
+  quad = wp.vec3(0.0)
+  for i in range(3):
+    Jaref = ctx.Jaref[efcid + i]
+    jv = ctx.jv[efcid + i]
+    efc_D = d.efc_D[efcid + i]
+    quad += wp.vec3(0.5 * Jaref * Jaref, jv * Jaref, 0.5 * jv * jv) * efc_D
+
+  # rescale to make primal cone circular
+  friction = d.contact.friction[conid]
+  mu = _elliptic_mu(m, d, conid)
+  u1 = ctx.Jaref[efcid + 1] * friction[0]
+  u2 = ctx.Jaref[efcid + 2] * friction[1]
+  v1 = ctx.jv[efcid + 1] * friction[0]
+  v2 = ctx.jv[efcid + 2] * friction[1]
+  dm = d.efc_D[efcid] / wp.max(mu * mu * (1.0 + mu * mu), types.MJ_MINVAL)
+
+  ctx.quad[efcid] = quad
+  ctx.quad[efcid + 1] = wp.vec3(
+    ctx.Jaref[efcid] * mu, ctx.jv[efcid] * mu, u1 * u1 + u2 * u2
+  )
+  ctx.quad[efcid + 2] = wp.vec3(u1 * v1 + u2 * v2, v1 * v1 + v2 * v2, dm)
+
+
+def _linesearch(m: types.Model, d: types.Data, ctx: types.SolverWorkspace):
+  @wp.kernel
+  def _gtol(ctx: types.SolverWorkspace, m: types.Model):
+    worldid = wp.tid()
+
+    if ctx.done[worldid]:
+      return
+
+    smag = (
+      wp.math.sqrt(ctx.search_dot[worldid])
+      * m.stat.meaninertia
+      * float(wp.max(1, m.nv))
+    )
+    ctx.gtol[worldid] = m.opt.tolerance * m.opt.ls_tolerance * smag
+
+  wp.launch(_gtol, dim=(d.nworld,), inputs=[ctx, m])
+
+  # mv = qM @ search
+  support.mul_m(m, d, ctx.mv, ctx.search)
+
+  # jv = efc_J @ search
+  @wp.kernel
+  def _jv(ctx: types.SolverWorkspace, d: types.Data, nthread: int):
+    tid = wp.tid()
+
+    for efcid in range(tid, _nefc(d), nthread):
+      worldid = d.efc_worldid[efcid]
+
+      if ctx.done[worldid]:
+        continue
+
+      jv = wp.float32(0.0)
+      for nnzid in range(d.efc_J_rownnz[efcid]):
+        dofid = d.efc_J_colind[efcid, nnzid]
+        jv += d.efc_J[efcid, nnzid] * ctx.search[worldid, dofid]
+      ctx.jv[efcid] = jv
+
+  _launch_efc(_jv, d, [ctx, d])
+
+  # prepare quadratics
+  # quad_gauss = [gauss, search.T @ Ma - search.T @ qfrc_smooth, 0.5 * search.T @ mv]
+  @wp.kernel(enable_backward=False)
+  def _quad_gauss(ctx: types.SolverWorkspace, m: types.Model, d: types.Data):
+    worldid, tid = wp.tid()
+
+    if ctx.done[worldid]:
+      return
+
+    quad_gauss_1 = wp.float32(0.0)
+    quad_gauss_2 = wp.float32(0.0)
+    for dofid in range(tid, m.nv, wp.block_dim()):
+      search = ctx.search[worldid, dofid]
+      quad_gauss_1 += search * (ctx.Ma[worldid, dofid] - d.qfrc_smooth[worldid, dofid])
+      quad_gauss_2 += 0.5 * search * ctx.mv[worldid, dofid]
+    quad_gauss_1_sum = wp.tile_sum(wp.tile(quad_gauss_1))
+    quad_gauss_2_sum = wp.tile_sum(wp.tile(quad_gauss_2))
+
+    if tid == 0:
+      ctx.quad_gauss[worldid] = wp.vec3(
+        ctx.gauss[worldid],
+        wp.tile_extract(quad_gauss_1_sum, 0),
+        wp.tile_extract(quad_gauss_2_sum, 0),
+      )
+
+  _launch_world(_quad_gauss, d, [ctx, m, d])
+
+  # quad = [0.5 * Jaref * Jaref * efc_D, jv * Jaref * efc_D, 0.5 * jv * jv * efc_D]
+  @wp.kernel
+  def _quad(ctx: types.SolverWorkspace, m: types.Model, d: types.Data, nthread: int):
+    tid = wp.tid()
+
+    for efcid in range(tid, _nefc(d), nthread):
+      if ctx.done[d.efc_worldid[efcid]]:
+        continue
+
+      if d.efc_type[efcid] == wp.static(types.ConstraintType.CONTACT_ELLIPTIC.value):
+        _quad_elliptic(ctx, m, d, efcid)
+        continue
+
+      Jaref = ctx.Jaref[efcid]
+      jv = ctx.jv[efcid]
+      efc_D = d.efc_D[efcid]
+      ctx.quad[efcid][0] = 0.5 * Jaref * Jaref * efc_D
+      ctx.quad[efcid][1] = jv * Jaref * efc_D
+      ctx.quad[efcid][2] = 0.5 * jv * jv * efc_D
+
+  _launch_efc(_quad, d, [ctx, m, d])
+
+  # the cost of an elliptic cone is not piecewise quadratic in alpha
+  if m.opt.ls_exact and m.opt.cone == types.ConeType.PYRAMIDAL:
+    _linesearch_exact(m, d, ctx)
+  else:
+    _linesearch_iterative(m, d, ctx)
+
+  @wp.kernel
+  def _qacc_ma(ctx: types.SolverWorkspace, d: types.Data):
     worldid, dofid = wp.tid()
+
+    if ctx.done[worldid]:
+      return
+
     alpha = ctx.alpha[worldid]
     d.qacc[worldid, dofid] += alpha * ctx.search[worldid, dofid]
     ctx.Ma[worldid, dofid] += alpha * ctx.mv[worldid, dofid]
@@ -689,96 +1702,870 @@ def _linesearch(m: types.Model, d: types.Data, ctx: Context):
   wp.launch(_qacc_ma, dim=(d.nworld, m.nv), inputs=[ctx, d])
 
   @wp.kernel
-  def _jaref(ctx: Context, d: types.Data):
-    efcid = wp.tid()
+  def _jaref(ctx: types.SolverWorkspace, d: types.Data, nthread: int):
+    tid = wp.tid()
 
-    if efcid >= d.nefc_total[0]:
-      return
+    for efcid in range(tid, _nefc(d), nthread):
+      worldid = d.efc_worldid[efcid]
 
-    worldid = d.efc_worldid[efcid]
-    ctx.Jaref[efcid] += ctx.alpha[worldid] * ctx.jv[efcid]
+      if ctx.done[worldid]:
+        continue
 
-  wp.launch(_jaref, dim=(d.njmax,), inputs=[ctx, d])
+      ctx.Jaref[efcid] += ctx.alpha[worldid] * ctx.jv[efcid]
 
+  _launch_efc(_jaref, d, [ctx, d])
 
-def solve(m: types.Model, d: types.Data):
-  """Finds forces that satisfy constraints."""
 
-  # warmstart
-  wp.copy(d.qacc, d.qacc_warmstart)
+def _solver_iteration(m: types.Model, d: types.Data, ctx: types.SolverWorkspace):
+  _linesearch(m, d, ctx)
+  wp.copy(ctx.prev_grad, ctx.grad)
+  wp.copy(ctx.prev_Mgrad, ctx.Mgrad)
+  _update_constraint(m, d, ctx)
+  _update_gradient(m, d, ctx)
 
-  ctx = _context(m, d)
-  _create_context(ctx, m, d, grad=True)
+  if m.opt.solver == 2:  # Newton
+    _search_newton(m, d, ctx)
+  else:  # polak-ribiere
 
-  for i in range(m.opt.iterations):
-    _linesearch(m, d, ctx)
-    wp.copy(ctx.prev_grad, ctx.grad)
-    wp.copy(ctx.prev_Mgrad, ctx.Mgrad)
-    _update_constraint(m, d, ctx)
-    _update_gradient(m, d, ctx)
+    @wp.kernel(enable_backward=False)
+    def _search_cg(ctx: types.SolverWorkspace, m: types.Model):
+      worldid, tid = wp.tid()
+
+      if ctx.done[worldid]:
+        return
 
-    if m.opt.solver == 2:  # Newton
-      ctx.search_dot.zero_()
+      beta_num = wp.float32(0.0)
+      beta_den = wp.float32(0.0)
+      for dofid in range(tid, m.nv, wp.block_dim()):
+        prev_Mgrad = ctx.prev_Mgrad[worldid, dofid]
+        beta_num += ctx.grad[worldid, dofid] * (ctx.Mgrad[worldid, dofid] - prev_Mgrad)
+        beta_den += ctx.prev_grad[worldid, dofid] * prev_Mgrad
+      beta_num_sum = wp.tile_sum(wp.tile(beta_num))
+      beta_den_sum = wp.tile_sum(wp.tile(beta_den))
+
+      beta = wp.max(
+        0.0,
+        wp.tile_extract(beta_num_sum, 0)
+        / wp.max(mujoco.mjMINVAL, wp.tile_extract(beta_den_sum, 0)),
+      )
 
-      @wp.kernel
-      def _search_newton(ctx: Context):
-        worldid, dofid = wp.tid()
-        search = -1.0 * ctx.Mgrad[worldid, dofid]
+      search_dot = wp.float32(0.0)
+      for dofid in range(tid, m.nv, wp.block_dim()):
+        search = -1.0 * ctx.Mgrad[worldid, dofid] + beta * ctx.search[worldid, dofid]
         ctx.search[worldid, dofid] = search
-        wp.atomic_add(ctx.search_dot, worldid, search * search)
+        search_dot += search * search
+      search_dot_sum = wp.tile_sum(wp.tile(search_dot))
 
-      wp.launch(_search_newton, dim=(d.nworld, m.nv), inputs=[ctx])
-    else:  # polak-ribiere
-      ctx.beta_num.zero_()
-      ctx.beta_den.zero_()
+      if tid == 0:
+        ctx.beta[worldid] = beta
+        ctx.search_dot[worldid] = wp.tile_extract(search_dot_sum, 0)
 
-      @wp.kernel
-      def _beta_num_den(ctx: Context):
-        worldid, dofid = wp.tid()
-        prev_Mgrad = ctx.prev_Mgrad[worldid][dofid]
-        wp.atomic_add(
-          ctx.beta_num,
-          worldid,
-          ctx.grad[worldid, dofid] * (ctx.Mgrad[worldid, dofid] - prev_Mgrad),
-        )
-        wp.atomic_add(ctx.beta_den, worldid, ctx.prev_grad[worldid, dofid] * prev_Mgrad)
+    _launch_world(_search_cg, d, [ctx, m])
 
-      wp.launch(_beta_num_den, dim=(d.nworld, m.nv), inputs=[ctx])
+  # done flags are sticky, nsolving counts the worlds that still iterate
+  ctx.nsolving.zero_()
 
-      @wp.kernel
-      def _beta(ctx: Context):
-        worldid = wp.tid()
-        ctx.beta[worldid] = wp.max(
-          0.0, ctx.beta_num[worldid] / wp.max(mujoco.mjMINVAL, ctx.beta_den[worldid])
+  @wp.kernel
+  def _done(ctx: types.SolverWorkspace, m: types.Model, d: types.Data):
+    worldid = wp.tid()
+
+    if ctx.done[worldid]:
+      return
+
+    solver_niter = d.solver_niter[worldid] + 1
+    d.solver_niter[worldid] = solver_niter
+
+    improvement = _rescale(m, ctx.prev_cost[worldid] - ctx.cost[worldid])
+    gradient = _rescale(m, wp.math.sqrt(ctx.grad_dot[worldid]))
+    d.solver_improvement[worldid] = improvement
+    d.solver_gradient[worldid] = gradient
+    done = solver_niter >= m.opt.iterations
+    done = done or (improvement < m.opt.tolerance)
+    done = done or (gradient < m.opt.tolerance)
+    ctx.done[worldid] = int(done)
+
+    if not done:
+      wp.atomic_add(ctx.nsolving, 0, 1)
+
+  wp.launch(_done, dim=(d.nworld,), inputs=[ctx, m, d])
+
+
+@wp.func
+def _qcqp2(A: wp.mat22, b: wp.vec2, fri: wp.vec2, r: wp.float32) -> wp.vec2:
+  """Minimizes 0.5 * x' A x + x' b subject to sum((x / fri)^2) <= r^2."""
+  # scale to the circle |y| <= r with y = x / fri
+  A11 = A[0, 0] * fri[0] * fri[0]
+  A22 = A[1, 1] * fri[1] * fri[1]
+  A12 = A[0, 1] * fri[0] * fri[1]
+  b1 = b[0] * fri[0]
+  b2 = b[1] * fri[1]
+
+  # Newton's method on the multiplier la of (A + la * I) y = -b, |y| = r
+  la = wp.float32(0.0)
+  y1 = wp.float32(0.0)
+  y2 = wp.float32(0.0)
+  for i in range(20):
+    det = (A11 + la) * (A22 + la) - A12 * A12
+    if det < 1.0e-10:
+      return wp.vec2(0.0)
+
+    P11 = (A22 + la) / det
+    P22 = (A11 + la) / det
+    P12 = -A12 / det
+    y1 = -P11 * b1 - P12 * b2
+    y2 = -P12 * b1 - P22 * b2
+
+    # the unconstrained minimizer is feasible, or the constraint is met
+    val = y1 * y1 + y2 * y2 - r * r
+    if val < 1.0e-10:
+      break
+
+    deriv = -2.0 * (P11 * y1 * y1 + 2.0 * P12 * y1 * y2 + P22 * y2 * y2)
+    delta = -val / deriv
+    if delta < 1.0e-10:
+      break
+    la += delta
+
+  return wp.vec2(y1 * fri[0], y2 * fri[1])
+
+
+def _minv_jt(m: types.Model, d: types.Data, ctx: types.SolverWorkspace):
+  """Computes the rows of MinvJT = M^-1 @ efc_J.T with the factor of M."""
+
+  @wp.kernel
+  def _minv_jt_kernel(
+    ctx: types.SolverWorkspace, m: types.Model, d: types.Data, nthread: int
+  ):
+    tid = wp.tid()
+
+    for efcid in range(tid, _nefc(d), nthread):
+      worldid = d.efc_worldid[efcid]
+      x = ctx.MinvJT[efcid]
+      for i in range(m.nv):
+        x[i] = 0.0
+      for nnzid in range(d.efc_J_rownnz[efcid]):
+        x[d.efc_J_colind[efcid, nnzid]] = d.efc_J[efcid, nnzid]
+
+      if m.opt.is_sparse:
+        # serial version of smooth._solve_LD_sparse
+        nupdate = m.qLD_update_tree.shape[0]
+        for updateid in range(nupdate - 1, -1, -1):
+          update = m.qLD_update_tree[updateid]
+          x[update[0]] -= d.qLD[worldid, 0, update[2]] * x[update[1]]
+        for i in range(m.nv):
+          x[i] *= d.qLDiagInv[worldid, i]
+        for updateid in range(nupdate):
+          update = m.qLD_update_tree[updateid]
+          x[update[1]] -= d.qLD[worldid, 0, update[2]] * x[update[0]]
+      else:
+        # x = inv(L') @ inv(L) @ x
+        for i in range(m.nv):
+          xi = x[i]
+          for j in range(i):
+            xi -= d.qLD[worldid, i, j] * x[j]
+          x[i] = xi / d.qLD[worldid, i, i]
+        for i in range(m.nv - 1, -1, -1):
+          xi = x[i]
+          for j in range(i + 1, m.nv):
+            xi -= d.qLD[worldid, j, i] * x[j]
+          x[i] = xi / d.qLD[worldid, i, i]
+
+  _launch_efc(_minv_jt_kernel, d, [ctx, m, d])
+
+
+def _use_dual(d: types.Data) -> bool:
+  return d.solver_workspace.dual_A.shape[1] > 0
+
+
+def _dual_matrix(m: types.Model, d: types.Data, ctx: types.SolverWorkspace):
+  """Computes each world's Delassus matrix dual_A = efc_J @ M^-1 @ efc_J.T.
+
+  M is constant over a solve, so the matrix is computed once per solve. Worlds
+  with more rows than the workspace has room for are left out, ctx.dual flags
+  the worlds that fit, which never factor the Hessian.
+  """
+  _minv_jt(m, d, ctx)
+
+  NDUAL = ctx.dual_A.shape[1]
+
+  @wp.kernel
+  def _dual_a(ctx: types.SolverWorkspace, d: types.Data):
+    worldid, i, j = wp.tid()
+
+    efcadr = d.efc_adr[worldid]
+    nrow = wp.min(efcadr + d.nefc[worldid], d.njmax) - efcadr
+
+    if i == 0 and j == 0:
+      if nrow <= NDUAL:
+        ctx.dual[worldid] = 1
+        ctx.refactor[worldid] = 0
+      else:
+        ctx.dual[worldid] = 0
+
+    if nrow > NDUAL or i >= nrow or j >= nrow:
+      ctx.dual_A[worldid, i, j] = 0.0
+      return
+
+    A = wp.float32(0.0)
+    for nnzid in range(d.efc_J_rownnz[efcadr + i]):
+      dofid = d.efc_J_colind[efcadr + i, nnzid]
+      A += d.efc_J[efcadr + i, nnzid] * ctx.MinvJT[efcadr + j, dofid]
+    ctx.dual_A[worldid, i, j] = A
+
+  wp.launch(_dual_a, dim=(d.nworld, NDUAL, NDUAL), inputs=[ctx, d])
+
+
+def _newton_dual(m: types.Model, d: types.Data, ctx: types.SolverWorkspace):
+  """Solves for the Newton direction Mgrad = H^-1 @ grad in constraint space.
+
+  With H = M + Ja.T @ Da @ Ja over the active rows a, the Woodbury identity gives
+
+    H^-1 @ grad = y - M^-1 @ Ja.T @ z,  y = M^-1 @ grad,
+    (Ja @ M^-1 @ Ja.T + Da^-1) @ z = Ja @ y,
+
+  so each iteration factors an nefc x nefc matrix instead of the nv x nv
+  Hessian. Only the worlds flagged in ctx.dual are solved here, the rest factor
+  the Hessian in dof space.
+  """
+  NDUAL = ctx.dual_A.shape[1]
+
+  smooth.solve_m(m, d, ctx.Mgrad, ctx.grad)
+
+  # inactive rows, and the padding past the world's rows, are identity rows
+  @wp.kernel
+  def _dual_system(ctx: types.SolverWorkspace, d: types.Data):
+    worldid, i, j = wp.tid()
+
+    if ctx.done[worldid] or not ctx.dual[worldid]:
+      return
+
+    efcadr = d.efc_adr[worldid]
+    nrow = wp.min(efcadr + d.nefc[worldid], d.njmax) - efcadr
+
+    active_i = wp.bool(False)
+    active_j = wp.bool(False)
+    if i < nrow:
+      active_i = ctx.active[efcadr + i] != 0 and d.efc_D[efcadr + i] > 0.0
+    if j < nrow:
+      active_j = ctx.active[efcadr + j] != 0 and d.efc_D[efcadr + j] > 0.0
+
+    S = wp.float32(0.0)
+    if active_i and active_j:
+      S = ctx.dual_A[worldid, i, j]
+    if i == j:
+      if active_i:
+        S += 1.0 / d.efc_D[efcadr + i]
+      else:
+        S = 1.0
+    ctx.dual_S[worldid, i, j] = S
+
+    if j != 0:
+      return
+
+    # b = Ja @ y
+    b = wp.float32(0.0)
+    if active_i:
+      efcid = efcadr + i
+      for nnzid in range(d.efc_J_rownnz[efcid]):
+        dofid = d.efc_J_colind[efcid, nnzid]
+        b += d.efc_J[efcid, nnzid] * ctx.Mgrad[worldid, dofid]
+    ctx.dual_b[worldid, i] = b
+
+  wp.launch(_dual_system, dim=(d.nworld, NDUAL, NDUAL), inputs=[ctx, d])
+
+  @wp.kernel
+  def _dual_solve(ctx: types.SolverWorkspace):
+    worldid = wp.tid()
+
+    if ctx.done[worldid] or not ctx.dual[worldid]:
+      return
+
+    S = wp.tile_load(ctx.dual_S[worldid], shape=(NDUAL, NDUAL))
+    b = wp.tile_load(ctx.dual_b[worldid], shape=NDUAL)
+    z = wp.tile_cholesky_solve(wp.tile_cholesky(S), b)
+    wp.tile_store(ctx.dual_b[worldid], z)
+
+  wp.launch_tiled(_dual_solve, dim=(d.nworld,), inputs=[ctx], block_dim=32)
+
+  # Mgrad = y - M^-1 @ Ja.T @ z, z vanishes on the inactive rows
+  @wp.kernel
+  def _dual_mgrad(ctx: types.SolverWorkspace, d: types.Data):
+    worldid, dofid = wp.tid()
+
+    if ctx.done[worldid] or not ctx.dual[worldid]:
+      return
+
+    efcadr = d.efc_adr[worldid]
+    nrow = wp.min(efcadr + d.nefc[worldid], d.njmax) - efcadr
+
+    Mgrad = ctx.Mgrad[worldid, dofid]
+    for i in range(nrow):
+      Mgrad -= ctx.dual_b[worldid, i] * ctx.MinvJT[efcadr + i, dofid]
+    ctx.Mgrad[worldid, dofid] = Mgrad
+
+  wp.launch(_dual_mgrad, dim=(d.nworld, m.nv), inputs=[ctx, d])
+
+
+def _solve_pgs(m: types.Model, d: types.Data, ctx: types.SolverWorkspace):
+  """Projected Gauss-Seidel on the dual problem.
+
+  Sweeps over each world's rows update one force, or one elliptic cone, at a
+  time with the diagonal blocks of the Delassus matrix AR = J M^-1 J^T + R and
+  track qacc = qacc_smooth + M^-1 J^T f with the rows of M^-1 J^T, so a sweep
+  never forms the full AR matrix.
+  """
+  # warmstart forces, then qacc consistent with them
+  _create_context(ctx, m, d, grad=False)
+  smooth.solve_m(m, d, d.qacc, d.qfrc_constraint)
+
+  @wp.kernel
+  def _qacc_smooth(d: types.Data):
+    worldid, dofid = wp.tid()
+    d.qacc[worldid, dofid] += d.qacc_smooth[worldid, dofid]
+
+  wp.launch(_qacc_smooth, dim=(d.nworld, m.nv), inputs=[d])
+
+  _minv_jt(m, d, ctx)
+
+  # AR_diag = diagonal blocks of efc_J @ MinvJT + R
+  @wp.kernel
+  def _ar_diag(ctx: types.SolverWorkspace, d: types.Data, nthread: int):
+    tid = wp.tid()
+
+    for efcid in range(tid, _nefc(d), nthread):
+      # the rows of an elliptic cone are coupled, other rows stand alone
+      adr = efcid
+      nrow = 1
+      if d.efc_type[efcid] == wp.static(types.ConstraintType.CONTACT_ELLIPTIC.value):
+        adr = d.contact.efc_address[d.efc_id[efcid]]
+        nrow = wp.min(3, d.njmax - adr)
+
+      AR = wp.vec3(0.0)
+      for i in range(nrow):
+        for nnzid in range(d.efc_J_rownnz[efcid]):
+          dofid = d.efc_J_colind[efcid, nnzid]
+          AR[i] += d.efc_J[efcid, nnzid] * ctx.MinvJT[adr + i, dofid]
+      AR[efcid - adr] += 1.0 / d.efc_D[efcid]
+      ctx.AR_diag[efcid] = AR
+
+  _launch_efc(_ar_diag, d, [ctx, d])
+
+  ctx.cost.zero_()
+
+  @wp.kernel(enable_backward=False)
+  def _sweep(ctx: types.SolverWorkspace, m: types.Model, d: types.Data):
+    worldid, tid = wp.tid()
+
+    if ctx.done[worldid]:
+      return
+
+    # each thread owns the dofs tid + k * block_dim of qacc
+    nthread = wp.block_dim()
+    efcadr = d.efc_adr[worldid]
+    efcend = wp.min(efcadr + d.nefc[worldid], d.njmax)
+    improvement = wp.float32(0.0)
+    for efcid in range(efcadr, efcend):
+      # forces are read before the reductions that precede their update
+      f_old = wp.vec3(d.efc_force[efcid], 0.0, 0.0)
+      nrow = wp.int32(1)
+
+      if d.efc_type[efcid] == wp.static(types.ConstraintType.CONTACT_ELLIPTIC.value):
+        # the first row of a cone updates the whole cone
+        conid = d.efc_id[efcid]
+        if efcid != d.contact.efc_address[conid] or efcid + 2 >= efcend:
+          continue
+        nrow = 3
+        f_old[1] = d.efc_force[efcid + 1]
+        f_old[2] = d.efc_force[efcid + 2]
+
+      # res = J @ qacc - aref + R @ f, threads only read the dofs they own
+      res = wp.vec3(0.0)
+      for i in range(nrow):
+        rowid = efcid + i
+        Jqacc = wp.float32(0.0)
+        rownnz = d.efc_J_rownnz[rowid]
+        if d.efc_J.shape[1] < m.nv:
+          for nnzid in range(rownnz):
+            dofid = d.efc_J_colind[rowid, nnzid]
+            if dofid % nthread == tid:
+              Jqacc += d.efc_J[rowid, nnzid] * d.qacc[worldid, dofid]
+        else:
+          for nnzid in range(tid, rownnz, nthread):
+            Jqacc += d.efc_J[rowid, nnzid] * d.qacc[worldid, nnzid]
+        Jqacc_sum = wp.tile_sum(wp.tile(Jqacc))
+        res[i] = wp.tile_extract(Jqacc_sum, 0) - d.efc_aref[rowid]
+        res[i] += f_old[i] / d.efc_D[rowid]
+
+      AR0 = ctx.AR_diag[efcid]
+      f = f_old
+
+      # normal force
+      f[0] = wp.max(f_old[0] - res[0] / AR0[0], 0.0)
+
+      # friction forces: minimize the cost of the cone's friction rows within
+      # the ellipse of radius f[0]
+      if nrow == 3:
+        AR1 = ctx.AR_diag[efcid + 1]
+        AR2 = ctx.AR_diag[efcid + 2]
+        friction = d.contact.friction[d.efc_id[efcid]]
+        Ac = wp.mat22(AR1[1], AR1[2], AR2[1], AR2[2])
+        fc_old = wp.vec2(f_old[1], f_old[2])
+        bc = wp.vec2(res[1], res[2]) - Ac * fc_old
+        bc += wp.vec2(AR1[0], AR2[0]) * (f[0] - f_old[0])
+        fc = wp.vec2(0.0)
+        if f[0] >= types.MJ_MINVAL:
+          fc = _qcqp2(Ac, bc, wp.vec2(friction[0], friction[1]), f[0])
+        f[1] = fc[0]
+        f[2] = fc[1]
+
+      delta = f - f_old
+      if tid == 0:
+        for i in range(nrow):
+          d.efc_force[efcid + i] = f[i]
+
+      # qacc += MinvJT.T @ delta
+      for dofid in range(tid, m.nv, nthread):
+        dqacc = wp.float32(0.0)
+        for i in range(nrow):
+          dqacc += delta[i] * ctx.MinvJT[efcid + i, dofid]
+        d.qacc[worldid, dofid] += dqacc
+
+      # decrease of the dual cost 0.5 * f.T @ AR @ f + f.T @ b
+      ARdelta = delta[0] * AR0
+      if nrow == 3:
+        ARdelta = wp.vec3(
+          wp.dot(AR0, delta),
+          wp.dot(ctx.AR_diag[efcid + 1], delta),
+          wp.dot(ctx.AR_diag[efcid + 2], delta),
         )
+      improvement -= 0.5 * wp.dot(delta, ARdelta) + wp.dot(delta, res)
 
-      wp.launch(_beta, dim=(d.nworld,), inputs=[ctx])
+    if tid == 0:
+      ctx.prev_cost[worldid] = ctx.cost[worldid]
+      ctx.cost[worldid] -= improvement
 
-      ctx.search_dot.zero_()
+  @wp.kernel
+  def _done(ctx: types.SolverWorkspace, m: types.Model, d: types.Data):
+    worldid = wp.tid()
 
-      @wp.kernel
-      def _search_cg(ctx: Context):
-        worldid, dofid = wp.tid()
-        search = (
-          -1.0 * ctx.Mgrad[worldid, dofid]
-          + ctx.beta[worldid] * ctx.search[worldid, dofid]
+    if ctx.done[worldid]:
+      return
+
+    solver_niter = d.solver_niter[worldid] + 1
+    d.solver_niter[worldid] = solver_niter
+
+    improvement = _rescale(m, ctx.prev_cost[worldid] - ctx.cost[worldid])
+    d.solver_improvement[worldid] = improvement
+    done = solver_niter >= m.opt.iterations or improvement < m.opt.tolerance
+    ctx.done[worldid] = int(done)
+
+    if not done:
+      wp.atomic_add(ctx.nsolving, 0, 1)
+
+  def _pgs_iteration():
+    _launch_world(_sweep, d, [ctx, m, d])
+    ctx.nsolving.zero_()
+    wp.launch(_done, dim=(d.nworld,), inputs=[ctx, m, d])
+
+  if m.opt.iterations:
+    _while_loop(_pgs_iteration, ctx.nsolving, m.opt.iterations)
+
+  # qfrc_constraint = efc_J.T @ efc_force, summed in row order for each dof, rows
+  # with nonzero force are active
+  @wp.kernel
+  def _qfrc_constraint(m: types.Model, d: types.Data):
+    worldid, dofid = wp.tid()
+
+    efcadr = d.efc_adr[worldid]
+    efcend = wp.min(efcadr + d.nefc[worldid], d.njmax)
+    qfrc = wp.float32(0.0)
+    nactive = wp.int32(0)
+    for efcid in range(efcadr, efcend):
+      efc_force = d.efc_force[efcid]
+      if efc_force != 0.0:
+        qfrc += _efc_J_dof(d, efcid, dofid) * efc_force
+        nactive += 1
+
+    if dofid < m.nv:
+      d.qfrc_constraint[worldid, dofid] = qfrc
+
+    if dofid == 0:
+      d.solver_nactive[worldid] = nactive
+
+  wp.launch(_qfrc_constraint, dim=(d.nworld, max(m.nv, 1)), inputs=[m, d])
+
+
+# with Option.fused_cg, models with at most this many dofs run the whole CG solve
+# of a world in one block, see _solve_small
+_SMALL_NV = 32
+
+
+def _use_small(m: types.Model, d: types.Data) -> bool:
+  return (
+    m.opt.fused_cg
+    and m.opt.solver == mujoco.mjtSolver.mjSOL_CG
+    and m.opt.cone == types.ConeType.PYRAMIDAL
+    and not m.opt.is_sparse
+    and not m.opt.ls_exact
+    and m.nv <= _SMALL_NV
+  )
+
+
+def _solve_small(m: types.Model, d: types.Data, ctx: types.SolverWorkspace):
+  """CG with each world's whole solve, linesearch included, in one launch.
+
+  Small models are bound by the ~25 launches of a solver iteration. Here every
+  thread of a world's block keeps a copy of the dof vectors in registers and
+  owns a strided slice of the world's rows, and tile_sum reductions over the
+  rows are the only communication between threads.
+
+  Each thread holds about a dozen nv vectors and an iteration runs nv tile_sums, so
+  the kernel spills registers well below _SMALL_NV on some devices. It is opt-in
+  with Option.fused_cg and worth measuring against the multi-kernel solver.
+
+  With island discovery enabled a block solves one island of its world: the
+  dofs and rows of the other islands are masked out, so islands take their own
+  linesearch steps and stop on their own improvement and gradient.
+  """
+  NV = m.nv
+  ISLAND = bool(m.opt.enableflags & types.EnableBit.ISLAND.value)
+  PRECOND = types.PreconditionerType(m.opt.preconditioner)
+  vecnv = wp.types.vector(length=NV, dtype=wp.float32)
+
+  @wp.func
+  def _in_island(island: int, islandid: int) -> bool:
+    # islandid -1 is the whole world
+    return islandid < 0 or island == islandid
+
+  @wp.func
+  def _load(a: wp.array2d(dtype=wp.float32), worldid: int) -> vecnv:
+    x = vecnv()
+    for i in range(NV):
+      x[i] = a[worldid, i]
+    return x
+
+  @wp.func
+  def _mul_m(d: types.Data, worldid: int, x: vecnv) -> vecnv:
+    y = vecnv()
+    for i in range(NV):
+      for j in range(NV):
+        y[i] += d.qM[worldid, i, j] * x[j]
+    return y
+
+  @wp.func
+  def _solve_m(d: types.Data, worldid: int, y: vecnv) -> vecnv:
+    # x = inv(L') @ inv(L) @ y
+    x = vecnv()
+    for i in range(NV):
+      xi = y[i]
+      for j in range(i):
+        xi -= d.qLD[worldid, i, j] * x[j]
+      x[i] = xi / d.qLD[worldid, i, i]
+    for i in range(NV - 1, -1, -1):
+      xi = x[i]
+      for j in range(i + 1, NV):
+        xi -= d.qLD[worldid, j, i] * x[j]
+      x[i] = xi / d.qLD[worldid, i, i]
+    return x
+
+  @wp.func
+  def _mul_j(d: types.Data, efcid: int, x: vecnv) -> float:
+    y = wp.float32(0.0)
+    for nnzid in range(d.efc_J_rownnz[efcid]):
+      y += d.efc_J[efcid, nnzid] * x[d.efc_J_colind[efcid, nnzid]]
+    return y
+
+  @wp.kernel(enable_backward=False)
+  def _solve(ctx: types.SolverWorkspace, m: types.Model, d: types.Data):
+    worldid, islandid, tid = wp.tid()
+
+    if wp.static(ISLAND):
+      if islandid >= d.nisland[worldid]:
+        return
+    else:
+      islandid = -1
+
+    nthread = wp.block_dim()
+    efcadr = d.efc_adr[worldid]
+    efcend = wp.min(efcadr + d.nefc[worldid], d.njmax)
+
+    # vectors that are read once per iteration stay in global memory
+    qacc = _load(d.qacc, worldid)
+    dof_mask = vecnv()
+    for i in range(NV):
+      dof_mask[i] = float(_in_island(d.dof_island[worldid, i], islandid))
+    Ma = _mul_m(d, worldid, qacc)
+
+    # jaref = efc_J @ qacc - efc_aref
+    for efcid in range(efcadr + tid, efcend, nthread):
+      if not _in_island(d.efc_island[efcid], islandid):
+        continue
+      ctx.Jaref[efcid] = _mul_j(d, efcid, qacc) - d.efc_aref[efcid]
+
+    cost = float(wp.inf)
+    gauss = wp.float32(0.0)
+    qfrc_constraint = vecnv()
+    grad = vecnv()
+    Mgrad = vecnv()
+    search = vecnv()
+    nactive = wp.int32(0)
+    niter = wp.int32(0)
+    nls = wp.int32(0)
+    improvement = wp.float32(0.0)
+    gradient = wp.float32(0.0)
+
+    # iteration 0 only sets up the constraints, gradient and search direction
+    for iteration in range(m.opt.iterations + 1):
+      if iteration > 0:
+        search_norm = wp.sqrt(wp.dot(search, search))
+        gtol = m.opt.tolerance * m.opt.ls_tolerance * search_norm
+        gtol *= m.stat.meaninertia * float(wp.max(1, NV))
+
+        mv = _mul_m(d, worldid, search)
+        for efcid in range(efcadr + tid, efcend, nthread):
+          if not _in_island(d.efc_island[efcid], islandid):
+            continue
+          ctx.jv[efcid] = _mul_j(d, efcid, search)
+        quad_gauss = wp.vec3(
+          gauss,
+          wp.dot(search, Ma - _load(d.qfrc_smooth, worldid)),
+          0.5 * wp.dot(search, mv),
         )
-        ctx.search[worldid, dofid] = search
-        wp.atomic_add(ctx.search_dot, worldid, search * search)
 
-      wp.launch(_search_cg, dim=(d.nworld, m.nv), inputs=[ctx])
+        # linesearch, step 0 evaluates p0, step 1 lo and the later steps
+        # lo_next, hi_next and mid
+        p0 = wp.vec4(0.0)
+        lo = wp.vec4(0.0)
+        hi = wp.vec4(0.0)
+        for step in range(m.opt.ls_iterations + 2):
+          alpha = wp.vec3(0.0)
+          if step == 1:
+            lo_alpha = -p0[2] / (p0[3] + float(p0[3] == 0.0) * mujoco.mjMINVAL)
+            alpha = wp.vec3(lo_alpha)
+          elif step > 1:
+            alpha = wp.vec3(
+              lo[0] - lo[2] / (lo[3] + float(lo[3] == 0.0) * mujoco.mjMINVAL),
+              hi[0] - hi[2] / (hi[3] + float(hi[3] == 0.0) * mujoco.mjMINVAL),
+              0.5 * (lo[0] + hi[0]),
+            )
+
+          pnt0 = wp.vec3(0.0)
+          pnt1 = wp.vec3(0.0)
+          pnt2 = wp.vec3(0.0)
+          for efcid in range(efcadr + tid, efcend, nthread):
+            if not _in_island(d.efc_island[efcid], islandid):
+              continue
+            Jaref = ctx.Jaref[efcid]
+            jv = ctx.jv[efcid]
+            efc_D = d.efc_D[efcid]
+            quad = wp.vec3(
+              0.5 * Jaref * Jaref * efc_D, jv * Jaref * efc_D, 0.5 * jv * jv * efc_D
+            )
+            if Jaref + alpha[0] * jv < 0.0:
+              pnt0 += _eval_pt(quad, alpha[0])
+            if Jaref + alpha[1] * jv < 0.0:
+              pnt1 += _eval_pt(quad, alpha[1])
+            if Jaref + alpha[2] * jv < 0.0:
+              pnt2 += _eval_pt(quad, alpha[2])
+
+          # linesearch points are (alpha, cost, deriv_0, deriv_1)
+          pnt0 = _eval_pt(quad_gauss, alpha[0]) + wp.vec3(
+            wp.tile_extract(wp.tile_sum(wp.tile(pnt0[0])), 0),
+            wp.tile_extract(wp.tile_sum(wp.tile(pnt0[1])), 0),
+            wp.tile_extract(wp.tile_sum(wp.tile(pnt0[2])), 0),
+          )
+          pnt1 = _eval_pt(quad_gauss, alpha[1]) + wp.vec3(
+            wp.tile_extract(wp.tile_sum(wp.tile(pnt1[0])), 0),
+            wp.tile_extract(wp.tile_sum(wp.tile(pnt1[1])), 0),
+            wp.tile_extract(wp.tile_sum(wp.tile(pnt1[2])), 0),
+          )
+          pnt2 = _eval_pt(quad_gauss, alpha[2]) + wp.vec3(
+            wp.tile_extract(wp.tile_sum(wp.tile(pnt2[0])), 0),
+            wp.tile_extract(wp.tile_sum(wp.tile(pnt2[1])), 0),
+            wp.tile_extract(wp.tile_sum(wp.tile(pnt2[2])), 0),
+          )
+          lo_next = wp.vec4(alpha[0], pnt0[0], pnt0[1], pnt0[2])
+          hi_next = wp.vec4(alpha[1], pnt1[0], pnt1[1], pnt1[2])
+          mid = wp.vec4(alpha[2], pnt2[0], pnt2[1], pnt2[2])
+
+          if step == 0:
+            p0 = lo_next
+            continue
+
+          if step == 1:
+            if lo_next[2] < p0[2]:
+              lo = lo_next
+              hi = p0
+            else:
+              lo = p0
+              hi = lo_next
+            continue
+
+          nls += 1
+          swap = wp.int32(0)
+          if _in_bracket(lo[2], lo_next[2]):
+            lo = lo_next
+            swap = 1
+          if _in_bracket(lo[2], mid[2]):
+            lo = mid
+            swap = 1
+          if _in_bracket(lo[2], hi_next[2]):
+            lo = hi_next
+            swap = 1
+          if _in_bracket(hi[2], hi_next[2]):
+            hi = hi_next
+            swap = 1
+          if _in_bracket(hi[2], mid[2]):
+            hi = mid
+            swap = 1
+          if _in_bracket(hi[2], lo_next[2]):
+            hi = lo_next
+            swap = 1
+
+          if not swap:
+            break
+          if lo[2] < 0.0 and lo[2] > -gtol:
+            break
+          if hi[2] > 0.0 and hi[2] < gtol:
+            break
+
+        alpha_ls = wp.float32(0.0)
+        if lo[1] < p0[1] or hi[1] < p0[1]:
+          if lo[1] < hi[1]:
+            alpha_ls = lo[0]
+          else:
+            alpha_ls = hi[0]
+
+        qacc += alpha_ls * search
+        Ma += alpha_ls * mv
+        for efcid in range(efcadr + tid, efcend, nthread):
+          if not _in_island(d.efc_island[efcid], islandid):
+            continue
+          ctx.Jaref[efcid] += alpha_ls * ctx.jv[efcid]
+
+      # update constraints: efc_force, cost and qfrc_constraint = efc_J.T @ efc_force
+      prev_cost = cost
+      efc_cost = wp.float32(0.0)
+      efc_nactive = wp.float32(0.0)
+      qfrc = vecnv()
+      jtdj = vecnv()
+      for efcid in range(efcadr + tid, efcend, nthread):
+        if not _in_island(d.efc_island[efcid], islandid):
+          continue
+        Jaref = ctx.Jaref[efcid]
+        efc_D = d.efc_D[efcid]
+        active = float(Jaref < 0.0)
+        force = -efc_D * Jaref * active
+        d.efc_force[efcid] = force
+        efc_cost += 0.5 * efc_D * Jaref * Jaref * active
+        efc_nactive += active
+        for nnzid in range(d.efc_J_rownnz[efcid]):
+          J = d.efc_J[efcid, nnzid]
+          colid = d.efc_J_colind[efcid, nnzid]
+          qfrc[colid] += J * force
+          if wp.static(PRECOND == types.PreconditionerType.JACOBI_CONSTRAINT):
+            jtdj[colid] += efc_D * J * J * active
+
+      precond = vecnv()
+      for i in range(NV):
+        qfrc_constraint[i] = wp.tile_extract(wp.tile_sum(wp.tile(qfrc[i])), 0)
+        precond[i] = wp.max(d.qM[worldid, i, i], types.MJ_MINVAL)
+        if wp.static(PRECOND == types.PreconditionerType.JACOBI_CONSTRAINT):
+          precond[i] += wp.tile_extract(wp.tile_sum(wp.tile(jtdj[i])), 0)
+      nactive = int(wp.tile_extract(wp.tile_sum(wp.tile(efc_nactive)), 0))
+      qfrc_smooth = _load(d.qfrc_smooth, worldid)
+      gauss = 0.5 * wp.dot(
+        wp.cw_mul(Ma - qfrc_smooth, dof_mask), qacc - _load(d.qacc_smooth, worldid)
+      )
+      cost = gauss + wp.tile_extract(wp.tile_sum(wp.tile(efc_cost)), 0)
+
+      # update gradient, M is block diagonal over islands so Mgrad and the
+      # search direction vanish outside the island
+      prev_grad = grad
+      prev_Mgrad = Mgrad
+      grad = wp.cw_mul(Ma - qfrc_smooth - qfrc_constraint, dof_mask)
+      if wp.static(PRECOND == types.PreconditionerType.MASS):
+        Mgrad = _solve_m(d, worldid, grad)
+      else:
+        Mgrad = wp.cw_div(grad, precond)
+
+      if iteration == 0:
+        search = -Mgrad
+        continue
+
+      # polak-ribiere
+      beta = wp.dot(grad, Mgrad - prev_Mgrad)
+      beta /= wp.max(mujoco.mjMINVAL, wp.dot(prev_grad, prev_Mgrad))
+      search = -Mgrad + wp.max(0.0, beta) * search
+
+      niter = iteration
+      improvement = _rescale(m, prev_cost - cost)
+      gradient = _rescale(m, wp.sqrt(wp.dot(grad, grad)))
+      if improvement < m.opt.tolerance or gradient < m.opt.tolerance:
+        break
+
+    if tid != 0:
+      return
 
+    for i in range(NV):
+      if dof_mask[i] != 0.0:
+        d.qacc[worldid, i] = qacc[i]
+        d.qfrc_constraint[worldid, i] = qfrc_constraint[i]
+
+    if wp.static(ISLAND):
+      # a world reports its slowest island, and the totals over its islands
+      wp.atomic_max(d.solver_niter, worldid, niter)
+      wp.atomic_max(d.solver_improvement, worldid, improvement)
+      wp.atomic_max(d.solver_gradient, worldid, gradient)
+      wp.atomic_add(d.solver_nls, worldid, nls)
+      wp.atomic_add(d.solver_nactive, worldid, nactive)
+    else:
+      d.solver_niter[worldid] = niter
+      d.solver_improvement[worldid] = improvement
+      d.solver_gradient[worldid] = gradient
+      d.solver_nls[worldid] = nls
+      d.solver_nactive[worldid] = nactive
+
+  if ISLAND:
+    # dofs in no island are unconstrained
     @wp.kernel
-    def _done(ctx: Context, m: types.Model, solver_niter: int):
-      worldid = wp.tid()
-      improvement = _rescale(m, ctx.prev_cost[worldid] - ctx.cost[worldid])
-      gradient = _rescale(m, wp.math.sqrt(ctx.grad_dot[worldid]))
-      done = solver_niter >= m.opt.iterations
-      done = done or (improvement < m.opt.tolerance)
-      done = done or (gradient < m.opt.tolerance)
-      ctx.done[worldid] = int(done)
-
-    wp.launch(_done, dim=(d.nworld,), inputs=[ctx, m, i])
-    # TODO(team): return if all done
+    def _unconstrained(d: types.Data):
+      worldid, dofid = wp.tid()
+
+      if d.dof_island[worldid, dofid] < 0:
+        d.qacc[worldid, dofid] = d.qacc_smooth[worldid, dofid]
+        d.qfrc_constraint[worldid, dofid] = 0.0
+
+    wp.launch(_unconstrained, dim=(d.nworld, NV), inputs=[d])
+
+    d.solver_niter.zero_()
+    d.solver_improvement.zero_()
+    d.solver_gradient.zero_()
+    d.solver_nls.zero_()
+    d.solver_nactive.zero_()
+
+  nblock = max(m.ntree, 1) if ISLAND else 1
+  wp.launch_tiled(
+    _solve, dim=(d.nworld, nblock), inputs=[ctx, m, d], block_dim=_BLOCK_DIM
+  )
+
+
+def solve(m: types.Model, d: types.Data):
+  """Finds forces that satisfy constraints."""
+
+  # warmstart
+  wp.copy(d.qacc, d.qacc_warmstart)
+
+  ctx = d.solver_workspace
+
+  if m.opt.solver == mujoco.mjtSolver.mjSOL_PGS:
+    _solve_pgs(m, d, ctx)
+  elif _use_small(m, d):
+    _solve_small(m, d, ctx)
+  else:
+    _create_context(ctx, m, d, grad=True)
+
+    if m.opt.iterations:
+      _while_loop(lambda: _solver_iteration(m, d, ctx), ctx.nsolving, m.opt.iterations)
 
   wp.copy(d.qacc_warmstart, d.qacc)
@@ -1,12 +1,17 @@
 """Tests for solver functions."""
 
+from unittest import mock
+
 from absl.testing import absltest
 from absl.testing import parameterized
 from etils import epath
 import mujoco
+from . import constraint
+from . import forward
 from . import io
 from . import smooth
 from . import solver
+from . import types
 import numpy as np
 import warp as wp
 
@@ -53,6 +58,9 @@ class SolverTest(parameterized.TestCase):
     (mujoco.mjtCone.mjCONE_PYRAMIDAL, mujoco.mjtSolver.mjSOL_CG, 25, 5, False),
     (mujoco.mjtCone.mjCONE_PYRAMIDAL, mujoco.mjtSolver.mjSOL_NEWTON, 2, 4, False),
     (mujoco.mjtCone.mjCONE_PYRAMIDAL, mujoco.mjtSolver.mjSOL_NEWTON, 2, 4, True),
+    (mujoco.mjtCone.mjCONE_ELLIPTIC, mujoco.mjtSolver.mjSOL_CG, 25, 5, False),
+    (mujoco.mjtCone.mjCONE_ELLIPTIC, mujoco.mjtSolver.mjSOL_NEWTON, 2, 4, False),
+    (mujoco.mjtCone.mjCONE_ELLIPTIC, mujoco.mjtSolver.mjSOL_NEWTON, 2, 4, True),
   )
   def test_solve(self, cone, solver_, iterations, ls_iterations, sparse):
     """Tests MJX solve."""
@@ -76,7 +84,7 @@ class SolverTest(parameterized.TestCase):
 
       mj_cost = cost(mjd.qacc)
 
-      ctx = solver._context(m, d)
+      ctx = d.solver_workspace
       solver._create_context(ctx, m, d)
 
       mjx_cost = ctx.cost.numpy()[0] - ctx.gauss.numpy()[0]
@@ -106,6 +114,474 @@ class SolverTest(parameterized.TestCase):
         _assert_eq(d.qfrc_constraint.numpy()[0], mjd.qfrc_constraint, "qfrc_constraint")
         _assert_eq(d.efc_force.numpy()[: mjd.nefc], mjd.efc_force, "efc_force")
 
+  @parameterized.parameters(
+    (mujoco.mjtCone.mjCONE_PYRAMIDAL, mujoco.mjtSolver.mjSOL_CG),
+    (mujoco.mjtCone.mjCONE_PYRAMIDAL, mujoco.mjtSolver.mjSOL_NEWTON),
+    (mujoco.mjtCone.mjCONE_ELLIPTIC, mujoco.mjtSolver.mjSOL_NEWTON),
+  )
+  def test_solver_stats(self, cone, solver_):
+    """Tests the solver statistics on Data."""
+    mjm, mjd, _, _ = self._load(
+      "humanoid/humanoid.xml",
+      cone=cone,
+      solver_=solver_,
+      iterations=100,
+      ls_iterations=50,
+    )
+    mjm.opt.tolerance = 1e-6
+
+    qacc_warmstart = mjd.qacc_warmstart.copy()
+    mujoco.mj_forward(mjm, mjd)
+    mjd.qacc_warmstart = qacc_warmstart
+
+    m = io.put_model(mjm)
+    d = io.put_data(mjm, mjd, njmax=mjd.nefc)
+    if solver_ == mujoco.mjtSolver.mjSOL_CG:
+      smooth.factor_m(m, d)
+    solver.solve(m, d)
+
+    niter = d.solver_niter.numpy()[0]
+    improvement = d.solver_improvement.numpy()[0]
+    gradient = d.solver_gradient.numpy()[0]
+    self.assertBetween(niter, 1, mjm.opt.iterations)
+    if niter < mjm.opt.iterations:
+      self.assertLess(min(improvement, gradient), mjm.opt.tolerance)
+    self.assertGreater(d.solver_nls.numpy()[0], 0)
+
+    # the converged active set matches MuJoCo
+    mj_nactive = mjd.solver[mjd.solver_niter[0] - 1].nactive
+    self.assertEqual(d.solver_nactive.numpy()[0], mj_nactive)
+
+  @parameterized.parameters(False, True)
+  def test_cholesky_update(self, sparse):
+    """Tests the Newton factor after rank-1 updates of the active set."""
+    mjm, mjd, _, _ = self._load(
+      "humanoid/humanoid.xml", is_sparse=sparse, iterations=100, ls_iterations=50
+    )
+    mujoco.mj_resetDataKeyframe(mjm, mjd, 0)
+    mujoco.mj_forward(mjm, mjd)
+    m = io.put_model(mjm)
+    d = io.put_data(mjm, mjd)
+
+    wp.copy(d.qacc, d.qacc_smooth)
+
+    # update the factor however many rows change active state
+    ctx = d.solver_workspace
+    with mock.patch.object(solver, "_CHOLESKY_UPDATE_MAXRANK", mjd.nefc):
+      solver._create_context(ctx, m, d)
+      solver._solver_iteration(m, d, ctx)
+
+    active = ctx.active.numpy()[: mjd.nefc]
+    prev_active = ctx.prev_active.numpy()[: mjd.nefc]
+    self.assertGreater(np.sum(active != prev_active), 0)
+    self.assertEqual(ctx.refactor.numpy()[0], 0)
+
+    qM = np.zeros((mjm.nv, mjm.nv))
+    mujoco.mj_fullM(mjm, qM, mjd.qM)
+    if sparse:
+      efc_J = np.zeros((mjd.nefc, mjm.nv))
+      mujoco.mju_sparse2dense(
+        efc_J, mjd.efc_J, mjd.efc_J_rownnz, mjd.efc_J_rowadr, mjd.efc_J_colind
+      )
+    else:
+      efc_J = mjd.efc_J.reshape((mjd.nefc, mjm.nv))
+    h = qM + efc_J.T @ np.diag(mjd.efc_D * active) @ efc_J
+    prev_h = qM + efc_J.T @ np.diag(mjd.efc_D * prev_active) @ efc_J
+
+    if sparse:
+      # sparse factor columns are in elimination order e = nv - 1 - dofid
+      L = np.zeros((mjm.nv, mjm.nv))
+      hfactor = ctx.hfactor_sparse.numpy()[0]
+      for col in range(mjm.nv):
+        adr = m.hfactor_coladr.numpy()[col]
+        for p in range(adr, adr + m.hfactor_colnnz.numpy()[col]):
+          L[m.hfactor_rowind.numpy()[p], col] = hfactor[p]
+      _assert_eq((L @ L.T)[::-1, ::-1], h, "h")
+    else:
+      # h is only assembled for the initial factorization
+      _assert_eq(np.tril(ctx.h.numpy()[0]), np.tril(prev_h), "prev_h")
+
+      L = np.tril(ctx.hfactor.numpy()[0])
+      _assert_eq(L @ L.T, h, "h")
+
+  @parameterized.parameters(
+    (mujoco.mjtCone.mjCONE_PYRAMIDAL, False),
+    (mujoco.mjtCone.mjCONE_PYRAMIDAL, True),
+    (mujoco.mjtCone.mjCONE_ELLIPTIC, False),
+  )
+  def test_solve_pgs(self, cone, sparse):
+    """Tests MJX solve with PGS."""
+    for keyframe in range(3):
+      mjm, mjd, _, _ = self._load(
+        "humanoid/humanoid.xml",
+        is_sparse=sparse,
+        cone=cone,
+        solver_=mujoco.mjtSolver.mjSOL_PGS,
+        iterations=200,
+        keyframe=keyframe,
+      )
+
+      def cost(qacc, mjm=mjm, mjd=mjd):
+        # PGS solves the dual, so compare the full primal objective
+        jaref = np.zeros(mjd.nefc, dtype=float)
+        cost = np.zeros(1)
+        mujoco.mj_mulJacVec(mjm, mjd, jaref, qacc)
+        mujoco.mj_constraintUpdate(mjm, mjd, jaref - mjd.efc_aref, cost, 0)
+        Ma = np.zeros(mjm.nv)
+        mujoco.mj_mulM(mjm, mjd, Ma, qacc - mjd.qacc_smooth)
+        return cost + 0.5 * np.dot(qacc - mjd.qacc_smooth, Ma)
+
+      qacc_warmstart = mjd.qacc_warmstart.copy()
+      mujoco.mj_forward(mjm, mjd)
+      mjd.qacc_warmstart = qacc_warmstart
+
+      m = io.put_model(mjm)
+      d = io.put_data(mjm, mjd, njmax=mjd.nefc)
+      d.qacc.zero_()
+      d.qfrc_constraint.zero_()
+      d.efc_force.zero_()
+      solver.solve(m, d)
+
+      mj_cost = cost(mjd.qacc)
+      mjx_cost = cost(d.qacc.numpy()[0])
+      self.assertLessEqual(mjx_cost, mj_cost * 1.001 + 1e-6)
+      if cone == mujoco.mjtCone.mjCONE_ELLIPTIC:
+        # MuJoCo stops early on the slowly converging friction forces
+        continue
+      _assert_eq(d.qacc.numpy()[0], mjd.qacc, "qacc")
+      _assert_eq(d.qfrc_constraint.numpy()[0], mjd.qfrc_constraint, "qfrc_constraint")
+
+  @parameterized.parameters(
+    (mujoco.mjtSolver.mjSOL_CG, mujoco.mjtCone.mjCONE_PYRAMIDAL),
+    (mujoco.mjtSolver.mjSOL_NEWTON, mujoco.mjtCone.mjCONE_ELLIPTIC),
+    (mujoco.mjtSolver.mjSOL_PGS, mujoco.mjtCone.mjCONE_PYRAMIDAL),
+  )
+  def test_solve_compressed_rows(self, solver_, cone):
+    """Tests the solvers on a dense model with rows narrower than nv."""
+    mjm, mjd, _, _ = self._load(
+      "constraints.xml",
+      is_sparse=False,
+      cone=cone,
+      solver_=solver_,
+      iterations=200,
+      ls_iterations=50,
+      keyframe=2,
+    )
+
+    def cost(qacc):
+      jaref = np.zeros(mjd.nefc, dtype=float)
+      cost = np.zeros(1)
+      mujoco.mj_mulJacVec(mjm, mjd, jaref, qacc)
+      mujoco.mj_constraintUpdate(mjm, mjd, jaref - mjd.efc_aref, cost, 0)
+      Ma = np.zeros(mjm.nv)
+      mujoco.mj_mulM(mjm, mjd, Ma, qacc - mjd.qacc_smooth)
+      return cost + 0.5 * np.dot(qacc - mjd.qacc_smooth, Ma)
+
+    qacc_warmstart = mjd.qacc_warmstart.copy()
+    mujoco.mj_forward(mjm, mjd)
+    mjd.qacc_warmstart = qacc_warmstart
+    self.assertGreater(mjd.ncon, 0)
+
+    m = io.put_model(mjm)
+    d = io.put_data(mjm, mjd, njmax=mjd.nefc)
+    self.assertLess(d.efc_J.shape[1], mjm.nv)
+    d.qacc.zero_()
+    d.qfrc_constraint.zero_()
+    d.efc_force.zero_()
+    if solver_ == mujoco.mjtSolver.mjSOL_CG:
+      smooth.factor_m(m, d)
+    solver.solve(m, d)
+
+    mj_cost = cost(mjd.qacc)
+    mjx_cost = cost(d.qacc.numpy()[0])
+    self.assertLessEqual(mjx_cost, mj_cost * 1.01)
+    if solver_ != mujoco.mjtSolver.mjSOL_PGS:
+      _assert_eq(d.qacc.numpy()[0], mjd.qacc, "qacc")
+
+  @parameterized.parameters(mujoco.mjtSolver.mjSOL_CG, mujoco.mjtSolver.mjSOL_NEWTON)
+  def test_solve_ls_exact(self, solver_):
+    """Tests MJX solve with the exact linesearch."""
+    for keyframe in range(3):
+      mjm, mjd, _, _ = self._load(
+        "humanoid/humanoid.xml",
+        is_sparse=False,
+        solver_=solver_,
+        iterations=100,
+        ls_iterations=50,
+        keyframe=keyframe,
+      )
+
+      def cost(qacc, mjm=mjm, mjd=mjd):
+        jaref = np.zeros(mjd.nefc, dtype=float)
+        cost = np.zeros(1)
+        mujoco.mj_mulJacVec(mjm, mjd, jaref, qacc)
+        mujoco.mj_constraintUpdate(mjm, mjd, jaref - mjd.efc_aref, cost, 0)
+        return cost
+
+      qacc_warmstart = mjd.qacc_warmstart.copy()
+      mujoco.mj_forward(mjm, mjd)
+      mjd.qacc_warmstart = qacc_warmstart
+
+      m = io.put_model(mjm)
+      m.opt.ls_exact = True
+      d = io.put_data(mjm, mjd, njmax=mjd.nefc)
+      d.qacc.zero_()
+
+      if solver_ == mujoco.mjtSolver.mjSOL_CG:
+        smooth.factor_m(m, d)
+      solver.solve(m, d)
+
+      mj_cost = cost(mjd.qacc)
+      mjx_cost = cost(d.qacc.numpy()[0])
+      self.assertLessEqual(mjx_cost, mj_cost * 1.025)
+      _assert_eq(d.qacc.numpy()[0], mjd.qacc, "qacc")
+
+  @parameterized.parameters(
+    (mujoco.mjtSolver.mjSOL_CG, mujoco.mjtCone.mjCONE_PYRAMIDAL, False),
+    (mujoco.mjtSolver.mjSOL_NEWTON, mujoco.mjtCone.mjCONE_PYRAMIDAL, False),
+    (mujoco.mjtSolver.mjSOL_NEWTON, mujoco.mjtCone.mjCONE_ELLIPTIC, False),
+    (mujoco.mjtSolver.mjSOL_NEWTON, mujoco.mjtCone.mjCONE_ELLIPTIC, True),
+  )
+  def test_solve_deterministic(self, solver_, cone, sparse):
+    """Tests that each world solves bitwise identically in any batch."""
+    mjm, mjd, _, _ = self._load(
+      "humanoid/humanoid.xml",
+      is_sparse=sparse,
+      cone=cone,
+      solver_=solver_,
+      iterations=10,
+      ls_iterations=10,
+    )
+    m = io.put_model(mjm)
+    m.opt.preconditioner = types.PreconditionerType.JACOBI_CONSTRAINT
+
+    def solve(keyframes, nfar):
+      qpos, qvel = [], []
+      for keyframe in keyframes:
+        mujoco.mj_resetDataKeyframe(mjm, mjd, keyframe)
+        qpos.append(mjd.qpos.copy())
+        qvel.append(mjd.qvel.copy())
+
+      # every world starts from the contacts of keyframe 1
+      mujoco.mj_resetDataKeyframe(mjm, mjd, 1)
+      mujoco.mj_forward(mjm, mjd)
+      d = io.put_data(mjm, mjd, nworld=len(keyframes), njmax=2048)
+      d.qpos = wp.array(np.stack(qpos), dtype=wp.float32)
+      d.qvel = wp.array(np.stack(qvel), dtype=wp.float32)
+
+      # the first nfar contacts of each world are past their margin and make no rows
+      dist = d.contact.dist.numpy()
+      worldid = d.contact.worldid.numpy()[: dist.size]
+      for i, n in enumerate(nfar):
+        dist[np.flatnonzero(worldid == i)[:n]] = 1.0
+      d.contact.dist = wp.array(dist, dtype=wp.float32)
+
+      forward.forward(m, d)
+      return d.nefc.numpy(), d.qacc.numpy()
+
+    # world 1 has other rows than worlds 0 and 2, which are the same
+    nefc, qacc = solve([1, 0, 1], [0, 2, 0])
+    self.assertLess(nefc[1], nefc[0])
+    self.assertFalse(np.array_equal(qacc[0], qacc[1]))
+    np.testing.assert_array_equal(qacc[2], qacc[0])
+    np.testing.assert_array_equal(solve([1, 0, 1], [0, 2, 0])[1], qacc)
+    np.testing.assert_array_equal(solve([0], [2])[1][0], qacc[1])
+
+  @parameterized.parameters(mujoco.mjtSolver.mjSOL_CG, mujoco.mjtSolver.mjSOL_NEWTON)
+  def test_solve_island(self, solver_):
+    """Tests the CG solve and the Newton factorization per island."""
+    mjm, mjd, _, _ = self._load(
+      "islands.xml",
+      is_sparse=False,
+      solver_=solver_,
+      iterations=100,
+      ls_iterations=50,
+    )
+    mujoco.mj_forward(mjm, mjd)
+    self.assertGreater(mjd.nisland, 1)
+
+    m = io.put_model(mjm)
+    m.opt.fused_cg = True
+    d = io.put_data(mjm, mjd, nworld=2)
+    d.qacc.zero_()
+    d.qfrc_constraint.zero_()
+    d.efc_force.zero_()
+    self.assertEqual(solver._use_small(m, d), solver_ == mujoco.mjtSolver.mjSOL_CG)
+    solver.solve(m, d)
+
+    if solver_ == mujoco.mjtSolver.mjSOL_NEWTON:
+      # the factor has no entries between islands or unconstrained trees
+      block = np.where(mjd.dof_island >= 0, mjd.dof_island, -1 - mjm.dof_treeid)
+      coupled = block[:, None] != block[None, :]
+      hfactor = d.solver_workspace.hfactor.numpy()[0]
+      np.testing.assert_array_equal(hfactor[coupled], 0.0)
+
+    # MuJoCo leaves the dofs in no island at their warmstart
+    in_island = mjd.dof_island >= 0
+    qacc = np.where(in_island, mjd.qacc, mjd.qacc_smooth)
+    qfrc_constraint = np.where(in_island, mjd.qfrc_constraint, 0.0)
+    for worldid in range(2):
+      _assert_eq(d.qacc.numpy()[worldid], qacc, "qacc")
+      _assert_eq(d.qfrc_constraint.numpy()[worldid], qfrc_constraint, "qfrc_constraint")
+    _assert_eq(
+      d.efc_force.numpy()[: 2 * mjd.nefc], np.tile(mjd.efc_force, 2), "efc_force"
+    )
+    self.assertEqual(d.solver_nactive.numpy()[0], mjd.nefc)
+
+  @parameterized.parameters(
+    (types.PreconditionerType.JACOBI, mujoco.mjtCone.mjCONE_PYRAMIDAL, False),
+    (
+      types.PreconditionerType.JACOBI_CONSTRAINT,
+      mujoco.mjtCone.mjCONE_PYRAMIDAL,
+      False,
+    ),
+    (types.PreconditionerType.JACOBI_CONSTRAINT, mujoco.mjtCone.mjCONE_PYRAMIDAL, True),
+    (types.PreconditionerType.JACOBI_CONSTRAINT, mujoco.mjtCone.mjCONE_ELLIPTIC, True),
+  )
+  def test_solve_preconditioner(self, preconditioner, cone, sparse):
+    """Tests that CG converges to MuJoCo's solution with each preconditioner."""
+    mjm, mjd, _, _ = self._load(
+      "humanoid/humanoid.xml",
+      is_sparse=sparse,
+      cone=cone,
+      solver_=mujoco.mjtSolver.mjSOL_CG,
+      iterations=100,
+      ls_iterations=50,
+      keyframe=1,
+    )
+
+    def cost(qacc):
+      jaref = np.zeros(mjd.nefc, dtype=float)
+      cost = np.zeros(1)
+      mujoco.mj_mulJacVec(mjm, mjd, jaref, qacc)
+      mujoco.mj_constraintUpdate(mjm, mjd, jaref - mjd.efc_aref, cost, 0)
+      return cost
+
+    qacc_warmstart = mjd.qacc_warmstart.copy()
+    mujoco.mj_forward(mjm, mjd)
+    mjd.qacc_warmstart = qacc_warmstart
+
+    m = io.put_model(mjm)
+    m.opt.preconditioner = preconditioner
+    d = io.put_data(mjm, mjd, njmax=mjd.nefc)
+    d.qacc.zero_()
+    smooth.factor_m(m, d)
+    solver.solve(m, d)
+
+    mj_cost = cost(mjd.qacc)
+    mjx_cost = cost(d.qacc.numpy()[0])
+    self.assertLessEqual(mjx_cost, mj_cost * 1.025)
+    self.assertGreater(d.solver_niter.numpy()[0], 0)
+
+  @parameterized.parameters(False, True)
+  def test_solve_dual(self, sparse):
+    """Tests Newton in constraint space for the worlds whose rows fit."""
+    mjm, mjd, _, _ = self._load("constraints.xml", is_sparse=sparse, keyframe=1)
+    qacc_warmstart = mjd.qacc_warmstart.copy()
+    mujoco.mj_forward(mjm, mjd)
+    mjd.qacc_warmstart = qacc_warmstart
+    m = io.put_model(mjm)
+
+    # the rows of every world fit the bound, which defaults to mjd.nefc
+    d = io.put_data(mjm, mjd, nworld=2, njmax=2 * mjd.nefc)
+    self.assertTrue(solver._use_dual(d))
+    solver.solve(m, d)
+
+    np.testing.assert_array_equal(d.solver_workspace.dual.numpy(), [1, 1])
+    for worldid in range(2):
+      _assert_eq(d.qacc.numpy()[worldid], mjd.qacc, "qacc")
+      _assert_eq(
+        d.qfrc_constraint.numpy()[worldid], mjd.qfrc_constraint, "qfrc_constraint"
+      )
+    _assert_eq(
+      d.efc_force.numpy()[: 2 * mjd.nefc], np.tile(mjd.efc_force, 2), "efc_force"
+    )
+
+    def solve(nefc_world):
+      d = io.put_data(mjm, mjd, nworld=2, njmax=2 * mjd.nefc, nefc_world=nefc_world)
+
+      # the first two contacts of world 1 are past their margin and make no rows
+      dist = d.contact.dist.numpy()
+      worldid = d.contact.worldid.numpy()[: dist.size]
+      dist[np.flatnonzero(worldid == 1)[:2]] = 1.0
+      d.contact.dist = wp.array(dist, dtype=wp.float32)
+
+      constraint.make_constraint(m, d)
+      solver.solve(m, d)
+      return d
+
+    # world 0 has more rows than the bound and falls back to the dof space solve
+    d = solve(mjd.nefc // 2)
+    self.assertLess(d.nefc.numpy()[1], d.nefc.numpy()[0])
+    self.assertTrue(solver._use_dual(d))
+    np.testing.assert_array_equal(d.solver_workspace.dual.numpy(), [0, 1])
+    _assert_eq(d.qacc.numpy()[0], mjd.qacc, "qacc")
+
+    # without a bound every world solves in dof space
+    d_ref = solve(0)
+    self.assertFalse(solver._use_dual(d_ref))
+    _assert_eq(d.qacc.numpy(), d_ref.qacc.numpy(), "qacc")
+    _assert_eq(
+      d.qfrc_constraint.numpy(), d_ref.qfrc_constraint.numpy(), "qfrc_constraint"
+    )
+
+  @parameterized.parameters(False, True)
+  def test_solve_row_stride(self, sparse):
+    """Tests that row kernels visit every row in use when threads stride."""
+    mjm, mjd, _, _ = self._load(
+      "humanoid/humanoid.xml", is_sparse=sparse, iterations=10, ls_iterations=10
+    )
+    mujoco.mj_forward(mjm, mjd)
+
+    def solve(threads_per_sm):
+      m = io.put_model(mjm)
+      d = io.put_data(mjm, mjd, nworld=2, njmax=8 * mjd.nefc)
+      with mock.patch.object(solver, "_EFC_THREADS_PER_SM", threads_per_sm):
+        solver.solve(m, d)
+      return d
+
+    d = solve(3)
+    d_ref = solve(solver._EFC_THREADS_PER_SM)
+    _assert_eq(d.qacc.numpy(), d_ref.qacc.numpy(), "qacc")
+    _assert_eq(d.efc_force.numpy(), d_ref.efc_force.numpy(), "efc_force")
+
+  def test_solve_small(self):
+    """Tests that small models solve in one launch like the multi-kernel solver."""
+    mjm, mjd, _, _ = self._load(
+      "humanoid/humanoid.xml",
+      is_sparse=False,
+      solver_=mujoco.mjtSolver.mjSOL_CG,
+      iterations=25,
+      ls_iterations=5,
+      keyframe=1,
+    )
+    qacc_warmstart = mjd.qacc_warmstart.copy()
+    mujoco.mj_forward(mjm, mjd)
+    mjd.qacc_warmstart = qacc_warmstart
+
+    def solve(fused_cg):
+      m = io.put_model(mjm)
+      m.opt.fused_cg = fused_cg
+      d = io.put_data(mjm, mjd, nworld=2, njmax=2 * mjd.nefc)
+      smooth.factor_m(m, d)
+      self.assertEqual(solver._use_small(m, d), fused_cg)
+      solver.solve(m, d)
+      return d
+
+    d = solve(True)
+    d_ref = solve(False)
+
+    for worldid in range(2):
+      _assert_eq(d.qacc.numpy()[worldid], d_ref.qacc.numpy()[worldid], "qacc")
+      _assert_eq(
+        d.qfrc_constraint.numpy()[worldid],
+        d_ref.qfrc_constraint.numpy()[worldid],
+        "qfrc_constraint",
+      )
+    _assert_eq(d.efc_force.numpy(), d_ref.efc_force.numpy(), "efc_force")
+    self.assertGreater(d.solver_niter.numpy()[0], 0)
+    self.assertEqual(d.solver_nactive.numpy()[0], d_ref.solver_nactive.numpy()[0])
+
   @parameterized.parameters(
     (mujoco.mjtCone.mjCONE_PYRAMIDAL, mujoco.mjtSolver.mjSOL_CG, 25, 5),
     (mujoco.mjtCone.mjCONE_PYRAMIDAL, mujoco.mjtSolver.mjSOL_NEWTON, 2, 4),
@@ -165,6 +641,8 @@ class SolverTest(parameterized.TestCase):
     )
 
     d.nefc_total = wp.array([nefc_active], dtype=wp.int32, ndim=1)
+    d.nefc = wp.array([mjd0.nefc, mjd1.nefc, mjd2.nefc], dtype=wp.int32)
+    d.efc_adr = wp.array([0, mjd0.nefc, mjd0.nefc + mjd1.nefc], dtype=wp.int32)
 
     nefc_fill = d.njmax - nefc_active
 
@@ -228,6 +706,12 @@ class SolverTest(parameterized.TestCase):
     d.qacc_smooth = wp.from_numpy(qacc_smooth, dtype=wp.float32)
     d.qfrc_smooth = wp.from_numpy(qfrc_smooth, dtype=wp.float32)
     d.efc_J = wp.from_numpy(efc_J_fill, dtype=wp.float32)
+    d.efc_J_rownnz = wp.from_numpy(
+      np.concatenate([[mjm.nv] * nefc_active, [0] * nefc_fill]), dtype=wp.int32
+    )
+    d.efc_J_colind = wp.from_numpy(
+      np.tile(np.arange(mjm.nv), (d.njmax, 1)), dtype=wp.int32
+    )
     d.efc_D = wp.from_numpy(efc_D_fill, dtype=wp.float32)
     d.efc_aref = wp.from_numpy(efc_aref_fill, dtype=wp.float32)
     d.efc_worldid = wp.from_numpy(efc_worldid, dtype=wp.int32)
@@ -14,9 +14,11 @@
 # ==============================================================================
 
 import mujoco
+import numpy as np
 import warp as wp
 from .types import Model
 from .types import Data
+from .types import WarningType
 from .types import array2df
 from .types import array3df
 
@@ -27,6 +29,20 @@ def is_sparse(m: mujoco.MjModel):
   return m.opt.jacobian == mujoco.mjtJacobian.mjJAC_SPARSE
 
 
+def dual_nefc(m: mujoco.MjModel, nefc_world: int) -> int:
+  """Rows per world of the constraint space Newton solve, 0 for the dof space.
+
+  Newton factors an nefc x nefc matrix per iteration instead of the nv x nv
+  Hessian when the bound nefc_world on the rows of a world is at most half the
+  number of dofs. Worlds with more rows fall back to the dof space.
+  """
+  if m.opt.solver != mujoco.mjtSolver.mjSOL_NEWTON:
+    return 0
+  if m.opt.cone != mujoco.mjtCone.mjCONE_PYRAMIDAL:
+    return 0
+  return nefc_world if 0 < 2 * nefc_world <= m.nv else 0
+
+
 def mul_m(
   m: Model,
   d: Data,
@@ -108,27 +124,26 @@ def mul_m(
     )
 
 
-@wp.kernel
-def process_level(
-  body_tree: wp.array(ndim=1, dtype=int),
-  body_parentid: wp.array(ndim=1, dtype=int),
-  dof_bodyid: wp.array(ndim=1, dtype=int),
-  mask: wp.array2d(dtype=wp.bool),
-  beg: int,
-):
-  dofid, tid_y = wp.tid()
-  j = beg + tid_y
-  el = body_tree[j]
-  parent_id = body_parentid[el]
-  parent_val = mask[dofid, parent_id]
-  mask[dofid, el] = parent_val or (dof_bodyid[dofid] == el)
+@wp.func
+def in_chain(m: Model, bodyid: int, dofid: int) -> bool:
+  """Returns True if the dof moves the body, i.e. it is on the body's chain."""
+  # the chain of the dof's body is a prefix of the chains of its descendants
+  dof_bodyid = m.dof_bodyid[dofid]
+  chainid = (
+    m.body_chainnum[dof_bodyid]
+    - m.body_dofnum[dof_bodyid]
+    + dofid
+    - m.body_dofadr[dof_bodyid]
+  )
+  if chainid >= m.body_chainnum[bodyid]:
+    return False
+  return m.body_chain[m.body_chainadr[bodyid] + chainid] == dofid
 
 
 @wp.kernel
 def compute_qfrc(
   d: Data,
   m: Model,
-  mask: wp.array2d(dtype=wp.bool),
   qfrc_total: array2df,
 ):
   worldid, dofid = wp.tid()
@@ -141,7 +156,7 @@ def compute_qfrc(
   )
 
   for bodyid in range(m.nbody):
-    if mask[dofid, bodyid]:
+    if in_chain(m, bodyid, dofid):
       offset = d.xipos[worldid, bodyid] - d.subtree_com[worldid, m.body_rootid[bodyid]]
       cross_term = wp.cross(rotational_cdof, offset)
       accumul += wp.dot(jac, d.xfrc_applied[worldid, bodyid]) + wp.dot(
@@ -157,22 +172,37 @@ def compute_qfrc(
 
 
 def xfrc_accumulate(m: Model, d: Data) -> array2df:
-  body_treeadr_np = m.body_treeadr.numpy()
-  mask = wp.zeros((m.nv, m.nbody), dtype=wp.bool)
-
-  for i in range(len(body_treeadr_np)):
-    beg = body_treeadr_np[i]
-    end = m.nbody if i == len(body_treeadr_np) - 1 else body_treeadr_np[i + 1]
-
-    if end > beg:
-      wp.launch(
-        kernel=process_level,
-        dim=[m.nv, (end - beg)],
-        inputs=[m.body_tree, m.body_parentid, m.dof_bodyid, mask, beg],
-      )
-
   qfrc_total = wp.zeros((d.nworld, m.nv), dtype=float)
 
-  wp.launch(kernel=compute_qfrc, dim=(d.nworld, m.nv), inputs=[d, m, mask, qfrc_total])
+  wp.launch(kernel=compute_qfrc, dim=(d.nworld, m.nv), inputs=[d, m, qfrc_total])
 
   return qfrc_total
+
+
+def solver_histogram(
+  d: Data, bins: int = 10
+) -> dict[str, tuple[np.ndarray, np.ndarray]]:
+  """Histograms of the per-world solver statistics.
+
+  Returns (counts, bin_edges) from np.histogram for each of solver_niter,
+  solver_improvement, solver_gradient, solver_nls and solver_nactive.
+  """
+  stats = {
+    "niter": d.solver_niter,
+    "improvement": d.solver_improvement,
+    "gradient": d.solver_gradient,
+    "nls": d.solver_nls,
+    "nactive": d.solver_nactive,
+  }
+  return {k: np.histogram(v.numpy(), bins=bins) for k, v in stats.items()}
+
+
+def overflow(d: Data) -> dict[str, int]:
+  """Number of items dropped because a buffer was full, summed over calls.
+
+  Keys are the lowercase WarningType names: cnstrfull counts constraint rows
+  past njmax, contactfull contacts past nconmax and broadphasefull overlapping
+  pairs past max_num_overlaps_per_world. Call d.warning.zero_() to reset.
+  """
+  warning = d.warning.numpy()
+  return {w.name.lower(): int(warning[w]) for w in WarningType}
@@ -76,6 +76,17 @@ class SupportTest(parameterized.TestCase):
       )
     np.testing.assert_almost_equal(qfrc.numpy()[0], qfrc_expected, 6)
 
+  def test_solver_histogram(self):
+    """Tests that solver_histogram bins the per-world solver statistics."""
+    _, _, _, d = test_util.fixture("pendula.xml")
+    d.solver_niter = wp.array([1, 2, 2, 5], dtype=wp.int32)
+    hist = mjx.solver_histogram(d, bins=4)
+
+    counts, edges = hist["niter"]
+    np.testing.assert_array_equal(counts, [1, 2, 0, 1])
+    np.testing.assert_allclose(edges, [1.0, 2.0, 3.0, 4.0, 5.0])
+    self.assertEqual(set(hist), {"niter", "improvement", "gradient", "nls", "nactive"})
+
 
 if __name__ == "__main__":
   wp.init()
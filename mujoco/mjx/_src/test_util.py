@@ -56,18 +56,31 @@ def benchmark(
   ls_iterations: int = 4,
   nconmax: int = -1,
   njmax: int = -1,
+  preconditioner: str = "mass",
+  tolerance: float = -1.0,
+  fused_cg: bool = False,
 ) -> Tuple[float, float, int]:
-  """Benchmark a model."""
+  """Benchmark a model.
+
+  With a tolerance and enough iterations the run time is the time for the
+  solver to reach the tolerance, e.g. to compare CG preconditioners.
+  """
 
   if solver == "cg":
     mjm.opt.solver = mujoco.mjtSolver.mjSOL_CG
   elif solver == "newton":
     mjm.opt.solver = mujoco.mjtSolver.mjSOL_NEWTON
+  elif solver == "pgs":
+    mjm.opt.solver = mujoco.mjtSolver.mjSOL_PGS
 
   mjm.opt.iterations = iterations
   mjm.opt.ls_iterations = ls_iterations
+  if tolerance >= 0.0:
+    mjm.opt.tolerance = tolerance
 
   m = io.put_model(mjm)
+  m.opt.preconditioner = types.PreconditionerType[preconditioner.upper()]
+  m.opt.fused_cg = fused_cg
   d = io.put_data(mjm, mjd, nworld=batch_size, nconmax=nconmax, njmax=njmax)
 
   jit_beg = time.perf_counter()
@@ -17,6 +17,7 @@ import enum
 import mujoco
 
 MJ_MINVAL = mujoco.mjMINVAL
+MJ_MAXVAL = mujoco.mjMAXVAL
 MJ_MINIMP = mujoco.mjMINIMP  # minimum constraint impedance
 MJ_MAXIMP = mujoco.mjMAXIMP  # maximum constraint impedance
 MJ_NREF = mujoco.mjNREF
@@ -58,6 +59,18 @@ class DisableBit(enum.IntFlag):
   # unsupported: MIDPHASE
 
 
+class EnableBit(enum.IntFlag):
+  """Enable optional feature bitflags.
+
+  Members:
+    ISLAND: constraint island discovery, a CG solve per island for small models
+      and a Newton factorization per island for dense Hessians
+  """
+
+  ISLAND = mujoco.mjtEnableBit.mjENBL_ISLAND
+  # unsupported: OVERRIDE, ENERGY, FWDINV, INVDISCRETE, MULTICCD, NATIVECCD
+
+
 class TrnType(enum.IntEnum):
   """Type of actuator transmission.
 
@@ -156,6 +169,66 @@ class ConeType(enum.IntEnum):
   ELLIPTIC = mujoco.mjtCone.mjCONE_ELLIPTIC
 
 
+class PreconditionerType(enum.IntEnum):
+  """Type of CG preconditioner.
+
+  Members:
+    MASS: inverse mass matrix, a full solve with the factor of M per iteration
+    JACOBI: inverse diagonal of the mass matrix
+    JACOBI_CONSTRAINT: inverse diagonal of M + J^T D J over the active rows
+  """
+
+  MASS = 0
+  JACOBI = 1
+  JACOBI_CONSTRAINT = 2
+
+
+class OverflowPolicy(enum.IntEnum):
+  """Which constraint rows to drop when a batch has more rows than njmax.
+
+  Members:
+    TRUNCATE: drop the limits and whole contacts that end past njmax, the last
+      rows of the last worlds
+    DROP_SHALLOWEST: contacts claim rows in order of penetration, deepest first
+    DROP_DEEPEST: contacts claim rows in order of penetration, shallowest first
+    FLAG_WORLD: a world whose rows end past njmax gets no rows, nor do the
+      worlds after it
+  """
+
+  TRUNCATE = 0
+  DROP_SHALLOWEST = 1
+  DROP_DEEPEST = 2
+  FLAG_WORLD = 3
+
+
+class WarningType(enum.IntEnum):
+  """Type of warning, the number of dropped items is counted in Data.warning.
+
+  Members:
+    CNSTRFULL: constraint rows did not fit in njmax
+    CONTACTFULL: contacts did not fit in nconmax
+    BROADPHASEFULL: overlapping pairs did not fit in max_num_overlaps_per_world
+  """
+
+  CNSTRFULL = 0
+  CONTACTFULL = 1
+  BROADPHASEFULL = 2
+
+
+class ConstraintType(enum.IntEnum):
+  """Type of constraint.
+
+  Members:
+    LIMIT_JOINT: joint limit
+    CONTACT_PYRAMIDAL: frictional contact, pyramidal friction cone
+    CONTACT_ELLIPTIC: frictional contact, elliptic friction cone
+  """
+
+  LIMIT_JOINT = mujoco.mjtConstraint.mjCNSTR_LIMIT_JOINT
+  CONTACT_PYRAMIDAL = mujoco.mjtConstraint.mjCNSTR_CONTACT_PYRAMIDAL
+  CONTACT_ELLIPTIC = mujoco.mjtConstraint.mjCNSTR_CONTACT_ELLIPTIC
+
+
 class vec5f(wp.types.vector(length=5, dtype=wp.float32)):
   pass
 
@@ -181,9 +254,15 @@ class Option:
   iterations: int
   ls_iterations: int
   disableflags: int
+  enableflags: int
   integrator: int  # mjtIntegrator
   impratio: wp.float32
   is_sparse: bool  # warp only
+  ls_exact: bool  # warp only
+  preconditioner: int  # warp only, PreconditionerType
+  overflow: int  # warp only, OverflowPolicy
+  max_contacts_per_world: int  # warp only, deepest contacts kept, 0 keeps all
+  fused_cg: bool  # warp only, small dense CG solves in one launch per world
 
 
 @wp.struct
@@ -203,6 +282,7 @@ class Model:
   nsite: int
   nmocap: int
   nM: int
+  ntree: int
   opt: Option
   stat: Statistic
   qpos0: wp.array(dtype=wp.float32, ndim=1)
@@ -221,6 +301,19 @@ class Model:
   qM_madr_ij: wp.array(dtype=wp.int32, ndim=1)  # warp only
   qLD_update_tree: wp.array(dtype=wp.vec3i, ndim=1)  # warp only
   qLD_update_treeadr: wp.array(dtype=wp.int32, ndim=1)  # warp only
+  hfactor_coladr: wp.array(dtype=wp.int32, ndim=1)  # warp only
+  hfactor_colnnz: wp.array(dtype=wp.int32, ndim=1)  # warp only
+  hfactor_rowind: wp.array(dtype=wp.int32, ndim=1)  # warp only
+  hfactor_parent: wp.array(dtype=wp.int32, ndim=1)  # warp only
+  hfactor_adr: wp.array(dtype=wp.int32, ndim=2)  # warp only
+  hfactor_level: wp.array(dtype=wp.int32, ndim=1)  # warp only
+  hfactor_leveladr: wp.array(dtype=wp.int32, ndim=1)  # warp only
+  hfactor_update: wp.array(dtype=wp.vec3i, ndim=1)  # warp only
+  hfactor_target: wp.array(dtype=wp.vec2i, ndim=1)  # warp only
+  hfactor_targetadr: wp.array(dtype=wp.int32, ndim=1)  # warp only
+  hfactor_row: wp.array(dtype=wp.vec2i, ndim=1)  # warp only
+  hfactor_rowadr: wp.array(dtype=wp.int32, ndim=1)  # warp only
+  hfactor_rownnz: wp.array(dtype=wp.int32, ndim=1)  # warp only
   qLD_tile: wp.array(dtype=wp.int32, ndim=1)  # warp only
   qLD_tileadr: wp.array(dtype=wp.int32, ndim=1)  # warp only
   qLD_tilesize: wp.array(dtype=wp.int32, ndim=1)  # warp only
@@ -231,6 +324,10 @@ class Model:
   body_parentid: wp.array(dtype=wp.int32, ndim=1)
   body_mocapid: wp.array(dtype=wp.int32, ndim=1)
   body_weldid: wp.array(dtype=wp.int32, ndim=1)
+  body_treeid: wp.array(dtype=wp.int32, ndim=1)
+  body_chainadr: wp.array(dtype=wp.int32, ndim=1)  # warp only
+  body_chainnum: wp.array(dtype=wp.int32, ndim=1)  # warp only
+  body_chain: wp.array(dtype=wp.int32, ndim=1)  # warp only
   body_pos: wp.array(dtype=wp.vec3, ndim=1)
   body_quat: wp.array(dtype=wp.quat, ndim=1)
   body_ipos: wp.array(dtype=wp.vec3, ndim=1)
@@ -262,6 +359,7 @@ class Model:
   site_bodyid: wp.array(dtype=wp.int32, ndim=1)
   dof_bodyid: wp.array(dtype=wp.int32, ndim=1)
   dof_jntid: wp.array(dtype=wp.int32, ndim=1)
+  dof_treeid: wp.array(dtype=wp.int32, ndim=1)
   dof_parentid: wp.array(dtype=wp.int32, ndim=1)
   dof_Madr: wp.array(dtype=wp.int32, ndim=1)
   dof_armature: wp.array(dtype=wp.float32, ndim=1)
@@ -304,6 +402,71 @@ class Contact:
   worldid: wp.array(dtype=wp.int32, ndim=1)
 
 
+@wp.struct
+class LSPoint:
+  alpha: wp.array(dtype=wp.float32, ndim=1)
+  cost: wp.array(dtype=wp.float32, ndim=1)
+  deriv_0: wp.array(dtype=wp.float32, ndim=1)
+  deriv_1: wp.array(dtype=wp.float32, ndim=1)
+
+
+@wp.struct
+class LSContext:
+  p0: LSPoint
+  lo: LSPoint
+  lo_next: LSPoint
+  hi: LSPoint
+  hi_next: LSPoint
+  mid: LSPoint
+  swap: wp.array(dtype=wp.int32, ndim=1)
+  ls_iter: wp.array(dtype=wp.int32, ndim=1)
+  done: wp.array(dtype=wp.int32, ndim=1)
+  nsolving: wp.array(dtype=wp.int32, ndim=1)
+  breakpoint: wp.array(dtype=wp.float32, ndim=1)
+  breakpoint_efcid: wp.array(dtype=wp.int32, ndim=1)
+  efc_end: wp.array(dtype=wp.int32, ndim=1)
+
+
+@wp.struct
+class SolverWorkspace:
+  Jaref: wp.array(dtype=wp.float32, ndim=1)
+  Ma: wp.array(dtype=wp.float32, ndim=2)
+  grad: wp.array(dtype=wp.float32, ndim=2)
+  grad_dot: wp.array(dtype=wp.float32, ndim=1)
+  Mgrad: wp.array(dtype=wp.float32, ndim=2)
+  search: wp.array(dtype=wp.float32, ndim=2)
+  search_dot: wp.array(dtype=wp.float32, ndim=1)
+  gauss: wp.array(dtype=wp.float32, ndim=1)
+  cost: wp.array(dtype=wp.float32, ndim=1)
+  prev_cost: wp.array(dtype=wp.float32, ndim=1)
+  active: wp.array(dtype=wp.int32, ndim=1)
+  prev_active: wp.array(dtype=wp.int32, ndim=1)
+  gtol: wp.array(dtype=wp.float32, ndim=1)
+  mv: wp.array(dtype=wp.float32, ndim=2)
+  jv: wp.array(dtype=wp.float32, ndim=1)
+  quad: wp.array(dtype=wp.vec3f, ndim=1)
+  quad_gauss: wp.array(dtype=wp.vec3f, ndim=1)
+  h: wp.array(dtype=wp.float32, ndim=3)
+  hfactor: wp.array(dtype=wp.float32, ndim=3)
+  hfactor_sparse: wp.array(dtype=wp.float32, ndim=2)
+  hupdate: wp.array(dtype=wp.float32, ndim=2)
+  precond: wp.array(dtype=wp.float32, ndim=2)
+  MinvJT: wp.array(dtype=wp.float32, ndim=2)
+  dual_A: wp.array(dtype=wp.float32, ndim=3)
+  dual_S: wp.array(dtype=wp.float32, ndim=3)
+  dual_b: wp.array(dtype=wp.float32, ndim=2)
+  dual: wp.array(dtype=wp.int32, ndim=1)
+  AR_diag: wp.array(dtype=wp.vec3, ndim=1)
+  refactor: wp.array(dtype=wp.int32, ndim=1)
+  alpha: wp.array(dtype=wp.float32, ndim=1)
+  prev_grad: wp.array(dtype=wp.float32, ndim=2)
+  prev_Mgrad: wp.array(dtype=wp.float32, ndim=2)
+  beta: wp.array(dtype=wp.float32, ndim=1)
+  done: wp.array(dtype=wp.int32, ndim=1)
+  nsolving: wp.array(dtype=wp.int32, ndim=1)
+  ls: LSContext
+
+
 @wp.struct
 class Data:
   nworld: int
@@ -319,6 +482,7 @@ class Data:
   ncon: int
   nl: int
   nefc: wp.array(dtype=wp.int32, ndim=1)
+  efc_adr: wp.array(dtype=wp.int32, ndim=1)  # warp only
   ctrl: wp.array(dtype=wp.float32, ndim=2)
   mocap_pos: wp.array(dtype=wp.vec3, ndim=2)
   mocap_quat: wp.array(dtype=wp.quat, ndim=2)
@@ -359,16 +523,40 @@ class Data:
   qfrc_smooth: wp.array(dtype=wp.float32, ndim=2)
   qacc_smooth: wp.array(dtype=wp.float32, ndim=2)
   qfrc_constraint: wp.array(dtype=wp.float32, ndim=2)
+  efc_type: wp.array(dtype=wp.int32, ndim=1)
+  efc_id: wp.array(dtype=wp.int32, ndim=1)
   efc_J: wp.array(dtype=wp.float32, ndim=2)
+  efc_J_rownnz: wp.array(dtype=wp.int32, ndim=1)
+  efc_J_colind: wp.array(dtype=wp.int32, ndim=2)
   efc_D: wp.array(dtype=wp.float32, ndim=1)
   efc_pos: wp.array(dtype=wp.float32, ndim=1)
   efc_aref: wp.array(dtype=wp.float32, ndim=1)
   efc_force: wp.array(dtype=wp.float32, ndim=1)
   efc_margin: wp.array(dtype=wp.float32, ndim=1)
   efc_worldid: wp.array(dtype=wp.int32, ndim=1)  # warp only
+  nisland: wp.array(dtype=wp.int32, ndim=1)
+  tree_island: wp.array(dtype=wp.int32, ndim=2)  # warp only
+  dof_island: wp.array(dtype=wp.int32, ndim=2)
+  dof_islandind: wp.array(dtype=wp.int32, ndim=2)
+  island_dofadr: wp.array(dtype=wp.int32, ndim=2)
+  island_dofnum: wp.array(dtype=wp.int32, ndim=2)
+  island_dofind: wp.array(dtype=wp.int32, ndim=2)
+  efc_island: wp.array(dtype=wp.int32, ndim=1)
   xfrc_applied: wp.array(dtype=wp.spatial_vector, ndim=2)
   contact: Contact
 
+  # dropped items per WarningType summed over calls, and the rows of each world
+  # dropped by the last make_constraint
+  warning: wp.array(dtype=wp.int32, ndim=1)  # warp only
+  efc_overflow: wp.array(dtype=wp.int32, ndim=1)  # warp only
+
+  # solver statistics, the final iteration's values of mjData.solver
+  solver_niter: wp.array(dtype=wp.int32, ndim=1)
+  solver_improvement: wp.array(dtype=wp.float32, ndim=1)  # warp only
+  solver_gradient: wp.array(dtype=wp.float32, ndim=1)  # warp only
+  solver_nls: wp.array(dtype=wp.int32, ndim=1)  # warp only
+  solver_nactive: wp.array(dtype=wp.int32, ndim=1)  # warp only
+
   # temp arrays
   qfrc_integration: wp.array(dtype=wp.float32, ndim=2)
   qacc_integration: wp.array(dtype=wp.float32, ndim=2)
@@ -378,6 +566,14 @@ class Data:
   qLD_integration: wp.array(dtype=wp.float32, ndim=3)
   qLDiagInv_integration: wp.array(dtype=wp.float32, ndim=2)
 
+  # contacts sorted by penetration for the overflow policy
+  con_sort_key: wp.array(dtype=wp.float32, ndim=1)  # warp only
+  con_sort_id: wp.array(dtype=wp.int32, ndim=1)  # warp only
+  con_sort_rows: wp.array(dtype=wp.int32, ndim=1)  # warp only
+
+  # solver arrays
+  solver_workspace: SolverWorkspace  # warp only
+
   # broadphase arrays
   max_num_overlaps_per_world: int
   broadphase_pairs: wp.array(dtype=wp.vec2i, ndim=2)
@@ -41,11 +41,25 @@ _BASE_PATH = flags.DEFINE_string(
 _NSTEP = flags.DEFINE_integer("nstep", 1000, "number of steps per rollout")
 _BATCH_SIZE = flags.DEFINE_integer("batch_size", 4096, "number of parallel rollouts")
 _UNROLL = flags.DEFINE_integer("unroll", 1, "loop unroll length")
-_SOLVER = flags.DEFINE_enum("solver", "cg", ["cg", "newton"], "constraint solver")
+_SOLVER = flags.DEFINE_enum(
+  "solver", "cg", ["cg", "newton", "pgs"], "constraint solver"
+)
 _ITERATIONS = flags.DEFINE_integer("iterations", 1, "number of solver iterations")
 _LS_ITERATIONS = flags.DEFINE_integer(
   "ls_iterations", 4, "number of linesearch iterations"
 )
+_PRECONDITIONER = flags.DEFINE_enum(
+  "preconditioner",
+  "mass",
+  ["mass", "jacobi", "jacobi_constraint"],
+  "CG preconditioner",
+)
+_FUSED_CG = flags.DEFINE_bool(
+  "fused_cg", False, "solve small dense CG models in one launch per world"
+)
+_TOLERANCE = flags.DEFINE_float(
+  "tolerance", -1.0, "solver tolerance, negative for the model's"
+)
 _IS_SPARSE = flags.DEFINE_bool(
   "is_sparse", True, "if model should create sparse mass matrices"
 )
@@ -106,6 +120,9 @@ def _main(argv: Sequence[str]):
     _LS_ITERATIONS.value,
     _NCONMAX.value,
     _NJMAX.value,
+    _PRECONDITIONER.value,
+    _TOLERANCE.value,
+    _FUSED_CG.value,
   )
 
   name = argv[0]